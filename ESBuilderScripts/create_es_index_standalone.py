@@ -3,6 +3,10 @@ from elasticsearch import Elasticsearch
 
 # 直接定义索引名（不用导入项目的constants.py）
 DEFAULT_MEMORY_INDEX = "zh_en_translation_memory"
+# 术语索引：只存放短的术语条目，与句子级翻译记忆分开（见 try/rag/es_retriever.py 的 search_term_index）
+DEFAULT_TERM_INDEX = "zh_en_term_index"
+# 从翻译记忆复制到术语索引的条目最大长度（英文字符数）
+MAX_TERM_LENGTH = 64
 
 # 1. 连接本地Elasticsearch（9200端口）
 try:
@@ -61,13 +65,127 @@ index_mapping = {
     }
 }
 
-# 3. 创建索引（不存在则创建）
+# 3. 定义术语索引映射
+# 术语查询按三级进行：精确匹配（norm子字段）→ 前缀匹配（prefix子字段）→ 模糊匹配（主字段）
+# 绝大多数术语查询在第一级就能用廉价的 term 查询命中，不需要查询时的 fuzziness
+term_index_mapping = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "analysis": {
+            "normalizer": {
+                # 精确匹配用：忽略大小写和变音符号
+                "term_normalizer": {
+                    "type": "custom",
+                    "filter": ["lowercase", "asciifolding"]
+                }
+            },
+            "tokenizer": {
+                # 对整个术语取前缀（不按词切分），"convolutional ne" 可命中 "convolutional neural network"
+                "term_edge_ngram": {
+                    "type": "edge_ngram",
+                    "min_gram": 1,
+                    "max_gram": MAX_TERM_LENGTH,
+                    "token_chars": []
+                }
+            },
+            "analyzer": {
+                "term_prefix_analyzer": {
+                    "type": "custom",
+                    "tokenizer": "term_edge_ngram",
+                    "filter": ["lowercase", "asciifolding"]
+                },
+                # 查询端不再切 ngram，整串作为一个前缀去匹配
+                "term_prefix_search_analyzer": {
+                    "type": "custom",
+                    "tokenizer": "keyword",
+                    "filter": ["lowercase", "asciifolding"]
+                },
+                "en_analyzer": {
+                    "type": "custom",
+                    "tokenizer": "standard",
+                    "filter": ["lowercase"]
+                }
+            }
+        }
+    },
+    "mappings": {
+        "properties": {
+            "en": {
+                "type": "text",
+                "analyzer": "en_analyzer",
+                "fields": {
+                    "keyword": {"type": "keyword"},
+                    "norm": {"type": "keyword", "normalizer": "term_normalizer"},
+                    "prefix": {
+                        "type": "text",
+                        "analyzer": "term_prefix_analyzer",
+                        "search_analyzer": "term_prefix_search_analyzer"
+                    }
+                }
+            },
+            "zh": {
+                "type": "text",
+                "analyzer": "standard",
+                "fields": {
+                    "keyword": {"type": "keyword"},
+                    "norm": {"type": "keyword", "normalizer": "term_normalizer"},
+                    "prefix": {
+                        "type": "text",
+                        "analyzer": "term_prefix_analyzer",
+                        "search_analyzer": "term_prefix_search_analyzer"
+                    }
+                }
+            },
+            "term_type": {"type": "keyword"},
+            "rationale": {"type": "text", "index": False},
+            "human_reviewed": {"type": "boolean"},
+            "human_modified": {"type": "boolean"},
+            "reviewed_at": {"type": "date"},
+            "id_key": {"type": "keyword"}
+        }
+    }
+}
+
+# 4. 创建索引（不存在则创建）
+for index_name, mapping in [(DEFAULT_MEMORY_INDEX, index_mapping), (DEFAULT_TERM_INDEX, term_index_mapping)]:
+    try:
+        if not es.indices.exists(index=index_name):
+            es.indices.create(index=index_name, body=mapping)
+            print(f"✅ 索引 {index_name} 创建成功！")
+        else:
+            print(f"ℹ️ 索引 {index_name} 已存在，跳过创建。")
+    except Exception as e:
+        print(f"创建索引失败：{e}")
+        exit(1)
+
+# 5. 把翻译记忆中已有的短条目（术语表导入的数据）复制到术语索引
+# 按 en.keyword 筛选短条目，旧版本 import_translation_pairs.py 创建的翻译记忆索引没有该子字段
+def has_keyword_subfield(index_name, field):
+    mapping = es.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    return "keyword" in mapping.get("properties", {}).get(field, {}).get("fields", {})
+
 try:
-    if not es.indices.exists(index=DEFAULT_MEMORY_INDEX):
-        es.indices.create(index=DEFAULT_MEMORY_INDEX, body=index_mapping)
-        print(f"✅ 索引 {DEFAULT_MEMORY_INDEX} 创建成功！")
-    else:
-        print(f"ℹ️ 索引 {DEFAULT_MEMORY_INDEX} 已存在，跳过创建。")
+    if not has_keyword_subfield(DEFAULT_MEMORY_INDEX, "en"):
+        print(f"❌ 索引 {DEFAULT_MEMORY_INDEX} 的 en 字段没有 keyword 子字段，无法筛选短条目复制到术语索引。")
+        print("   请删除该索引后用本脚本或 try/rag/import_translation_pairs.py 重新创建并导入数据，再重新运行本脚本。")
+        exit(1)
+    resp = es.reindex(
+        body={
+            "source": {
+                "index": DEFAULT_MEMORY_INDEX,
+                "_source": ["en", "zh", "id_key"],
+                "query": {
+                    "script": {
+                        "script": f"doc['en.keyword'].size() > 0 && doc['en.keyword'].value.length() <= {MAX_TERM_LENGTH}"
+                    }
+                }
+            },
+            "dest": {"index": DEFAULT_TERM_INDEX}
+        },
+        wait_for_completion=True,
+        refresh=True
+    )
+    print(f"✅ 已复制 {resp.get('created', 0) + resp.get('updated', 0)} 条术语到 {DEFAULT_TERM_INDEX}")
 except Exception as e:
-    print(f"创建索引失败：{e}")
-    exit(1)
\ No newline at end of file
+    print(f"⚠️ 复制术语到术语索引失败（可稍后重新运行本脚本）：{e}")
@@ -2,103 +2,155 @@
 import pandas as pd
 import numpy as np
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk
 from tqdm import tqdm
+from collections import deque
 import hashlib
 import json
+import os
 
 # 配置（关键：适配你的CSV列名）
 CSV_FILE_PATH = "./translation_pairs.csv"  # 你的CSV路径
 ES_HOST = "http://localhost:9200"
 INDEX_NAME = "zh_en_translation_memory"
-BATCH_SIZE = 10000
+CHUNK_SIZE = 10000  # 每次读取的CSV行数（内存占用只与它有关，与CSV大小无关）
+BULK_CHUNK_SIZE = 500  # 每个bulk请求的文档数
+THREAD_COUNT = 4  # 并行bulk线程数
+# 断点文件：每个分块全部被ES确认后记录进度，中断后重新运行会从下一个分块继续
+CHECKPOINT_PATH = CSV_FILE_PATH + ".checkpoint.json"
 # 映射：你的CSV列名 → 脚本需要的列名
 SOURCE_COL = "source_text"  # 源文本（英文）
 TARGET_COL = "target_text"  # 目标文本（中文）
-ID_KEY = SOURCE_COL  # 以源文本列为基准生成ID
+ID_KEY = "en"  # 重命名后以英文列为基准生成ID
 
 # 1. 连接ES
-es = Elasticsearch(ES_HOST, 
+es = Elasticsearch(ES_HOST,
         # timeout=30,
         )
 if not es.ping():
     raise Exception("无法连接到Elasticsearch，请检查容器是否运行")
 
-# 2. 文本清洗函数（极简版，和项目逻辑对齐）
-def clean_text(text):
-    if pd.isna(text):
-        return ""
-    import re
-    text = re.sub(r'\s+', ' ', text).strip()  # 多个空格转一个
-    text = re.sub(r'[^\w\s\u4e00-\u9fff]', '', text)  # 保留中英文、数字、空格
-    return text
+# 2. 文本清洗（向量化的 str 操作，和项目逻辑对齐）
+def clean_text(series):
+    series = series.astype(object).where(series.notna(), "").astype(str)
+    series = series.str.replace(r'\s+', ' ', regex=True).str.strip()  # 多个空格转一个
+    return series.str.replace('[^\\w\\s\u4e00-\u9fff]', '', regex=True)  # 保留中英文、数字、空格
 
-def is_noise(text):
-    if pd.isna(text) or len(text) < 3:
-        return True
-    import re
-    if re.match(r'^\d+$', text):  # 纯数字判定为噪音
-        return True
-    return False
+def is_noise(series):
+    # 过短或纯数字判定为噪音
+    return (series.str.len() < 3) | series.str.fullmatch(r'\d+')
 
-# 3. 读取并过滤CSV
-try:
-    # 读取CSV（编码不对的话改成encoding="gbk"）
-    df = pd.read_csv(CSV_FILE_PATH, encoding="utf-8")
-    print(f"✅ 成功读取CSV，共 {len(df)} 行数据")
-except Exception as e:
-    print(f"读取CSV失败：{e}")
-    exit(1)
+def clean_chunk(df):
+    # 重命名列（适配后续逻辑，把source_text→en，target_text→zh）
+    df = df.rename(columns={SOURCE_COL: "en", TARGET_COL: "zh"})
+    # 过滤无效数据
+    df = df.dropna(subset=["en", "zh"], how="all")  # 移除中英文都为空的行
+    df = df.drop_duplicates(subset=[ID_KEY])  # 基于英文列去重（跨分块的重复由相同ID的upsert合并）
+    df = df.assign(**{ID_KEY: clean_text(df[ID_KEY])})  # 清洗英文文本
+    df = df[~is_noise(df[ID_KEY])]  # 移除噪音文本
+    return df.assign(id_key=ID_KEY)  # 记录ID基准列
 
-# 验证核心列是否存在
-required_cols = {SOURCE_COL, TARGET_COL}
-if not required_cols.intersection(df.columns):
-    raise ValueError(
-        f"CSV必须包含 '{SOURCE_COL}' 和 '{TARGET_COL}' 列，当前列：{df.columns}\n"
-        "如果列名对应错误，请修改脚本里的 SOURCE_COL/TARGET_COL 配置！"
-    )
+# 3. 生成bulk指令
+def upsert_actions(df):
+    """生成ES的upsert指令（存在则更新，不存在则插入），文档体直接序列化为NDJSON"""
+    if len(df) == 0:
+        return
+    # 基于英文列生成唯一ID
+    ids = np.array([hashlib.sha1(v).hexdigest() for v in df[ID_KEY].str.encode('utf8')], dtype=object)
+    # 按空值模式分组，用 to_json 一次性序列化，并移除空值字段
+    null_mask = df.isna().to_numpy()
+    _, pattern_idx = np.unique(null_mask, axis=0, return_inverse=True)
+    for pattern in np.unique(pattern_idx):
+        rows = np.flatnonzero(pattern_idx == pattern)
+        cols = df.columns[~null_mask[rows[0]]]
+        ndjson = df.iloc[rows][cols].to_json(orient="records", lines=True, force_ascii=False)
+        for doc_id, body in zip(ids[rows], ndjson.rstrip("\n").split("\n")):
+            yield (
+                {"update": {"_index": INDEX_NAME, "_id": doc_id, "retry_on_conflict": 3}},
+                '{"doc":%s,"doc_as_upsert":true}' % body
+            )
 
-# 重命名列（适配后续逻辑，把source_text→en，target_text→zh）
-df.rename(columns={SOURCE_COL: "en", TARGET_COL: "zh"}, inplace=True)
-ID_KEY = "en"  # 重命名后ID基准列改为en
+# 4. 断点续传（记录已导入的数据行数，修改 CHUNK_SIZE 后仍可续传）
+# 注意：skiprows 按物理行计数，含带引号的多行字段的CSV不能续传，请删除断点文件后从头导入
+stat = os.stat(CSV_FILE_PATH)
+checkpoint = {}
+if os.path.isfile(CHECKPOINT_PATH):
+    with open(CHECKPOINT_PATH, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("file_size") != stat.st_size or checkpoint.get("file_mtime") != stat.st_mtime:
+        print("⚠️ CSV文件已变化，忽略旧的断点文件，从头导入")
+        checkpoint = {}
+    elif checkpoint.get("index", INDEX_NAME) != INDEX_NAME:
+        print(f"⚠️ 断点文件属于索引 {checkpoint.get('index')}，忽略旧的断点文件，从头导入")
+        checkpoint = {}
+    elif "rows_committed" not in checkpoint:
+        # 旧版本断点只记录了分块序号，不知道写入时的 CHUNK_SIZE
+        print("⚠️ 断点文件缺少已导入行数，忽略旧的断点文件，从头导入")
+        checkpoint = {}
 
-# 过滤无效数据
-df = df.dropna(subset=["en", "zh"], how="all")  # 移除中英文都为空的行
-df = df.drop_duplicates(subset=[ID_KEY])  # 基于英文列去重
-df[ID_KEY] = df[ID_KEY].apply(clean_text)  # 清洗英文文本
-df = df[~df[ID_KEY].map(is_noise)]  # 移除噪音文本
-df["id_key"] = ID_KEY  # 记录ID基准列
+start_chunk = checkpoint.get("chunks_committed", 0)
+start_row = checkpoint.get("rows_committed", 0)
+stats = {"chunks": start_chunk, "rows": start_row,
+         "success": checkpoint.get("success", 0), "failed": checkpoint.get("failed", 0)}
+read_csv_config = {"encoding": "utf-8"}  # 编码不对的话改成encoding="gbk"
+if start_row > 0:
+    print(f"ℹ️ 从断点继续：跳过前 {start_row} 行已导入的数据")
+    read_csv_config["skiprows"] = range(1, start_row + 1)  # 保留表头
 
-# 过滤后数据检查
-if len(df) == 0:
-    print("⚠️ 过滤后无有效数据，请检查CSV内容！")
-    exit(0)
-print(f"✅ 过滤后剩余 {len(df)} 条有效数据")
+boundaries = deque()  # (分块序号, 该分块结束时累计的CSV行数, 该分块结束时累计的文档数)
 
-# 4. 批量导入ES
-def upsert_doc(record):
-    """生成ES的upsert指令（存在则更新，不存在则插入）"""
-    # 基于英文列生成唯一ID
-    doc_id = hashlib.sha1(record[ID_KEY].encode('utf8')).hexdigest()
-    # 移除空值字段
-    record = {k: v for k, v in record.items() if not pd.isna(v)}
-    # 生成指令
-    yield json.dumps({"update": {"_index": INDEX_NAME, "_id": doc_id, "retry_on_conflict": 3}})
-    yield json.dumps({"doc": record, "doc_as_upsert": True})
+def generate_actions():
+    doc_count = 0
+    row_count = start_row
+    for chunk_no, chunk in enumerate(pd.read_csv(CSV_FILE_PATH, chunksize=CHUNK_SIZE, **read_csv_config),
+                                     start=start_chunk):
+        # 验证核心列是否存在
+        if not {SOURCE_COL, TARGET_COL}.issubset(chunk.columns):
+            raise ValueError(
+                f"CSV必须包含 '{SOURCE_COL}' 和 '{TARGET_COL}' 列，当前列：{chunk.columns}\n"
+                "如果列名对应错误，请修改脚本里的 SOURCE_COL/TARGET_COL 配置！"
+            )
+        row_count += len(chunk)
+        chunk = clean_chunk(chunk)
+        doc_count += len(chunk)
+        boundaries.append((chunk_no, row_count, doc_count))
+        yield from upsert_actions(chunk)
 
-# 分批导入（避免一次性导入过多数据）
-batch_idx = np.array_split(range(len(df)), max(int(len(df)/BATCH_SIZE), 1))
-for idx in tqdm(batch_idx, desc="导入CSV数据到ES"):
-    batch_df = df.iloc[idx]
-    bulk_data = []
-    for _, row in batch_df.iterrows():
-        bulk_data.extend(list(upsert_doc(row.to_dict())))
-    # 执行批量导入
-    try:
-        response = es.bulk(body=bulk_data, index=INDEX_NAME)
-        if response.get("errors"):
-            print(f"⚠️ 该批次存在导入错误：{response['errors']}")
-    except Exception as e:
-        print(f"❌ 该批次导入失败：{e}")
-        continue
+def commit(acknowledged):
+    while boundaries and boundaries[0][2] <= acknowledged:
+        chunk_no, row_count, _ = boundaries.popleft()
+        stats["chunks"] = chunk_no + 1
+        stats["rows"] = row_count
+        tmp_path = CHECKPOINT_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"file_size": stat.st_size, "file_mtime": stat.st_mtime, "index": INDEX_NAME,
+                       "chunks_committed": stats["chunks"], "rows_committed": stats["rows"],
+                       "success": stats["success"], "failed": stats["failed"]}, f)
+        os.replace(tmp_path, CHECKPOINT_PATH)
 
-print(f"\n🎉 数据导入完成！共导入 {len(df)} 条中英文翻译数据到ES索引 {INDEX_NAME}")
\ No newline at end of file
+# 5. 流式并行导入ES
+acknowledged = 0
+with tqdm(desc="导入CSV数据到ES", unit="doc") as pbar:
+    for ok, info in parallel_bulk(es, generate_actions(),
+                                  thread_count=THREAD_COUNT,
+                                  chunk_size=BULK_CHUNK_SIZE,
+                                  expand_action_callback=lambda action: action,
+                                  raise_on_error=False):
+        acknowledged += 1
+        if ok:
+            stats["success"] += 1
+        else:
+            stats["failed"] += 1
+            print(f"⚠️ 文档导入错误：{info}")
+        commit(acknowledged)
+        pbar.update(1)
+commit(acknowledged)  # 过滤后为空的尾部分块
+
+if os.path.isfile(CHECKPOINT_PATH):
+    os.remove(CHECKPOINT_PATH)
+
+if stats["success"] == 0:
+    print("⚠️ 过滤后无有效数据，请检查CSV内容！")
+else:
+    print(f"\n🎉 数据导入完成！共导入 {stats['success']} 条中英文翻译数据到ES索引 {INDEX_NAME}"
+          f"（失败 {stats['failed']} 条）")
@@ -60,6 +60,12 @@ TRANSLATION_CONFIG = {
     "temperature": 0.7,  # 温度参数（控制随机性）
 }
 
+# 4. HTTP 服务配置（serve 模式）
+SERVER_CONFIG = {
+    "max_batch_size": 32,  # 每个微批次的最大文本数
+    "max_wait_ms": 5,  # 微批次收到第一条文本后最多等待的毫秒数
+}
+
 # ==================== 初始化函数 ====================
 
 def init_translator():
@@ -160,8 +166,9 @@ def translate_text(translator, text, source_lang='zh', target_lang='en'):
     print(f"   方向: {source_code} → {target_code}")
     
     try:
-        results = translator.batch_translate(
-            [text],
+        # 单条文本走低延迟路径：记忆与术语并发检索，一次生成
+        translation = translator.translate(
+            text,
             source_lang_code=source_code,
             target_lang_code=target_code,
             memory_search_args={'top_k': TRANSLATION_CONFIG["memory_search_top_k"]},
@@ -171,7 +178,6 @@ def translate_text(translator, text, source_lang='zh', target_lang='en'):
             }]
         )
         
-        translation = results[0] if results else ""
         print(f"✅ 翻译完成\n")
         return translation
     
@@ -331,6 +337,39 @@ def interactive_mode():
             print(f"❌ 错误: {e}\n")
 
 
+# ==================== HTTP 服务 ====================
+
+def serve_mode(port=8000):
+    """
+    本地 HTTP 翻译服务
+    并发请求会在几毫秒内合并为微批次，共享一次记忆/术语检索和一轮模型调用
+    
+    请求示例:
+        curl -X POST http://127.0.0.1:8000/translate -d '{"text": "你好世界", "source_lang": "zh", "target_lang": "en"}'
+    监控指标（队列深度、批大小、延迟直方图）:
+        curl http://127.0.0.1:8000/metrics
+    """
+    from t_ragx.server import serve
+    
+    translator = init_translator()
+    print(f"🌐 翻译服务已启动: http://127.0.0.1:{port}/translate")
+    serve(
+        translator,
+        port=port,
+        source_lang_code='zh',
+        target_lang_code='en',
+        max_batch_size=SERVER_CONFIG["max_batch_size"],
+        max_wait_ms=SERVER_CONFIG["max_wait_ms"],
+        translate_args={
+            'memory_search_args': {'top_k': TRANSLATION_CONFIG["memory_search_top_k"], 'msearch': True},
+            'generation_args': [{
+                'max_tokens': TRANSLATION_CONFIG["max_tokens"],
+                'temperature': TRANSLATION_CONFIG["temperature"]
+            }]
+        }
+    )
+
+
 if __name__ == "__main__":
     import sys
     
@@ -338,6 +377,9 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "interactive":
         # 交互式模式
         interactive_mode()
+    elif len(sys.argv) > 1 and sys.argv[1] == "serve":
+        # HTTP 服务模式: python api_translation_rag.py serve [端口]
+        serve_mode(int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
     else:
         # 演示模式
         main()
@@ -0,0 +1,116 @@
+"""
+HTTP engine throughput benchmark
+
+Starts a local mock server speaking the Ollama generate API and the OpenAI chat completions API, with a fixed
+latency per request and an optional share of 429 responses, then compares the legacy one-request-at-a-time loop
+with the pooled, concurrent HTTP engine used by APIModel and OpenAIModel.
+
+Usage:
+    python benchmarks/bench_http_engine.py --requests 64 --latency 0.05 --concurrency 8 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from t_ragx.models._http import HTTPEngine
+from t_ragx.models.API_Model import APIModel
+from t_ragx.models.OpenAIModel import OpenAIModel
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, avoid the delayed ACK stall on keep-alive connections
+    disable_nagle_algorithm = True
+    latency = 0.05
+    error_rate = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if random.random() < self.error_rate:
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": "0"})
+            return
+
+        time.sleep(self.latency)
+        if self.path.endswith("/chat/completions"):
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": 0, "model": payload["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": payload["messages"][-1]["content"]}}],
+            })
+        else:
+            self._send_json(200, {"model": payload["model"], "response": payload["prompt"], "done": True})
+
+
+def legacy_generate(url, model, prompts):
+    out_text = []
+    for t in prompts:
+        r = requests.post(url, json={"model": model, "prompt": t, "stream": False})
+        assert r.status_code == 200, f"Failed to generate {t}"
+        out_text.append(r.json()['response'])
+    return out_text
+
+
+def run(name, fn, n_requests, expected):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    ok = "ok" if list(out) == expected else "MISMATCH"
+    print(f"{name:<28} {elapsed:7.2f} s  {n_requests / elapsed:8.1f} req/s  [{ok}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the mock server spends per request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    MockHandler.latency = args.latency
+    MockHandler.error_rate = args.error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    prompts = [f"prompt {i}" for i in range(args.requests)]
+    chats = [[{"role": "user", "content": p}] for p in prompts]
+    engine = HTTPEngine(max_concurrency=args.concurrency, backoff_base=0.05, backoff_max=1.0)
+    api_model = APIModel(host="127.0.0.1", port=port, model="mock", engine=engine)
+    openai_model = OpenAIModel(host="127.0.0.1", port=port, model="mock", api_key="mock", engine=engine)
+
+    print(f"{args.requests} requests, {args.latency * 1000:.0f} ms latency, concurrency {args.concurrency}, "
+          f"{args.error_rate:.0%} answered with 429")
+    if not args.skip_legacy and args.error_rate == 0:
+        run("legacy sequential", lambda: legacy_generate(api_model.url, "mock", prompts), args.requests, prompts)
+    run("APIModel.generate", lambda: api_model.generate(prompts), args.requests, prompts)
+    run("APIModel.agenerate", lambda: asyncio.run(api_model.agenerate(prompts)), args.requests, prompts)
+    run("OpenAIModel.generate", lambda: openai_model.generate(chats), args.requests, prompts)
+    run("OpenAIModel.agenerate", lambda: asyncio.run(openai_model.agenerate(chats)), args.requests, prompts)
+
+    engine.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
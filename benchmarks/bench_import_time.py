@@ -0,0 +1,79 @@
+"""
+t_ragx import time benchmark
+
+Imports t_ragx in fresh interpreters with -X importtime, touching the main classes the way a CLI or a server would
+before the first request, and reports the cumulative t_ragx import time and the slowest modules it pulled in.
+
+Usage:
+    python benchmarks/bench_import_time.py --runs 5 --target-ms 300
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENT = ("import t_ragx; t_ragx.TRagx; t_ragx.models.OpenAIModel; t_ragx.models.API_Model; "
+             "t_ragx.processors.ElasticInputProcessor")
+
+
+def parse_importtime(stderr):
+    """
+    Returns {module: (self_us, cumulative_us)} of the top level imports from the -X importtime output
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(env):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", STATEMENT], env=env, capture_output=True,
+                          text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.splitlines()[-1] if proc.stderr else "import failed")
+    return wall_ms, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=300)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [src, env.get("PYTHONPATH")] if p)
+
+    wall, cumulative, last = [], [], None
+    for _ in range(args.runs):
+        wall_ms, modules = run_once(env)
+        wall.append(wall_ms)
+        cumulative.append(modules["t_ragx"][1] / 1000)
+        last = modules
+
+    t_ragx_ms = statistics.median(cumulative)
+    print(f"interpreter + import (wall)  median {statistics.median(wall):7.1f} ms")
+    print(f"t_ragx cumulative import     median {t_ragx_ms:7.1f} ms  "
+          f"[{'ok' if t_ragx_ms <= args.target_ms else 'over'} target {args.target_ms:.0f} ms]")
+
+    print("\nslowest modules (self time, last run):")
+    for name, (self_us, _) in sorted(last.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f"  {self_us / 1000:7.1f} ms  {name}")
+
+    heavy = [m for m in ("torch", "transformers", "datasets", "comet", "pandas", "numpy", "elasticsearch",
+                         "llama_cpp", "openai", "fasttext") if m in last]
+    print(f"\nheavy dependencies imported: {', '.join(heavy) if heavy else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+llama.cpp prefix cache benchmark
+
+Translates the same prompts built by BaseModel.build_prompt, one prompt at a time and in several batches of
+--batch-size prompts, with a cleared context per prompt (reset_model=True), with the context kept between prompts
+(reset_model=False), and with the prompt prefix cache, and reports the prompt tokens processed per second on CPU.
+
+Usage:
+    python benchmarks/bench_llama_prefix_cache.py --model-path model.gguf --sentences 32 --batch-size 8
+    python benchmarks/bench_llama_prefix_cache.py --repo-id rayliuca/TRagx-GGUF-NeuralOmniBeagle-7B
+"""
+import argparse
+import time
+
+from llama_cpp import Llama
+
+from t_ragx.models.LlamaCppPythonModel import LlamaCppPythonModel
+
+SENTENCES = [
+    "吾輩は猫である。名前はまだ無い。",
+    "どこで生れたかとんと見当がつかぬ。",
+    "何でも薄暗いじめじめした所でニャーニャー泣いていた事だけは記憶している。",
+    "吾輩はここで始めて人間というものを見た。",
+]
+
+
+def build_prompts(model, n_sentences, with_memory):
+    texts = [SENTENCES[i % len(SENTENCES)] + f" ({i})" for i in range(n_sentences)]
+    search_result = [{
+        'glossary': {'吾輩': ['I']},
+        'memory': [{'ja': SENTENCES[(i + 1) % len(SENTENCES)], 'en': 'I am a cat.'}] if with_memory else [],
+    } for i in range(n_sentences)]
+    return model.batch_build_prompt(texts, source_lang_code='ja', target_lang_code='en',
+                                    search_result=search_result)
+
+
+def run(name, model, prompts, generation_config, batch_size=1):
+    n_prompt_tokens = sum(len(model.model.tokenize(p.encode('utf-8'))) for p in prompts)
+    model.model.reset()
+    start = time.perf_counter()
+    for i in range(0, len(prompts), batch_size):
+        model.generate(prompts[i:i + batch_size], generation_config=dict(generation_config))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {elapsed:7.2f} s  {len(prompts) / elapsed:6.2f} sentences/s  "
+          f"{n_prompt_tokens / elapsed:8.1f} prompt tokens/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--repo-id', default="rayliuca/TRagx-GGUF-NeuralOmniBeagle-7B")
+    parser.add_argument('--filename', default="*Q4_K_M*")
+    parser.add_argument('--sentences', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=8, help='prompts per generate call in the multi-batch case')
+    parser.add_argument('--max-tokens', type=int, default=8, help='kept small so the prompt evaluation dominates')
+    parser.add_argument('--n-threads', type=int, default=None)
+    parser.add_argument('--with-memory', action='store_true', help='add a translation memory to every prompt')
+    args = parser.parse_args()
+
+    model_config = {'n_ctx': 2048, 'n_gpu_layers': 0, 'n_threads': args.n_threads, 'verbose': False,
+                    'chat_format': "mistral-instruct"}
+    if args.model_path is not None:
+        llama = Llama(model_path=args.model_path, **model_config)
+    else:
+        llama = Llama.from_pretrained(repo_id=args.repo_id, filename=args.filename, **model_config)
+
+    generation_config = {'max_tokens': args.max_tokens, 'temperature': 0}
+
+    baseline = LlamaCppPythonModel(model=llama, reset_model=True)
+    prompts = build_prompts(baseline, args.sentences, args.with_memory)
+    models = [
+        ("reset per prompt", baseline),
+        ("keep context", LlamaCppPythonModel(model=llama, reset_model=False)),
+        ("prefix cache (ram)", LlamaCppPythonModel(model=llama, prefix_cache="ram")),
+    ]
+
+    print("one prompt per call")
+    for name, model in models:
+        run(name, model, prompts, generation_config)
+
+    print(f"{args.batch_size} prompts per call")
+    for name, model in models:
+        if model.prefix_cache is not None:
+            # start cold, like the single prompt case
+            model = LlamaCppPythonModel(model=llama, prefix_cache="ram")
+        run(name, model, prompts, generation_config, batch_size=args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Translation memory gather benchmark
+
+Gathers the rows of random search results from a huggingface dataset with the legacy per-query materialization and
+with the columnar gather used by BaseInputProcessor.search_general_memory, and reports the queries per second.
+
+Usage:
+    python benchmarks/bench_memory_gather.py --rows 200000 --queries 20000 --k 4
+"""
+import argparse
+import random
+import time
+
+import datasets
+
+from t_ragx.processors._utils import gather_memory
+
+
+def legacy_gather(dataset, mem_indices, mem_scores, max_item_len=500):
+    ref_trans_data = [dataset[midx] for midx in mem_indices]
+
+    processed_output = []
+    for rtd, score_list in zip(ref_trans_data, mem_scores):
+        wide_output = []
+        key_list = list(rtd.keys())
+        for i in range(len(rtd[key_list[0]])):
+            wide_output.append({
+                k: rtd[k][i][:max_item_len] for k in key_list
+            })
+            wide_output[-1]['score'] = score_list[i]
+        processed_output.append(wide_output)
+    return processed_output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--max-item-len", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1000, help="queries per search_general_memory call")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    dataset = datasets.Dataset.from_dict({
+        'ja': [f"吾輩は猫である。名前はまだ無い。{i}" * rng.randint(1, 8) for i in range(args.rows)],
+        'en': [f"I am a cat. As yet I have no name. {i}" * rng.randint(1, 8) for i in range(args.rows)],
+        'source': [f"corpus_{i % 7}" for i in range(args.rows)],
+    })
+    mem_indices = [[rng.randrange(args.rows) for _ in range(rng.randint(0, args.k))] for _ in range(args.queries)]
+    mem_scores = [[rng.random() * 20 for _ in idx] for idx in mem_indices]
+
+    results = {}
+    for name, fn in [("legacy per-query", legacy_gather), ("columnar gather", gather_memory)]:
+        start = time.perf_counter()
+        output = []
+        for b in range(0, args.queries, args.batch_size):
+            output += fn(dataset, mem_indices[b:b + args.batch_size], mem_scores[b:b + args.batch_size],
+                         max_item_len=args.max_item_len)
+        elapsed = time.perf_counter() - start
+        results[name] = output
+        print(f"{name:<18} {elapsed:7.2f} s  {args.queries / elapsed:9.0f} queries/s")
+
+    print("outputs match" if results["legacy per-query"] == results["columnar gather"] else "outputs DIFFER")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Rerank latency benchmark
+
+Compares the legacy per-hit Levenshtein rerank with the batched rapidfuzz rerank on synthetic elastic responses,
+no elasticsearch server is needed.
+
+Usage:
+    python benchmarks/bench_rerank.py --batch-size 64 --hits 100 --repeat 20
+"""
+import argparse
+import copy
+import random
+import statistics
+import string
+import time
+from operator import itemgetter
+
+from Levenshtein import distance
+
+from t_ragx.processors.ElasticInputProcessor import rerank_elastic_results
+
+
+def legacy_rerank_elastic_result(elastic_result, source_lang, search_term, top_k=5):
+    if len(elastic_result) < 1:
+        return []
+    top_score = None
+    result_list = []
+    for r in elastic_result['hits']['hits']:
+        if top_score is None:
+            top_score = r['_score']
+        if r['_score'] < top_score and len(result_list) > top_k:
+            break
+
+        if source_lang not in r['_source']:
+            continue
+        r['distance'] = distance(r['_source'][source_lang], search_term)
+        result_list.append(r)
+
+    result_list = sorted(result_list, key=itemgetter('distance'))
+    return result_list[:top_k]
+
+
+def random_text(rng, min_len=20, max_len=200):
+    return ''.join(rng.choices(string.ascii_lowercase + ' ', k=rng.randint(min_len, max_len)))
+
+
+def make_batch(rng, batch_size, n_hits, tie_ratio, source_lang='en'):
+    search_terms = [random_text(rng) for _ in range(batch_size)]
+    responses = []
+    for _ in range(batch_size):
+        # a share of the hits tied with the top score, so the legacy early break cannot stop early
+        n_tied = max(1, int(n_hits * tie_ratio))
+        scores = [10.0] * n_tied + sorted((rng.uniform(0, 10) for _ in range(n_hits - n_tied)), reverse=True)
+        responses.append({'hits': {'hits': [
+            {'_score': s, '_source': {source_lang: random_text(rng)}} for s in scores
+        ]}})
+    return search_terms, responses
+
+
+def time_it(fn, responses, repeat):
+    # the rerank annotates the hits in place, so each run gets a fresh copy made outside the timed region
+    latencies = []
+    for _ in range(repeat):
+        fresh = copy.deepcopy(responses)
+        start = time.perf_counter()
+        fn(fresh)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies, batch_size):
+    print(f"{name:<24} median {statistics.median(latencies):8.2f} ms/batch "
+          f"({statistics.median(latencies) / batch_size:6.3f} ms/query), min {min(latencies):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--hits', type=int, default=100, help='elastic hits per query')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--tie-ratio', type=float, default=0.5, help='share of hits tied with the top score')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    search_terms, responses = make_batch(rng, args.batch_size, args.hits, args.tie_ratio)
+
+    legacy = time_it(lambda resps: [
+        legacy_rerank_elastic_result(resp, 'en', term, top_k=args.top_k)
+        for term, resp in zip(search_terms, resps)
+    ], responses, args.repeat)
+    batched = time_it(lambda resps: rerank_elastic_results(
+        resps, 'en', search_terms, top_k=args.top_k, workers=args.workers
+    ), responses, args.repeat)
+    combined = time_it(lambda resps: rerank_elastic_results(
+        resps, 'en', search_terms, top_k=args.top_k, workers=args.workers,
+        bm25_weight=0.5, distance_weight=1.0
+    ), responses, args.repeat)
+
+    print(f"batch size {args.batch_size}, {args.hits} hits/query, top_k {args.top_k}")
+    report('legacy per-hit', legacy, args.batch_size)
+    report('batched distance', batched, args.batch_size)
+    report('batched bm25+distance', combined, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Translation server load test
+
+Starts the mock model server of bench_http_engine.py and a TranslationServer with the sleeping input processor of
+bench_translate_latency.py, whose searches take a fixed time per call like an Elasticsearch multi search, then sends
+requests from concurrent clients without micro-batching (max batch size 1) and with micro-batching.
+
+Usage:
+    python benchmarks/bench_server.py --clients 16 --requests 20 --max-batch-size 32 --max-wait-ms 5
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from bench_http_engine import MockHandler
+from bench_translate_latency import SleepInputProcessor, percentile
+
+from t_ragx import TRagx
+from t_ragx.models.API_Model import APIModel
+from t_ragx.models._http import HTTPEngine
+from t_ragx.server import TranslationServer
+
+
+def client(port, n_requests, client_idx, latencies):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for i in range(n_requests):
+        body = json.dumps({'text': f"吾輩は猫である。({client_idx}-{i})", 'source_lang': 'ja', 'target_lang': 'en'})
+        start = time.perf_counter()
+        conn.request("POST", "/translate", body=body, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        assert resp.status == 200, resp.read()
+        resp.read()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(name, translator, args, max_batch_size):
+    server = TranslationServer(translator, ("127.0.0.1", 0), max_batch_size=max_batch_size,
+                               max_wait_ms=args.max_wait_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    latencies = []
+    clients = [threading.Thread(target=client, args=(port, args.requests, i, latencies)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.perf_counter() - start
+
+    metrics = server.metrics()
+    print(f"{name:<24} {len(latencies) / elapsed:7.1f} req/s  p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  mean batch {metrics['batch_size']['mean']:5.1f}  "
+          f"max queue depth {metrics['max_queue_depth']}")
+
+    server.shutdown()
+    server.server_close()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--memory-ms", type=float, default=20)
+    parser.add_argument("--glossary-ms", type=float, default=5)
+    parser.add_argument("--generation-ms", type=float, default=30)
+    parser.add_argument("--metrics", action="store_true", help="print the metrics of the micro-batched run")
+    args = parser.parse_args()
+
+    MockHandler.latency = args.generation_ms / 1000
+    mock = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    mock.daemon_threads = True
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+
+    engine = HTTPEngine(max_concurrency=args.max_batch_size)
+    model = APIModel(host="127.0.0.1", port=mock.server_address[1], model="mock", engine=engine)
+    translator = TRagx([model], input_processor=SleepInputProcessor(args.memory_ms / 1000, args.glossary_ms / 1000))
+
+    print(f"{args.clients} clients x {args.requests} requests, searches {args.memory_ms + args.glossary_ms:.0f} ms "
+          f"per batch, generation {args.generation_ms:.0f} ms per request")
+    run("no micro-batching", translator, args, 1)
+    metrics = run(f"micro-batches <= {args.max_batch_size}", translator, args, args.max_batch_size)
+    if args.metrics:
+        print(json.dumps(metrics, indent=2))
+
+    engine.close()
+    mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Single-text translation latency benchmark
+
+Translates one sentence at a time with TRagx.batch_translate([text]) and with TRagx.translate(text), and reports the
+p50/p99 latency and the per-stage timings of translate. The generation model is an APIModel talking to the mock
+server of bench_http_engine.py, the input processor sleeps a fixed time per memory and glossary search in place of
+Elasticsearch and the glossary index.
+
+Usage:
+    python benchmarks/bench_translate_latency.py --requests 50 --memory-ms 20 --glossary-ms 5 --generation-ms 30
+"""
+import argparse
+import statistics
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from bench_http_engine import MockHandler
+
+from t_ragx import TRagx
+from t_ragx.models.API_Model import APIModel
+
+
+class SleepInputProcessor:
+    def __init__(self, memory_latency, glossary_latency):
+        self.memory_latency = memory_latency
+        self.glossary_latency = glossary_latency
+
+    def search_memory(self, text_list, **kwargs):
+        time.sleep(self.memory_latency)
+        return [[{'ja': '吾輩は猫である。', 'en': 'I am a cat.'}] for _ in text_list]
+
+    def batch_search_glossary(self, text_list, **kwargs):
+        time.sleep(self.glossary_latency)
+        return [{'吾輩': ['I']} for _ in text_list]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run(name, fn, texts):
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - start)
+    print(f"{name:<26} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--memory-ms", type=float, default=20)
+    parser.add_argument("--glossary-ms", type=float, default=5)
+    parser.add_argument("--generation-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    MockHandler.latency = args.generation_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    model = APIModel(host="127.0.0.1", port=server.server_address[1], model="mock")
+    translator = TRagx([model], input_processor=SleepInputProcessor(args.memory_ms / 1000, args.glossary_ms / 1000))
+    texts = [f"吾輩は猫である。名前はまだ無い。({i})" for i in range(args.requests)]
+
+    # warm up the connection pool and the thread pools
+    translator.translate(texts[0])
+    translator.batch_translate(texts[:1])
+
+    run("batch_translate([text])", lambda t: translator.batch_translate([t]), texts)
+    run("translate(text)", translator.translate, texts)
+
+    stages = {}
+    for text in texts:
+        _, timings = translator.translate(text, return_timings=True)
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    print("translate stages (median): " + ", ".join(
+        f"{stage} {statistics.median(seconds) * 1000:.1f} ms" for stage, seconds in stages.items()
+    ))
+
+    translator.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
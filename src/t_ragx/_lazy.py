@@ -0,0 +1,44 @@
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    A stand-in for a module that is only imported on first attribute access
+
+    Unlike importlib.util.LazyLoader it never touches sys.modules, so it also works for packages that replace their
+    own module object (e.g. transformers), and the import itself is guarded by the import lock
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__['_lazy_module'] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return the module if it is already imported, otherwise a LazyModule importing it on first use
+
+    A missing optional dependency raises its ModuleNotFoundError on first use instead of at import
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -1,11 +1,23 @@
-from typing import List, Union
-
-import numpy as np
-from tqdm.auto import tqdm
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+from typing import Iterable, List, Union
 
+from t_ragx._lazy import lazy_import
 from t_ragx.processors import ElasticInputProcessor, BaseInputProcessor
 from t_ragx.models.AggregationModel import CometAggregationModel
 from t_ragx.models.BaseModel import BaseModel
+from t_ragx.utils.helper import chunked, iter_lines, iter_preceding_text
+from t_ragx.utils.jsonl import JsonlSink
+
+np = lazy_import("numpy")
+tqdm_auto = lazy_import("tqdm.auto")
+
+logger = logging.getLogger("t_ragx")
 
 
 class TRagx:
@@ -44,16 +56,228 @@ class TRagx:
             if len(self.generation_models) > 1:
                 self.aggregate_model = CometAggregationModel()
 
+        # thread pools of translate, created on first use
+        self._search_executor = None
+        self._generation_executors = None
+        self._late_futures = {}
+
     def __call__(self, *args, **kwargs):
         return self.translate(*args, **kwargs)
 
-    def translate(self, text, pre_text: list = None,
-                  search_glossary=True, search_memory=True,
+    def translate(self, text: str,
+                  pre_text: list = None,
+                  source_lang_code='ja',
+                  target_lang_code='en',
+                  search_glossary=True,
+                  search_memory=True,
                   memory_search_args: dict = None,
                   glossary_search_args: dict = None,
+                  tokenize_args: List[dict] = None,
                   prompt_args: List[dict] = None,
-                  generation_args: List[dict] = None):
-        pass
+                  generation_args: List[dict] = None,
+                  model_timeout: Union[float, List[float]] = None,
+                  latency_budget: float = None,
+                  return_timings: bool = False):
+        """
+        Translate a single text with as little overhead as possible, for interactive and online use
+
+        The memory search runs in a background thread while the glossary is searched, then every generation model
+        builds its prompt and generates once. The thread pools are kept between the calls, see close
+
+        Args:
+            pre_text: the preceding texts of this text
+            model_timeout: seconds each model may spend, a single value or one per model
+            latency_budget: seconds the ensemble may spend on generation, see batch_translate
+            return_timings: also return the seconds spent in each stage
+
+        Returns:
+            the translation, or (translation, timings) if return_timings. timings has the keys "memory_search",
+            "glossary_search", "search" (the wall time of both searches), "prompt", "generate", "aggregate", and
+            "total"
+        """
+        if memory_search_args is None:
+            memory_search_args = {}
+        if glossary_search_args is None:
+            glossary_search_args = {}
+
+        if tokenize_args is None:
+            tokenize_args = [{}] * len(self.generation_models)
+
+        if generation_args is None:
+            generation_args = [{}] * len(self.generation_models)
+
+        timings = {'memory_search': 0.0, 'glossary_search': 0.0}
+        start = time.perf_counter()
+
+        def timed_memory_search():
+            memory_start = time.perf_counter()
+            memory = self.input_processor.search_memory([text], **memory_search_args)[0]
+            timings['memory_search'] = time.perf_counter() - memory_start
+            return memory
+
+        memory_future = None
+        if search_memory:
+            memory_future = self._get_search_executor().submit(timed_memory_search)
+
+        glossary = []
+        if search_glossary:
+            glossary = self.input_processor.batch_search_glossary([text], **glossary_search_args)[0]
+            timings['glossary_search'] = time.perf_counter() - start
+
+        memory = memory_future.result() if memory_future is not None else []
+        search_result = {'memory': memory, 'glossary': glossary}
+        stage_end = time.perf_counter()
+        timings['search'] = stage_end - start
+
+        # every model has its own prompt template
+        prompts = [
+            generation_model.build_prompt(text, source_lang_code=source_lang_code, target_lang_code=target_lang_code,
+                                          search_result=search_result, pre_text=pre_text)
+            for generation_model in self.generation_models
+        ]
+        stage_start, stage_end = stage_end, time.perf_counter()
+        timings['prompt'] = stage_end - stage_start
+
+        output = self._generate_prompts(prompts, tokenize_args, generation_args, model_timeout=model_timeout,
+                                        latency_budget=latency_budget)
+        stage_start, stage_end = stage_end, time.perf_counter()
+        timings['generate'] = stage_end - stage_start
+
+        if len(self.generation_models) > 1:
+            translation = self.aggregate_model.combine_preds(
+                {model_idx: output.get(model_idx, [None]) for model_idx in range(len(self.generation_models))},
+                [text], target_lang_code=target_lang_code
+            )[0]
+        else:
+            translation = output[0][0]
+        stage_start, stage_end = stage_end, time.perf_counter()
+        timings['aggregate'] = stage_end - stage_start
+        timings['total'] = stage_end - start
+
+        logger.debug(f"translate timings: {timings}")
+        if return_timings:
+            return translation, timings
+        return translation
+
+    def _generate_prompts(self, prompts, tokenize_args, generation_args, model_timeout=None, latency_budget=None):
+        """
+        Generate the prompt of each model for translate, concurrently on the kept thread pools with an ensemble
+
+        Args:
+            prompts: one prompt per generation model
+
+        Returns:
+            dict of model index to the single item list of its translation, see _generate_batch
+        """
+        def generate_fn(model_idx):
+            return self.generation_models[model_idx].translate_prompts(
+                [prompts[model_idx]], dict(tokenize_args[model_idx]), generation_args[model_idx]
+            )
+
+        generation_executors = []
+        if len(self.generation_models) > 1:
+            generation_executors = self._get_generation_executors()
+        return self._generate_batch(generation_executors, self._late_futures, generate_fn,
+                                    model_timeout=model_timeout, latency_budget=latency_budget)
+
+    def _get_search_executor(self):
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="t_ragx_search")
+        return self._search_executor
+
+    def _get_generation_executors(self):
+        if self._generation_executors is None:
+            self._generation_executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix="t_ragx_generation")
+                                          for _ in self.generation_models]
+        return self._generation_executors
+
+    def close(self):
+        """
+        Shut down the thread pools kept by translate, models still working on a timed out text are not waited for
+        """
+        if self._search_executor is not None:
+            self._search_executor.shutdown(wait=False)
+            self._search_executor = None
+        if self._generation_executors is not None:
+            for executor in self._generation_executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._generation_executors = None
+        self._late_futures.clear()
+
+    def _generate_batch(self, generation_executors, late_futures, generate_fn, model_timeout=None,
+                        latency_budget=None):
+        """
+        Generate one batch with every generation model
+
+        Args:
+            generate_fn: called with the model index, returns the batch translations of that model
+
+        Returns:
+            dict of model index to the batch translations, models that did not finish in time are left out
+        """
+        if not generation_executors:
+            return {model_idx: generate_fn(model_idx) for model_idx in range(len(self.generation_models))}
+
+        if not isinstance(model_timeout, list):
+            model_timeout = [model_timeout] * len(self.generation_models)
+
+        start = time.monotonic()
+        futures = {}
+        for model_idx in range(len(self.generation_models)):
+            if model_idx in late_futures:
+                if not late_futures[model_idx].done():
+                    logger.warning(f"generation model {model_idx} is still busy with a timed out batch, skipped")
+                    continue
+                del late_futures[model_idx]
+            futures[model_idx] = generation_executors[model_idx].submit(generate_fn, model_idx)
+
+        batch_output, timed_out, errors = self._collect_generation(futures, start, model_timeout, latency_budget)
+
+        if not batch_output:
+            if not timed_out:
+                raise errors[0]
+            # nothing finished in time, fall back to the first model to finish
+            done, _ = wait(timed_out.values(), return_when=FIRST_COMPLETED)
+            model_idx = next(idx for idx, future in timed_out.items() if future in done)
+            batch_output[model_idx] = timed_out.pop(model_idx).result()
+
+        late_futures.update(timed_out)
+        return batch_output
+
+    @staticmethod
+    def _collect_generation(futures, start, model_timeout, latency_budget):
+        """
+        Wait for the batch translations of the models until their deadlines
+
+        Args:
+            futures: dict of model index to the future of its batch translations
+            start: the time.monotonic the batch was submitted at
+            model_timeout: the timeout of each model, None for no timeout
+            latency_budget: the timeout of the whole batch, None for no timeout
+
+        Returns:
+            dict of model index to the batch translations, dict of model index to the futures that timed out, and
+            the errors raised by the models
+        """
+        batch_output = {}
+        timed_out = {}
+        errors = []
+        for model_idx, future in futures.items():
+            deadline = min(
+                start + (model_timeout[model_idx] if model_timeout[model_idx] is not None else math.inf),
+                start + (latency_budget if latency_budget is not None else math.inf)
+            )
+            try:
+                batch_output[model_idx] = future.result(
+                    timeout=None if deadline == math.inf else max(deadline - time.monotonic(), 0)
+                )
+            except TimeoutError:
+                logger.warning(f"generation model {model_idx} timed out")
+                timed_out[model_idx] = future
+            except Exception as e:
+                logger.warning(f"generation model {model_idx} failed: {e}")
+                errors.append(e)
+        return batch_output, timed_out, errors
 
     def batch_translate(self,
                         text_list,
@@ -67,74 +291,323 @@ class TRagx:
                         glossary_search_args: dict = None,
                         tokenize_args: List[dict] = None,
                         prompt_args: List[dict] = None,
-                        generation_args: List[dict] = None
+                        generation_args: List[dict] = None,
+                        prefetch_batches: int = 1,
+                        concurrent_generation: bool = True,
+                        model_timeout: Union[float, List[float]] = None,
+                        latency_budget: float = None,
+                        max_batch_tokens: int = None,
+                        max_batch_size: int = None,
+                        pbar: bool = True
                         ):
+        """
+        Translate a list of texts in batches
+
+        The memory and glossary search of the upcoming batches runs in a background thread while the current batch
+        is being generated. With several generation models, the models generate each batch concurrently and the
+        aggregate model chooses among the candidates that finished in time.
+
+        Args:
+            prefetch_batches: number of batches searched ahead of the batch being generated
+            concurrent_generation: run the generation models of an ensemble concurrently
+            model_timeout: seconds each model may spend on a batch, a single value or one per model
+            latency_budget: seconds the ensemble may spend on a batch, the candidates of the models that have not
+                            finished by then are left out. If no model finishes in time, the first one to finish
+                            is waited for
+            max_batch_tokens: token budget of the length-bucketed sub-batches the models generate, see
+                            BaseModel.batch_translate. Use with a larger batch_size so that each batch has prompts
+                            of various lengths to bucket
+            max_batch_size: the maximum number of prompts per sub-batch
+            pbar: show a progress bar
+        """
 
         if pre_text_list is None:
             pre_text_list = [None] * len(text_list)
 
+        if prompt_args is None:
+            prompt_args = [{}] * len(self.generation_models)
+
+        batch_idx_list = np.array_split(list(range(len(text_list))), int(max(len(text_list) / batch_size, 1)))
+        batches = (
+            ([text_list[i] for i in batch_idx], [pre_text_list[i] for i in batch_idx]) for batch_idx in batch_idx_list
+        )
+
+        generation_output_dict = {model_idx: [] for model_idx in range(len(self.generation_models))}
+        batch_outputs = self._iter_batch_outputs(
+            batches,
+            source_lang_code=source_lang_code,
+            target_lang_code=target_lang_code,
+            search_glossary=search_glossary,
+            search_memory=search_memory,
+            memory_search_args=memory_search_args,
+            glossary_search_args=glossary_search_args,
+            tokenize_args=tokenize_args,
+            generation_args=generation_args,
+            prefetch_batches=prefetch_batches,
+            concurrent_generation=concurrent_generation,
+            model_timeout=model_timeout,
+            latency_budget=latency_budget,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size
+        )
+        for _, batch_output in tqdm_auto.tqdm(batch_outputs, total=len(batch_idx_list), disable=not pbar):
+            for model_idx in generation_output_dict:
+                generation_output_dict[model_idx] += batch_output[model_idx]
+
+        generation_output = generation_output_dict[0]
+        if len(generation_output_dict) > 1:
+            generation_output = self.aggregate_model.combine_preds(
+                generation_output_dict, text_list, target_lang_code=target_lang_code
+            )
+        return generation_output
+
+    def iter_translate(self,
+                       texts: Union[Iterable[str], str, os.PathLike],
+                       batch_size=8,
+                       source_lang_code='ja',
+                       target_lang_code='en',
+                       pre_text_max_sent=0,
+                       sink: Union[str, os.PathLike, JsonlSink] = None,
+                       search_glossary=True,
+                       search_memory=True,
+                       memory_search_args: dict = None,
+                       glossary_search_args: dict = None,
+                       tokenize_args: List[dict] = None,
+                       generation_args: List[dict] = None,
+                       prefetch_batches: int = 1,
+                       concurrent_generation: bool = True,
+                       model_timeout: Union[float, List[float]] = None,
+                       latency_budget: float = None,
+                       max_batch_tokens: int = None,
+                       max_batch_size: int = None,
+                       encoding="utf8",
+                       pbar: bool = True
+                       ):
+        """
+        Translate a stream of texts, yielding the translations in the input order as the batches complete
+
+        The input is read lazily, at most prefetch_batches + 2 batches are held in memory, so the input can be larger
+        than the memory
+
+        Args:
+            texts: an iterable of texts, or the path of a text file with one text per line
+            pre_text_max_sent: number of preceding texts given to the models as context, see get_preceding_text
+            sink: a JSONL file (or JsonlSink) every batch is appended to as {"id", "source", "translation"} records.
+                    If the file already has records, they are checked against the input and yielded again without
+                    being translated, so an interrupted run resumes where it stopped
+            encoding: the encoding of the texts file
+
+        See batch_translate for the other arguments
+        """
+        if isinstance(texts, (str, os.PathLike)):
+            texts = iter_lines(texts, encoding=encoding)
+
+        own_sink = sink is not None and not isinstance(sink, JsonlSink)
+        if own_sink:
+            sink = JsonlSink(sink)
+
+        lines = iter_preceding_text(texts, max_sent=pre_text_max_sent)
+        n_done = 0
+        try:
+            if sink is not None:
+                n_done = yield from self._replay_sink(sink, lines)
+
+            batches = (
+                ([text for text, _ in chunk], [pre_text if pre_text_max_sent > 0 else None for _, pre_text in chunk])
+                for chunk in chunked(lines, batch_size)
+            )
+            batch_outputs = self._iter_batch_outputs(
+                batches,
+                source_lang_code=source_lang_code,
+                target_lang_code=target_lang_code,
+                search_glossary=search_glossary,
+                search_memory=search_memory,
+                memory_search_args=memory_search_args,
+                glossary_search_args=glossary_search_args,
+                tokenize_args=tokenize_args,
+                generation_args=generation_args,
+                prefetch_batches=prefetch_batches,
+                concurrent_generation=concurrent_generation,
+                model_timeout=model_timeout,
+                latency_budget=latency_budget,
+                max_batch_tokens=max_batch_tokens,
+                max_batch_size=max_batch_size
+            )
+            for batch_text, batch_output in tqdm_auto.tqdm(batch_outputs, unit="batch", disable=not pbar):
+                translations = batch_output[0]
+                if len(batch_output) > 1:
+                    translations = self.aggregate_model.combine_preds(
+                        batch_output, batch_text, target_lang_code=target_lang_code
+                    )
+
+                if sink is not None:
+                    sink.write([
+                        {'id': n_done + i, 'source': text, 'translation': translation}
+                        for i, (text, translation) in enumerate(zip(batch_text, translations))
+                    ])
+                n_done += len(batch_text)
+                yield from translations
+        finally:
+            if own_sink:
+                sink.close()
+
+    @staticmethod
+    def _replay_sink(sink: JsonlSink, lines):
+        """
+        Yield the translations already in the sink, consuming the matching (text, preceding text) lines
+
+        Returns:
+            the number of records replayed
+
+        Raises:
+            ValueError: a record does not match its input text
+        """
+        n_done = 0
+        for record in sink.records():
+            text, _ = next(lines, (None, None))
+            if text != record['source']:
+                raise ValueError(f"record {record['id']} of {sink.path} does not match input text {n_done}, "
+                                 f"the sink belongs to another input")
+            n_done += 1
+            yield record['translation']
+        if n_done > 0:
+            logger.info(f"resuming after {n_done} texts already in {sink.path}")
+        return n_done
+
+    def _iter_batch_outputs(self,
+                            batches: Iterable,
+                            source_lang_code='ja',
+                            target_lang_code='en',
+                            search_glossary=True,
+                            search_memory=True,
+                            memory_search_args: dict = None,
+                            glossary_search_args: dict = None,
+                            tokenize_args: List[dict] = None,
+                            generation_args: List[dict] = None,
+                            prefetch_batches: int = 1,
+                            concurrent_generation: bool = True,
+                            model_timeout: Union[float, List[float]] = None,
+                            latency_budget: float = None,
+                            max_batch_tokens: int = None,
+                            max_batch_size: int = None
+                            ):
+        """
+        Search and generate (texts, preceding texts) batches, the batches are pulled from the iterable as needed
+
+        Yields:
+            (batch texts, dict of model index to the batch translations), the translations of the models that did not
+            finish in time are None
+        """
         if memory_search_args is None:
             memory_search_args = {}
         if glossary_search_args is None:
             glossary_search_args = {}
 
-        if prompt_args is None:
-            prompt_args = [{}] * len(self.generation_models)
+        if tokenize_args is None:
+            tokenize_args = [{}] * len(self.generation_models)
 
         if generation_args is None:
             generation_args = [{}] * len(self.generation_models)
 
-        if tokenize_args is None:
-            tokenize_args = [{}] * len(text_list)
+        batching_args = {}
+        if max_batch_tokens is not None:
+            batching_args = {'max_batch_tokens': max_batch_tokens, 'max_batch_size': max_batch_size}
 
-        if generation_args is None:
-            generation_args = [{}] * len(text_list)
+        def search_batch(batch_text):
+            return self._search_batch(batch_text, search_glossary=search_glossary, search_memory=search_memory,
+                                      memory_search_args=memory_search_args,
+                                      glossary_search_args=glossary_search_args)
 
-        memory_results = [[]] * len(text_list)
+        late_futures = {}
+        with self._batch_generation_executors(concurrent_generation) as generation_executors:
+            for (batch_text, batch_pre_text), batch_search_result in self._iter_prefetched(batches, search_batch,
+                                                                                           prefetch_batches):
+                def generate_fn(model_idx):
+                    return self.generation_models[model_idx].batch_translate(
+                        batch_text,
+                        source_lang_code=source_lang_code,
+                        target_lang_code=target_lang_code,
+                        batch_search_result=batch_search_result,
+                        batch_pre_text=batch_pre_text,
+                        tokenize_config=tokenize_args[model_idx],
+                        generation_config=generation_args[model_idx],
+                        **batching_args
+                    )
+
+                batch_output = self._generate_batch(
+                    generation_executors, late_futures, generate_fn,
+                    model_timeout=model_timeout,
+                    latency_budget=latency_budget
+                )
+                yield batch_text, {
+                    model_idx: batch_output.get(model_idx, [None] * len(batch_text))
+                    for model_idx in range(len(self.generation_models))
+                }
+
+    def _search_batch(self, batch_text, search_glossary=True, search_memory=True, memory_search_args: dict = None,
+                      glossary_search_args: dict = None):
+        """
+        The translation memory and glossary search results of each text of a batch
+        """
+        memory_results = [[]] * len(batch_text)
         if search_memory:
-            memory_results = self.input_processor.search_memory(text_list, **memory_search_args)
+            memory_results = self.input_processor.search_memory(batch_text, **memory_search_args)
 
-        glossary_results = [[]] * len(text_list)
+        glossary_results = [[]] * len(batch_text)
         if search_glossary:
-            glossary_results = self.input_processor.batch_search_glossary(text_list, **glossary_search_args)
-
-        generation_output_dict = {}
-        for model_idx, generation_model, p_args, tok_args, gen_args in zip(
-                range(len(self.generation_models)),
-                self.generation_models,
-                prompt_args,
-                tokenize_args,
-                generation_args
-        ):
-            translated_text_list = []
-            for batch_idx in tqdm(
-                    np.array_split(list(range(len(text_list))), int(max(len(text_list) / batch_size, 1)))
-            ):
-                batch_text = [text_list[i] for i in batch_idx]
-                batch_pre_text = [pre_text_list[i] for i in batch_idx]
-
-                batch_search_result = [
-                    {
-                        'memory': memory_results[i],
-                        'glossary': glossary_results[i],
-                    }
-                    for i in range(len(batch_idx))
-                ]
-
-                translated_text_list += generation_model.batch_translate(
-                    batch_text,
-                    source_lang_code=source_lang_code,
-                    target_lang_code=target_lang_code,
-                    batch_search_result=batch_search_result,
-                    batch_pre_text=batch_pre_text,
-                    tokenize_config=tok_args,
-                    generation_config=gen_args
-                )
-            generation_output_dict[model_idx] = translated_text_list
+            glossary_results = self.input_processor.batch_search_glossary(batch_text, **glossary_search_args)
 
-        generation_output = generation_output_dict[0]
-        if len(generation_output_dict) > 1:
-            generation_output = self.aggregate_model.combine_preds(
-                generation_output_dict, batch_text, target_lang_code=target_lang_code
-            )
-        return generation_output
+        return [
+            {
+                'memory': memory,
+                'glossary': glossary,
+            }
+            for memory, glossary in zip(memory_results, glossary_results)
+        ]
+
+    @contextmanager
+    def _batch_generation_executors(self, concurrent_generation=True):
+        """
+        One single-worker executor per model, so a model never runs two batches at once even after a timeout
+
+        Yields:
+            the executors, an empty list when the models generate one after the other
+        """
+        generation_executors = []
+        if concurrent_generation and len(self.generation_models) > 1:
+            generation_executors = [ThreadPoolExecutor(max_workers=1) for _ in self.generation_models]
+        try:
+            yield generation_executors
+        finally:
+            # models still working on a timed out batch are not waited for
+            for executor in generation_executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _iter_prefetched(batches: Iterable, search_fn, prefetch_batches: int = 1):
+        """
+        Search the (texts, preceding texts) batches in a background thread, prefetch_batches ahead of the batch
+        being consumed, so that at most prefetch_batches + 1 batches of search results are held in memory
+
+        Args:
+            search_fn: called with the texts of a batch, returns their search results
+
+        Yields:
+            (batch, search results of the batch texts)
+        """
+        with ThreadPoolExecutor(max_workers=1) as search_executor:
+            pending_search = deque()
+            batch_iter = iter(batches)
+
+            def submit_next():
+                batch = next(batch_iter, None)
+                if batch is not None:
+                    pending_search.append((batch, search_executor.submit(search_fn, batch[0])))
+
+            for _ in range(max(prefetch_batches, 0) + 1):
+                submit_next()
+
+            while pending_search:
+                batch, search_future = pending_search.popleft()
+                submit_next()
+                yield batch, search_future.result()
@@ -1,6 +1,7 @@
-import requests
+import asyncio
 
 from .BaseModel import BaseModel
+from ._http import HTTPEngine, AsyncHTTPEngine, get_http_engine
 from ._utils import DummyTokenizer
 
 
@@ -9,32 +10,67 @@ class APIModel(BaseModel):
     model = None
 
     def __init__(self, host='localhost', port='11434', endpoint='/api/generate', model="t_ragx_mistral",
-                 protocol="http"):
+                 protocol="http", engine: HTTPEngine = None):
+        """
+
+        Args:
+            engine: the HTTP engine sending the requests, defaults to the engine shared by all API models
+        """
         self.host = host
         self.port = port
         self.endpoint = endpoint
         self.protocol = protocol
         self.model = model
+        self.engine = engine if engine is not None else get_http_engine()
         super().__init__(model_id="Dummy", tokenizer=self.tokenizer, model=model)
 
+    @property
+    def url(self):
+        return f"{self.protocol}://{self.host}:{self.port}{self.endpoint}"
+
+    def _payload(self, text, generation_config):
+        return {
+            "model": self.model,
+            "prompt": text,
+            'stream': False,
+            **generation_config
+        }
+
     def generate(self, input_text_list, generation_config={}):
+        """
+        Send the prompts concurrently through the HTTP engine, the outputs keep the input order
+        """
         if isinstance(input_text_list, str):
             input_text_list = [input_text_list]
 
-        out_text = []
-        for t in input_text_list:
-            data = {
-                "model": self.model,
-                "prompt": t,
-                'stream': False,
-                **generation_config
-            }
+        return self.engine.map(
+            lambda t: self.engine.post_json(self.url, self._payload(t, generation_config))['response'],
+            input_text_list
+        )
+
+    async def agenerate(self, input_text_list, generation_config={}, engine: AsyncHTTPEngine = None):
+        """
+        The asyncio variant of generate
+
+        Args:
+            engine: an AsyncHTTPEngine bound to the running event loop, a temporary one is created if not given
+        """
+        if isinstance(input_text_list, str):
+            input_text_list = [input_text_list]
 
-            r = requests.post(f"{self.protocol}://{self.host}:{self.port}{self.endpoint}", json=data)
-            assert r.status_code == 200, f"Failed to generate {t}"
-            out_text.append(r.json()['response'])
+        own_engine = engine is None
+        if own_engine:
+            engine = AsyncHTTPEngine(max_concurrency=self.engine.max_concurrency,
+                                     max_retries=self.engine.max_retries)
+        try:
+            responses = await asyncio.gather(*[
+                engine.post_json(self.url, self._payload(t, generation_config)) for t in input_text_list
+            ])
+        finally:
+            if own_engine:
+                await engine.aclose()
 
-        return out_text
+        return [r['response'] for r in responses]
 
     def tokenize(self,
                  text_list=None,
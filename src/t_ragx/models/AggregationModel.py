@@ -1,7 +1,13 @@
-import pandas as pd
-from comet import download_model, load_from_checkpoint
+import hashlib
+from collections import OrderedDict
 
 from .LangDetectModel import FastTextLangDetectModel
+from .._lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+torch = lazy_import("torch")
+comet = lazy_import("comet")
 
 
 class CometAggregationModel:
@@ -11,34 +17,115 @@ class CometAggregationModel:
             self,
             model_id="Unbabel/wmt22-cometkiwi-da",
             get_lang_func=None,
-
+            gpus=None,
+            batch_size=8,
+            num_workers=None,
+            cache_size=100000,
     ):
+        """
+
+        Args:
+            gpus: number of GPUs used by COMET, defaults to 1 if CUDA is available, otherwise runs on CPU
+            batch_size: COMET prediction batch size
+            num_workers: number of COMET data loader workers
+            cache_size: number of (source, translation) scores kept in memory
+        """
         self.get_lang = get_lang_func
         if get_lang_func is None:
             fast_text_lang_detect_model = FastTextLangDetectModel()
             self.get_lang = fast_text_lang_detect_model.get_lang
 
-        model_path = download_model(model_id)
-        self.model = load_from_checkpoint(model_path)
+        self.gpus = gpus
+        if gpus is None:
+            self.gpus = 1 if torch.cuda.is_available() else 0
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+
+        self.cache_size = cache_size
+        self._score_cache = OrderedDict()
+        self._lang_cache = OrderedDict()
+
+        model_path = comet.download_model(model_id)
+        self.model = comet.load_from_checkpoint(model_path)
+
+    @staticmethod
+    def _cache_key(src, mt):
+        return hashlib.sha1(f"{src}\x00{mt}".encode("utf-8")).hexdigest()
+
+    def _cache_put(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _lang(self, text):
+        if text not in self._lang_cache:
+            self._cache_put(self._lang_cache, text, self.get_lang(text))
+        return self._lang_cache[text]
+
+    def blind_scores(self, src_list, mt_list, target_lang_code='en'):
+        """
+        Reference-free COMET scores of (source, translation) pairs
+
+        The pairs not in the score cache are scored with a single COMET predict call, each distinct pair once.
+        Translations not in the target language score 0
+        """
+        keys = [self._cache_key(src, mt) for src, mt in zip(src_list, mt_list)]
+
+        scores = {}
+        missing = OrderedDict()
+        for key, src, mt in zip(keys, src_list, mt_list):
+            if key in scores or key in missing:
+                continue
+            if key in self._score_cache:
+                self._score_cache.move_to_end(key)
+                scores[key] = self._score_cache[key]
+            else:
+                missing[key] = {"src": src, "mt": mt, "ref": ""}
+
+        if len(missing) > 0:
+            predicted = self.model.predict(list(missing.values()), batch_size=self.batch_size, gpus=self.gpus,
+                                           num_workers=self.num_workers, progress_bar=False).scores
+            for key, score in zip(missing, predicted):
+                scores[key] = score
+                self._cache_put(self._score_cache, key, score)
+
+        return [scores[key] if self._lang(mt) == target_lang_code else 0 for key, mt in zip(keys, mt_list)]
 
     def get_blind_score(self, out_text_list, source_text, target_lang_code='en'):
-        comet_data = [{
-            "src": source_text[0],
-            "mt": out_text_list[i],
-            "ref": ""
-        } for i in range(len(out_text_list))
-        ]
-        scores = self.model.predict(comet_data, batch_size=8, gpus=1)
-        out_score = scores.scores
-        for i in range(len(out_score)):
-            if self.get_lang(out_text_list[i]) != target_lang_code:
-                out_score[i] = 0
-        return out_score
+        if isinstance(source_text, str):
+            source_text = [source_text]
+        if len(source_text) != len(out_text_list):
+            source_text = [source_text[0]] * len(out_text_list)
+        return self.blind_scores(source_text, out_text_list, target_lang_code=target_lang_code)
 
     def combine_preds(self, pred_dict, source_text, target_lang_code='en'):
-        blind_results = {k: self.get_blind_score(pred_dict[k], source_text, target_lang_code=target_lang_code) for k in
-                         pred_dict}
-        score_df = pd.DataFrame.from_dict({k: blind_results[k] for k in blind_results}, orient="columns")
+        """
+        Choose the prediction with the best blind score for each source text
+
+        The candidates of all models are scored together in one batch. Texts whose available candidates are all
+        identical are not scored. Missing predictions (None), e.g. from models that did not finish within the
+        latency budget, are skipped
+        """
+        keys = list(pred_dict)
+        n_text = len(pred_dict[keys[0]])
+
+        score_matrix = np.full((n_text, len(keys)), -np.inf)
+        to_score = []
+        for i in range(n_text):
+            candidates = {j: pred_dict[k][i] for j, k in enumerate(keys) if pred_dict[k][i] is not None}
+            if len(set(candidates.values())) == 1:
+                score_matrix[i, next(iter(candidates))] = 0
+                continue
+            to_score += [(i, j, pred) for j, pred in candidates.items()]
+
+        if len(to_score) > 0:
+            scores = self.blind_scores([source_text[i] for i, _, _ in to_score], [pred for _, _, pred in to_score],
+                                       target_lang_code=target_lang_code)
+            for (i, j, _), score in zip(to_score, scores):
+                score_matrix[i, j] = score
+
+        score_df = pd.DataFrame(score_matrix, columns=keys)
         best_pred_key = score_df.apply(lambda row: row.index[row.argmax()], axis=1).to_list()
 
         combined_pred = []
@@ -1,8 +1,20 @@
 import abc
-
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import logging
 
 from .constants import LANG_BY_LANG_CODE
+from ._utils import DummyTokenizer
+from .._lazy import lazy_import
+from ..utils.helper import token_budget_batches, padding_efficiency
+
+transformers = lazy_import("transformers")
+
+logger = logging.getLogger("t_ragx")
+
+# the instruction every prompt built by BaseModel.build_prompt starts with
+PROMPT_INSTRUCTION = (
+    "As a large language model, you are a trained expert in multiple languages. "
+    "These are some references that might help you translating passages:\n"
+)
 
 
 def pretext_to_text(pretext_list, max_sent=5):
@@ -54,11 +66,13 @@ def trans_mem_to_text(trans_mem: list, source_lang_code='zh', target_lang_code='
 class BaseModel(metaclass=abc.ABCMeta):
     tokenizer = None
     model = None
+    # padding statistics of the last batch_translate call with a token budget
+    batching_stats = None
 
     def __init__(self, model_id, adapter=None, tokenizer=None, model=None):
 
         if tokenizer is None:
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_id,
                 padding_side='left',
                 truncation_side='left',
@@ -69,7 +83,7 @@ class BaseModel(metaclass=abc.ABCMeta):
                 tokenizer.pad_token = tokenizer.unk_token
 
         if model is None:
-            model = AutoModelForCausalLM.from_pretrained(model_id, device_map="auto")
+            model = transformers.AutoModelForCausalLM.from_pretrained(model_id, device_map="auto")
             if adapter is not None:
                 if isinstance(adapter, list):
                     for a in adapter:
@@ -138,14 +152,48 @@ class BaseModel(metaclass=abc.ABCMeta):
         ]
         return decoded_outputs
 
+    def prompt_lengths(self, prompts, tokenize_config=None):
+        """
+        The token length of each prompt, as the tokenize method would truncate it
+        """
+        if tokenize_config is None:
+            tokenize_config = {}
+        input_ids = self.tokenizer(
+            prompts,
+            add_special_tokens=tokenize_config.get('add_special_tokens', False),
+            truncation=tokenize_config.get('truncation', True),
+            max_length=tokenize_config.get('max_length', 2000),
+        )['input_ids']
+        return [len(ids) for ids in input_ids]
+
+    def translate_prompts(self, prompts: list, tokenize_config=None, generation_config=None):
+        """
+        Tokenize, generate, and decode the translations of prompts built by batch_build_prompt
+        """
+        token_data = self.tokenize(prompts, tokenize_config)
+        generation_output = self.generate(token_data, generation_config)
+        return self.process_output(generation_output, token_data)
+
     def batch_translate(self, batch_text: list,
                         source_lang_code="ja",
                         target_lang_code="en",
                         batch_search_result: list = None,
                         batch_pre_text: list = None,
                         tokenize_config=None,
-                        generation_config=None
+                        generation_config=None,
+                        max_batch_tokens: int = None,
+                        max_batch_size: int = None
                         ):
+        """
+        Translate a batch of texts
+
+        Args:
+            max_batch_tokens: if set, the prompts are sorted by token length and generated in sub-batches of at most
+                                this many padded prompt tokens, so a single long prompt does not make the whole batch
+                                pad to its length. The outputs keep the input order. Ignored by models without a
+                                padding tokenizer (API and llama.cpp models)
+            max_batch_size: the maximum number of prompts per sub-batch
+        """
 
         query_prompts = self.batch_build_prompt(
             text=batch_text,
@@ -155,9 +203,31 @@ class BaseModel(metaclass=abc.ABCMeta):
             search_result=batch_search_result
         )
 
-        token_data = self.tokenize(query_prompts, tokenize_config)
-        generation_output = self.generate(token_data, generation_config)
-        translated_output = self.process_output(generation_output, token_data)
+        if max_batch_tokens is None or isinstance(self.tokenizer, DummyTokenizer) or len(query_prompts) < 2:
+            return self.translate_prompts(query_prompts, tokenize_config, generation_config)
+
+        if tokenize_config is None:
+            tokenize_config = {}
+        pad_to_multiple_of = tokenize_config.get('pad_to_multiple_of', 8)
+        lengths = self.prompt_lengths(query_prompts, tokenize_config)
+        batches = token_budget_batches(lengths, max_batch_tokens, max_batch_size=max_batch_size,
+                                       pad_to_multiple_of=pad_to_multiple_of)
+
+        translated_output = [None] * len(query_prompts)
+        for batch_idx in batches:
+            batch_output = self.translate_prompts([query_prompts[i] for i in batch_idx], dict(tokenize_config),
+                                                  generation_config)
+            for i, output in zip(batch_idx, batch_output):
+                translated_output[i] = output
+
+        self.batching_stats = {
+            'n_prompts': len(query_prompts),
+            'n_batches': len(batches),
+            'padding_efficiency': padding_efficiency(lengths, batches, pad_to_multiple_of),
+            'unsorted_padding_efficiency': padding_efficiency(lengths, [list(range(len(lengths)))],
+                                                              pad_to_multiple_of),
+        }
+        logger.debug(f"token budget batching: {self.batching_stats}")
         return translated_output
 
     def translate(self, text: str,
@@ -225,8 +295,7 @@ class BaseModel(metaclass=abc.ABCMeta):
 
         chat = [
             {"role": "user", "content": (
-                "As a large language model, you are a trained expert in multiple languages. "
-                "These are some references that might help you translating passages:\n"
+                f"{PROMPT_INSTRUCTION}"
                 f"{glossary_to_text(search_result['glossary'])}{pretext_to_text(pre_text)}{trans_mem_to_text(search_result['memory'], source_lang_code=source_lang_code, target_lang_code=target_lang_code)}"
                 f"Translate this {source_lang} passage to {target_lang} "
                 "without additional questions, disclaimer, or explanations, but accurately and completely:"
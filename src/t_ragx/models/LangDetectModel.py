@@ -1,9 +1,12 @@
 import abc
 from typing import Union
 
-import fasttext
 import regex
-from huggingface_hub import hf_hub_download
+
+from .._lazy import lazy_import
+
+fasttext = lazy_import("fasttext")
+huggingface_hub = lazy_import("huggingface_hub")
 
 
 class BaseLangDetectModel(metaclass=abc.ABCMeta):
@@ -50,7 +53,7 @@ class FastTextLangDetectModel(BaseLangDetectModel):
     def __init__(self, repo_id="facebook/fasttext-language-identification", filename="model.bin", hf_hub_args={}, *arg,
                  **kwargs):
         super().__init__(*arg, **kwargs)
-        fasttext_langid_model_path = hf_hub_download(repo_id=repo_id,
+        fasttext_langid_model_path = huggingface_hub.hf_hub_download(repo_id=repo_id,
                                                      filename=filename, **hf_hub_args)
         self.model = fasttext.load_model(fasttext_langid_model_path)
 
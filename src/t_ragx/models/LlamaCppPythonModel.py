@@ -1,13 +1,78 @@
+import hashlib
 import logging
+import os
+import pickle
+from collections import OrderedDict
 
-from llama_cpp import Llama
-
-from .BaseModel import BaseModel
+from .BaseModel import BaseModel, PROMPT_INSTRUCTION
 from ._utils import DummyTokenizer
+from .._lazy import lazy_import
+
+llama_cpp = lazy_import("llama_cpp")
 
 logging.getLogger("llama-cpp-python").setLevel(logging.WARNING)
 
 
+class PrefixStateCache:
+    """
+    llama.cpp states keyed by prompt prefix, kept in RAM (LRU) or on disk, bounded by capacity_bytes
+
+    A state is only valid for the model and context it was saved from, so the keys also hash the namespace, see
+    LlamaCppPythonModel.prefix_cache_namespace. The disk cache_dir can therefore be shared by several models
+    """
+
+    def __init__(self, mode="ram", capacity_bytes=2 << 30, cache_dir=".cache/t_ragx_llama_prefix", namespace=""):
+        if mode not in ("ram", "disk"):
+            raise ValueError("the prefix cache mode must be either 'ram' or 'disk'")
+        self.mode = mode
+        self.namespace = namespace
+        self.capacity_bytes = capacity_bytes
+        self.cache_dir = cache_dir
+        self._states = OrderedDict()
+        if mode == "disk":
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, prefix: str):
+        return hashlib.sha1(f"{self.namespace}\0{prefix}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        if self.mode == "ram":
+            if key in self._states:
+                self._states.move_to_end(key)
+            return self._states.get(key)
+
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        os.utime(path)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def set(self, key, state):
+        if self.mode == "ram":
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > 1 and sum(s.llama_state_size for s in self._states.values()) > \
+                    self.capacity_bytes:
+                self._states.popitem(last=False)
+            return
+
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, self._path(key))
+        # evict the least recently used states
+        paths = sorted((os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith(".pkl")),
+                       key=os.path.getmtime)
+        sizes = [os.path.getsize(p) for p in paths]
+        while len(paths) > 1 and sum(sizes) > self.capacity_bytes:
+            os.remove(paths.pop(0))
+            sizes.pop(0)
+
+
 class LlamaCppPythonModel(BaseModel):
     tokenizer = DummyTokenizer()
     model = None
@@ -21,17 +86,38 @@ class LlamaCppPythonModel(BaseModel):
                  chat_format="mistral-instruct",
                  reset_model=True,
                  model_config={'n_ctx': 2048},
+                 prefix_cache=None,
+                 prefix_cache_config={},
+                 prompt_prefix=PROMPT_INSTRUCTION,
                  ):
+        """
+
+        Args:
+            reset_model: clear the model context before every prompt
+            prefix_cache: None, 'ram' or 'disk'. Instead of clearing the context, restore the llama.cpp state saved
+                            after the first prompt with the same prefix, so that only the tokens after the shared
+                            prefix are evaluated
+            prefix_cache_config: capacity_bytes and cache_dir of the PrefixStateCache
+            prompt_prefix: the instruction shared by the prompts, see BaseModel.build_prompt. It is the only prefix
+                            cached, so that the cache keys stay the same from one batch to the next
+        """
 
         self.reset_model = reset_model
+        self.prompt_prefix = prompt_prefix
+        # the key of the prefix currently held in the model context
+        self._context_prefix_key = None
         if model is None:
-            model = Llama.from_pretrained(
+            model = llama_cpp.Llama.from_pretrained(
                 repo_id=repo_id,
                 filename=filename,
                 chat_format=chat_format,
                 **model_config
             )
         self.model = model
+        self.prefix_cache = None
+        if prefix_cache is not None:
+            self.prefix_cache = PrefixStateCache(mode=prefix_cache, namespace=self.prefix_cache_namespace(model),
+                                                 **prefix_cache_config)
         super().__init__(model_id="Dummy", tokenizer=self.tokenizer, model=model)
 
     def generate(self, input_text_list, generation_config={}):
@@ -54,17 +140,59 @@ class LlamaCppPythonModel(BaseModel):
                 "content": t
             }]
 
-            if self.reset_model:
+            prefix_key, prefix_cached = None, False
+            if self.prefix_cache is not None:
+                prefix_key, prefix_cached = self._restore_prefix(t)
+            elif self.reset_model:
                 self.model.reset()
+
             output = self.model.create_chat_completion(
                 messages,
                 **generation_config
             )
 
+            if prefix_key is not None and not prefix_cached:
+                self.prefix_cache.set(prefix_key, self.model.save_state())
+            self._context_prefix_key = prefix_key
+
             out_text.append(output['choices'][0]['message']['content'])
 
         return out_text
 
+    @staticmethod
+    def prefix_cache_namespace(model):
+        """
+        The model file, chat format and context size that a saved llama.cpp state depends on
+        """
+        return f"{model.model_path}|{model.chat_format}|n_ctx={model.n_ctx()}"
+
+    def _restore_prefix(self, text):
+        """
+        Make the model context start with the prefix of the text
+
+        llama.cpp only evaluates the prompt tokens after the longest common prefix with the tokens in the context, so
+        restoring a state that holds the prefix skips its evaluation. The context is cleared when nothing is cached
+
+        Returns:
+            the cache key of the prefix (None if the text has no known prefix), and whether a state holding the
+            prefix is already cached
+        """
+        if not self.prompt_prefix or not text.startswith(self.prompt_prefix):
+            self.model.reset()
+            return None, False
+
+        prefix_key = self.prefix_cache.key(self.prompt_prefix)
+        if prefix_key == self._context_prefix_key:
+            # the previous prompt had the same prefix, it is still in the context
+            return prefix_key, True
+
+        state = self.prefix_cache.get(prefix_key)
+        if state is not None:
+            self.model.load_state(state)
+        else:
+            self.model.reset()
+        return prefix_key, state is not None
+
     def tokenize(self,
                  text_list=None,
                  *args, **kwargs
@@ -1,7 +1,11 @@
-from openai import OpenAI
+import asyncio
 
+from ._http import HTTPEngine
 from .API_Model import APIModel
 from ._utils import DummyTokenizer as BaseDummyTokenizer
+from .._lazy import lazy_import
+
+openai = lazy_import("openai")
 
 
 class DummyTokenizer(BaseDummyTokenizer):
@@ -17,23 +21,47 @@ class OpenAIModel(APIModel):
     model = None
 
     def __init__(self, host='localhost', port=11434, endpoint='/v1', model="t_ragx_mistral",
-                 protocol="http", api_key='ollama'):
+                 protocol="http", api_key='ollama', engine: HTTPEngine = None):
         super().__init__(host=host, port=port, endpoint=endpoint, model=model,
-                         protocol=protocol)
+                         protocol=protocol, engine=engine)
 
-        self.openai_client = OpenAI(
-            base_url=f"{self.protocol}://{self.host}:{self.port}{self.endpoint}",
+        self.api_key = api_key
+        # the openai client pools its connections and retries 429/5xx with jittered backoff by itself
+        self.openai_client = openai.OpenAI(
+            base_url=self.url,
             api_key=api_key,
+            max_retries=self.engine.max_retries,
+        )
+
+    def _chat(self, chat, generation_config):
+        chat_completion = self.openai_client.chat.completions.create(
+            messages=chat,
+            model=self.model,
+            **generation_config
         )
+        return chat_completion.choices[0].message.content.strip()
 
     def generate(self, input_chat_list, generation_config={}):
-        out_text = []
-        for chat in input_chat_list:
-            chat_completion = self.openai_client.chat.completions.create(
-                messages=chat,
-                model=self.model,
-                **generation_config
-            )
-            out_text.append(chat_completion.choices[0].message.content.strip())
-
-        return out_text
+        """
+        Send the chats concurrently, at most engine.max_concurrency in flight, the outputs keep the input order
+        """
+        return self.engine.map(lambda chat: self._chat(chat, generation_config), input_chat_list)
+
+    async def agenerate(self, input_chat_list, generation_config={}):
+        """
+        The asyncio variant of generate
+        """
+        semaphore = asyncio.Semaphore(self.engine.max_concurrency)
+
+        async def chat_completion(client, chat):
+            async with semaphore:
+                completion = await client.chat.completions.create(
+                    messages=chat,
+                    model=self.model,
+                    **generation_config
+                )
+            return completion.choices[0].message.content.strip()
+
+        async with openai.AsyncOpenAI(base_url=self.url, api_key=self.api_key,
+                               max_retries=self.engine.max_retries) as client:
+            return await asyncio.gather(*[chat_completion(client, chat) for chat in input_chat_list])
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from .._lazy import lazy_import
+
+requests = lazy_import("requests")
+# the async engine is based on httpx, installed along with openai
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger("t_ragx")
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt, backoff_base=0.5, backoff_max=30.0, retry_after=None):
+    """
+    Full-jitter exponential backoff, a numeric Retry-After header is used as the lower bound
+    """
+    delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    if retry_after is not None:
+        try:
+            delay = max(delay, min(float(retry_after), backoff_max))
+        except ValueError:
+            pass
+    return delay
+
+
+class HTTPEngine:
+    """
+    A pooled HTTP client shared by the API models
+
+    Requests go through one keep-alive requests.Session, at most max_concurrency of them in flight, and are retried
+    with jittered exponential backoff on connection errors and 429/5xx responses
+    """
+
+    def __init__(self, max_concurrency=8, max_retries=5, backoff_base=0.5, backoff_max=30.0, timeout=(10, 600)):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix="t_ragx_http")
+            return self._executor
+
+    def post_json(self, url, payload: dict, **kwargs) -> dict:
+        """
+        POST a JSON payload and return the decoded JSON response
+
+        Raises:
+            requests.HTTPError: the server still answers with an error status after the retries
+            requests.ConnectionError, requests.Timeout: the server is still unreachable after the retries
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = self.session.post(url, json=payload, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+
+            if r.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                logger.debug(f"HTTP {r.status_code} from {url}, retry {attempt + 1}/{self.max_retries}")
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max,
+                                         r.headers.get("Retry-After")))
+                continue
+
+            r.raise_for_status()
+            return r.json()
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """
+        Apply fn to every item with at most max_concurrency calls in flight, the results keep the input order
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.session.close()
+
+
+class AsyncHTTPEngine:
+    """
+    The asyncio counterpart of HTTPEngine, based on httpx
+    """
+
+    def __init__(self, max_concurrency=8, max_retries=5, backoff_base=0.5, backoff_max=30.0, timeout=600):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def post_json(self, url, payload: dict, **kwargs) -> dict:
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    r = await self.client.post(url, json=payload, **kwargs)
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                    continue
+
+                if r.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max,
+                                                      r.headers.get("Retry-After")))
+                    continue
+
+                r.raise_for_status()
+                return r.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_default_engine: Optional[HTTPEngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def get_http_engine() -> HTTPEngine:
+    """
+    The process-wide HTTPEngine used by the API models unless one is given
+    """
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = HTTPEngine()
+        return _default_engine
@@ -1,18 +1,20 @@
+from __future__ import annotations
+
 import abc
 import typing
 
-import datasets
-import pandas as pd
-import torch
-from elasticsearch import Elasticsearch
-from elasticsearch import client as elastic_client
-from jinja2 import Template as JinjaTemplate
-from tqdm.autonotebook import tqdm
-
-from ._utils import get_glossary, file_cacher, merge_glossary_index
+from ._utils import get_glossary, file_cacher, merge_glossary_index, gather_memory
 from .constants import DEFAULT_GLOSSARY_PARQUET_FOLDER
+from .._lazy import lazy_import
 from ..utils.heuristic import clean_text
 
+datasets = lazy_import("datasets")
+pd = lazy_import("pandas")
+torch = lazy_import("torch")
+tqdm_autonotebook = lazy_import("tqdm.autonotebook")
+elasticsearch = lazy_import("elasticsearch")
+jinja2 = lazy_import("jinja2")
+
 
 class BaseInputProcessor(metaclass=abc.ABCMeta):
     """
@@ -23,8 +25,15 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
 
     def __init__(self,
                  device=None,
-                 prompt_template: typing.Optional[typing.Union[str, JinjaTemplate]] = None
+                 prompt_template: typing.Optional[typing.Union[str, jinja2.Template]] = None,
+                 file_cacher_args: dict = None
                  ):
+        """
+
+        Args:
+            file_cacher_args: the arguments of file_cacher used to download the glossary files, e.g.
+                                {'offline': True} or {'revalidate_after': 3600}
+        """
         self.device = device
         if device is None:
             self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -37,12 +46,13 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
         self.general_glossary_dict: dict = {}
         self.task_glossary: dict = {}
         self.glossary_parquet_folder = DEFAULT_GLOSSARY_PARQUET_FOLDER
+        self.file_cacher_args = file_cacher_args if file_cacher_args is not None else {}
 
     def load_general_translation(self,
                                  parquet_path,
                                  index_key='ja',
                                  elasticsearch_host: str = "localhost",
-                                 es_client: elastic_client = None,
+                                 es_client: elasticsearch.Elasticsearch = None,
                                  dataset_args={},
                                  elastic_args={},
                                  elastic_client_args={}
@@ -58,7 +68,7 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
 
         # initiate the elastic index
         if es_client is None:
-            es_client = Elasticsearch(
+            es_client = elasticsearch.Elasticsearch(
                 elasticsearch_host,  # Elasticsearch endpoint
                 **elastic_client_args
             )
@@ -91,21 +101,8 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
 
         mem_scores, mem_indices = self.general_memory.search_batch(search_index, text, k=k, **search_kwargs)
 
-        ref_trans_data = [self.general_memory[midx] for midx in mem_indices]
-
-        # truncate in case the example translations are too long
-        processed_output = []
-        for rtd, score_list in zip(ref_trans_data, mem_scores):
-            wide_output = []
-            key_list = list(rtd.keys())
-            for i in range(len(rtd[key_list[0]])):
-                wide_output.append({
-                    k: rtd[k][i][:max_item_len] for k in key_list
-                })
-                wide_output[-1]['score'] = score_list[i]
-            processed_output.append(wide_output)
-
-        return processed_output
+        # one columnar gather for the whole batch, truncated in case the example translations are too long
+        return gather_memory(self.general_memory, mem_indices, mem_scores, max_item_len=max_item_len)
 
     def search_task_memory(self, client=None):
         """
@@ -124,13 +121,14 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
         if glossary_parquet_folder is not None:
             self.glossary_parquet_folder = glossary_parquet_folder
         self.general_glossary_dict[f"{source_lang}_{target_lang}"] = pd.read_parquet(
-            file_cacher(f"{self.glossary_parquet_folder}/{source_lang}_{target_lang}.parquet")).to_dict("index")
+            file_cacher(f"{self.glossary_parquet_folder}/{source_lang}_{target_lang}.parquet",
+                        **self.file_cacher_args)).to_dict("index")
 
         return
 
     def load_task_glossary(self, glossary_parquet_path, glossary_index):
         # raise NotImplementedError()
-        task_glossary_df = pd.read_parquet(file_cacher(glossary_parquet_path))
+        task_glossary_df = pd.read_parquet(file_cacher(glossary_parquet_path, **self.file_cacher_args))
         clean_index_dict = {k: clean_text(k) for k in task_glossary_df.index}
         task_glossary_df.rename(index=clean_index_dict, inplace=True)
 
@@ -151,7 +149,7 @@ class BaseInputProcessor(metaclass=abc.ABCMeta):
                                         target_lang=target_lang)
             pass
 
-        return [_temp_search_glossary(t) for t in tqdm(text_list, disable=(not pbar))]
+        return [_temp_search_glossary(t) for t in tqdm_autonotebook.tqdm(text_list, disable=(not pbar))]
 
     def search_glossary(self, text, max_k=10, task_index=None, search_general_glossary=True, k=None, source_lang='ja',
                         target_lang='en'):
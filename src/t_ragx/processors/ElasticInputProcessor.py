@@ -1,76 +1,154 @@
+from __future__ import annotations
+
 import logging
-from operator import itemgetter
-from typing import List, Union
+from typing import Callable, List, Union
 
-import torch
-from Levenshtein import distance
-from elasticsearch import Elasticsearch
-from elasticsearch import client as elastic_client
-from tqdm.autonotebook import tqdm
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.process import cpdist
 
 from .BaseInputProcessor import BaseInputProcessor
+from .._lazy import lazy_import
 from ..utils.heuristic import clean_text
 
+np = lazy_import("numpy")
+torch = lazy_import("torch")
+tqdm_autonotebook = lazy_import("tqdm.autonotebook")
+elasticsearch = lazy_import("elasticsearch")
+
 logger = logging.getLogger("t_ragx")
 
 
-def rerank_elastic_result(elastic_result, source_lang, search_term, top_k=5):
-    if len(elastic_result) < 1:
-        return []
-    top_score = None
-    result_list = []
-    for r in elastic_result['hits']['hits']:
-        if top_score is None:
-            top_score = r['_score']
-        if r['_score'] < top_score and len(result_list) > top_k:
-            break
+def _segment_cumsum(values, hit_starts):
+    """cumulative sum restarting at every segment, hit_starts holds the start position of the segment of each value"""
+    total = np.cumsum(values)
+    return total - total[hit_starts] + values[hit_starts]
+
 
-        if source_lang not in r['_source']:
-            continue
-        r['distance'] = distance(r['_source'][source_lang], search_term)
-        result_list.append(r)
+def rerank_elastic_results(elastic_results, source_lang, search_term_list, top_k=5, bm25_weight=0.0,
+                           distance_weight=1.0, workers=-1):
+    """
+    Rerank the elastic results of a whole batch of search terms at once
+
+    For each search term, the candidates are the hits tied with the top score plus enough following hits to keep
+    more than top_k candidates. The Levenshtein distances of all (search term, candidate) pairs of the batch are
+    computed in a single rapidfuzz call, then the candidates are ordered by
+        bm25_weight * (_score / top _score of the search term) - distance_weight * normed_distance
+    where normed_distance is the distance divided by the search term length. The default weights rank by edit
+    distance only.
+
+    Args:
+        elastic_results: list of elastic responses, one per search term
+        source_lang: the field holding the source text
+        search_term_list: the search terms
+        top_k: number of hits kept per search term
+        bm25_weight: weight of the normalized elastic (BM25) score
+        distance_weight: weight of the normalized edit distance
+        workers: number of threads used by rapidfuzz, -1 to use all cores
+
+    Returns:
+        list of reranked hits per search term, each hit annotated with 'distance' and 'normed_distance'
+    """
+    hit_lists = [resp['hits']['hits'] if len(resp) > 0 else [] for resp in elastic_results]
+    hits = [r for hit_list in hit_lists for r in hit_list]
+    if not hits:
+        return [[] for _ in hit_lists]
+
+    # flatten the batch, each hit tagged with the index of its search term (segment)
+    seg_len = np.fromiter((len(hit_list) for hit_list in hit_lists), dtype=np.int64, count=len(hit_lists))
+    seg_ids = np.repeat(np.arange(len(hit_lists)), seg_len)
+    hit_starts = np.repeat(np.cumsum(seg_len) - seg_len, seg_len)
+    valid = np.fromiter((source_lang in r['_source'] for r in hits), dtype=bool, count=len(hits))
+    scores = np.fromiter((r['_score'] or 0 for r in hits), dtype=float, count=len(hits))
+
+    # candidates: stop at the first hit below the top score once more than top_k valid hits are collected
+    valid_before = _segment_cumsum(valid.astype(np.int64), hit_starts) - valid
+    stopped = _segment_cumsum(((scores < scores[hit_starts]) & (valid_before > top_k)).astype(np.int64),
+                              hit_starts) > 0
+    candidates = np.flatnonzero(valid & ~stopped)
+    cand_seg = seg_ids[candidates]
+
+    distances = cpdist([search_term_list[i] for i in cand_seg],
+                       [hits[i]['_source'][source_lang] for i in candidates],
+                       scorer=Levenshtein.distance, dtype=np.int32, workers=workers)
+    term_len = np.array([max(len(t), 1) for t in search_term_list], dtype=float)
+    normed_distances = distances / term_len[cand_seg]
+
+    rerank_scores = -distance_weight * normed_distances
+    if bm25_weight:
+        top_bm25 = np.zeros(len(hit_lists))
+        np.maximum.at(top_bm25, cand_seg, scores[candidates])
+        rerank_scores = rerank_scores + bm25_weight * scores[candidates] / np.where(top_bm25 > 0, top_bm25, 1)[
+            cand_seg]
+
+    # lexsort is stable, so the elastic order is kept among ties
+    order = np.lexsort((-rerank_scores, cand_seg))
+    cand_count = np.bincount(cand_seg, minlength=len(hit_lists))
+    rank = np.arange(len(order)) - np.repeat(np.cumsum(cand_count) - cand_count, cand_count)
+    order = order[rank < top_k]
+
+    reranked_list = [[] for _ in hit_lists]
+    for i, seg, d, nd in zip(candidates[order].tolist(), cand_seg[order].tolist(), distances[order].tolist(),
+                             normed_distances[order].tolist()):
+        r = hits[i]
+        r['distance'] = d
+        r['normed_distance'] = nd
+        reranked_list[seg].append(r)
+
+    return reranked_list
+
+
+def rerank_elastic_result(elastic_result, source_lang, search_term, top_k=5, **rerank_kwargs):
+    return rerank_elastic_results([elastic_result], source_lang, [search_term], top_k=top_k, **rerank_kwargs)[0]
+
+
+def elastic_query(search_term, source_lang, target_lang, top_k=10, task_index=None, task_boost=1.2):
+    """
+    The translation memory query body of a search term
+    """
+    indices_boost = []
+    if task_index is not None:
+        indices_boost.append({
+            task_index: task_boost
+        })
 
-    result_list = sorted(result_list, key=itemgetter('distance'))
-    return result_list[:top_k]
+    return {
+        "size": top_k,
+        "indices_boost": indices_boost,
+        "_source": {
+            "includes": [source_lang, target_lang, 'source']
+        },
+        "query": {
+            "bool": {
+                "must": [
+                    {
+                        "query_string": {
+                            "query": search_term,
+                            "fields": [
+                                source_lang
+                            ],
+                            "escape": True
+                        }
+                    },
+                ],
+                "filter": [
+                    {"exists": {"field": target_lang}},
+                ]
+            }
+        }
+    }
 
 
 def search_single_elastic(es_client, index, search_term, source_lang, target_lang, top_k=10, request_timeout=50,
                           task_index=None, task_boost=1.2):
     index_list = [index]
-    indices_boost = []
     if task_index is not None:
         index_list.append(task_index)
-        indices_boost.append({
-            task_index: task_boost
-        })
 
+    body = elastic_query(search_term, source_lang, target_lang, top_k=top_k, task_index=task_index,
+                         task_boost=task_boost)
     resp = es_client.search(
         index=index_list,
-        body={
-            "size": top_k,
-            "indices_boost": indices_boost,
-            "_source": {
-                "includes": [source_lang, target_lang, 'source']
-            },
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "query_string": {
-                                "query": search_term,
-                                "fields": [
-                                    source_lang
-                                ],
-                                "escape": True
-                            }
-                        },
-                    ],
-                    "filter": [
-                        {"exists": {"field": target_lang}},
-                    ]
-                }
-            }
-        },
+        body=body,
         request_timeout=request_timeout
     )
     return resp
@@ -88,24 +166,69 @@ def search_elastic_with_retry(es_client, index, search_term, source_lang, target
     return []
 
 
+def msearch_elastic(es_client, index, search_term_list, source_lang, target_lang, top_k=10, request_timeout=50,
+                    task_index=None, task_boost=1.2):
+    """
+    Search all the terms with one multi search request
+
+    The terms whose search failed are searched again one by one with search_elastic_with_retry
+
+    Returns:
+        the search response of each term, or None if the multi search request itself failed
+    """
+    index_list = [index]
+    if task_index is not None:
+        index_list.append(task_index)
+
+    searches = []
+    for search_term in search_term_list:
+        body = elastic_query(search_term, source_lang, target_lang, top_k=top_k, task_index=task_index,
+                             task_boost=task_boost)
+        searches += [{"index": index_list}, body]
+
+    try:
+        responses = es_client.msearch(body=searches, request_timeout=request_timeout)['responses']
+    except Exception as e:
+        logger.warning(f"elastic multi search failed, searching the terms one by one: {e}")
+        return None
+
+    return [
+        resp if 'error' not in resp else
+        search_elastic_with_retry(es_client, index, search_term, source_lang, target_lang, top_k=top_k,
+                                  task_index=task_index, task_boost=task_boost)
+        for search_term, resp in zip(search_term_list, responses)
+    ]
+
+
 def batch_search_elastic(es_client, index, search_term_list, source_lang, target_lang, top_k=10, rerank_top_k=5,
-                         pbar=False, task_index=None, task_boost=1.2, max_item_len=-1):
-    bulk_result = []
-    for search_term in tqdm(search_term_list, disable=(not pbar)):
-        search_result = search_elastic_with_retry(es_client, index, search_term, source_lang, target_lang, top_k=top_k,
-                                                  task_index=task_index, task_boost=task_boost)
+                         pbar=False, task_index=None, task_boost=1.2, max_item_len=-1,
+                         rerank_fn: Callable = rerank_elastic_results, msearch=False, **rerank_kwargs):
+    """
+
+    Args:
+        msearch: search the terms with one multi search request instead of one request per term
+    """
+    search_result_list = None
+    if msearch and len(search_term_list) > 1:
+        search_result_list = msearch_elastic(es_client, index, search_term_list, source_lang, target_lang,
+                                             top_k=top_k, task_index=task_index, task_boost=task_boost)
+    if search_result_list is None:
+        search_result_list = [
+            search_elastic_with_retry(es_client, index, search_term, source_lang, target_lang, top_k=top_k,
+                                      task_index=task_index, task_boost=task_boost)
+            for search_term in tqdm_autonotebook.tqdm(search_term_list, disable=(not pbar))
+        ]
 
+    bulk_result = []
+    for search_result in search_result_list:
         # truncate if the max_item_len variable is set
-        for r in search_result['hits']['hits']:
+        for r in (search_result['hits']['hits'] if len(search_result) > 0 else []):
             r['_source'][source_lang] = r['_source'][source_lang][:max_item_len]
             r['_source'][target_lang] = r['_source'][target_lang][:max_item_len]
 
         bulk_result.append(search_result)
 
-    return [
-        rerank_elastic_result(resp, source_lang, search_term, top_k=rerank_top_k) for search_term, resp in
-        zip(search_term_list, bulk_result)
-    ]
+    return rerank_fn(bulk_result, source_lang, search_term_list, top_k=rerank_top_k, **rerank_kwargs)
 
 
 class ElasticInputProcessor(BaseInputProcessor):
@@ -115,14 +238,15 @@ class ElasticInputProcessor(BaseInputProcessor):
 
     def __init__(self,
                  device=None,
+                 file_cacher_args: dict = None
                  ):
         self.device = device
         if device is None:
             self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        super().__init__()
+        super().__init__(device=self.device, file_cacher_args=file_cacher_args)
 
     def load_general_translation(self, elastic_index="translation_memory", elasticsearch_host: str = "localhost",
-                                 es_client: elastic_client = None, elastic_args={},
+                                 es_client: elasticsearch.Elasticsearch = None, elastic_args={},
                                  elastic_client_args={}, **kwargs):
         """
         Load the general translation examples
@@ -130,7 +254,7 @@ class ElasticInputProcessor(BaseInputProcessor):
 
         # initiate the elastic index
         if es_client is None:
-            es_client = Elasticsearch(
+            es_client = elasticsearch.Elasticsearch(
                 elasticsearch_host,  # Elasticsearch endpoint
                 **elastic_client_args
             )
@@ -149,9 +273,14 @@ class ElasticInputProcessor(BaseInputProcessor):
     def search_memory(self, text_list: Union[List[str], str], search_index: str = None, source_lang='ja',
                       target_lang='en', top_k=10,
                       rerank_top_k=None, max_item_len=500, pbar=False, task_index=None, task_boost=1.2,
-                      **search_kwargs):
+                      bm25_weight=0.0, distance_weight=1.0, rerank_fn: Callable = rerank_elastic_results,
+                      msearch=False, **search_kwargs):
         """
         search general translation examples using elasticsearch
+
+        The hits of the whole batch are reranked by rerank_fn, by default a weighted sum of the normalized elastic
+        (BM25) score and the normalized Levenshtein distance, see rerank_elastic_results. With msearch=True, the texts
+        are searched with one multi search request instead of one request per text
         """
         if isinstance(text_list, str):
             text_list = [text_list]
@@ -166,14 +295,12 @@ class ElasticInputProcessor(BaseInputProcessor):
         search_result_list = batch_search_elastic(self.es_client, search_index, text_list, source_lang, target_lang,
                                                   top_k=top_k, rerank_top_k=rerank_top_k, pbar=pbar,
                                                   task_index=task_index, task_boost=task_boost,
-                                                  max_item_len=max_item_len)
+                                                  max_item_len=max_item_len, rerank_fn=rerank_fn, msearch=msearch,
+                                                  bm25_weight=bm25_weight, distance_weight=distance_weight)
 
-        processed_output = [[{'score': r['_score'], 'distance': r['distance']} | r['_source'] for r in search_result]
+        # "normed_distance" is the Levenshtein distance divided by the search term length
+        processed_output = [[{'score': r['_score'], 'distance': r['distance']} | r['_source'] |
+                             {'normed_distance': r['normed_distance']} for r in search_result]
                             for search_result in search_result_list]
 
-        # "normed_distance" is the Levenshtein
-        for t, l in zip(text_list, processed_output):
-            for d in l:
-                d['normed_distance'] = d['distance'] / len(t)
-
         return processed_output
@@ -1,16 +1,24 @@
 import base64
+import hashlib
 import json
+import logging
 import os.path
 import pathlib
 import tempfile
-import urllib.request
-from hashlib import md5
-import numpy as np
-
-import requests
+import threading
+import time
 
+from .constants import DEFAULT_CACHE_REVALIDATE_SECONDS
+from .._lazy import lazy_import
 from ..utils.heuristic import clean_text
 
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+requests = lazy_import("requests")
+
+logger = logging.getLogger("t_ragx")
+
 
 def serialize_str(s):
     return json.dumps(s, ensure_ascii=False)
@@ -79,37 +87,225 @@ def get_glossary(text, glossary_index, max_k=10, lang_code='en', source_lang='ja
     return out_dict
 
 
-def get_http_file_id(url):
-    response = requests.head(url)
+def truncate_table(table, max_item_len):
+    """
+    Truncate the string and list columns of an Arrow table to at most max_item_len characters/ items
+    """
+    columns = []
+    for column in table.columns:
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = pc.utf8_slice_codeunits(column, 0, max_item_len)
+        elif pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+            column = pc.list_slice(column, 0, max_item_len)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+
+def gather_memory(dataset, mem_indices, mem_scores, max_item_len=500):
+    """
+    Gather the translation memory rows of a batch of search results from a huggingface dataset
+
+    All the rows are taken from the Arrow table at once and truncated with the Arrow string kernels, then split per
+    query
+
+    Returns:
+        a list of {column: value, ..., 'score': score} lists, one per query
+    """
+    counts = [len(idx) for idx in mem_indices]
+    flat_indices = [int(i) for idx in mem_indices for i in idx]
+    if len(flat_indices) == 0:
+        return [[] for _ in counts]
+
+    columns = dataset.format['columns']
+    if getattr(dataset, '_indices', None) is None:
+        # a single Arrow take, the datasets gather slices the table once per row
+        table = dataset.data.table.select(columns).take(flat_indices)
+    else:
+        # selected/ shuffled datasets map the indices first
+        table = dataset.with_format("arrow", columns=columns)[flat_indices]
+    table = truncate_table(table, max_item_len)
+    rows = table.to_pylist()
+
+    processed_output = []
+    offset = 0
+    for count, score_list in zip(counts, mem_scores):
+        query_rows = rows[offset:offset + count]
+        for row, score in zip(query_rows, score_list):
+            row['score'] = score
+        processed_output.append(query_rows)
+        offset += count
+    return processed_output
+
+
+def get_http_file_id(url, timeout=None):
+    response = requests.head(url, timeout=timeout, allow_redirects=True)
     # use ETag if available
     if 'ETag' in response.headers:
         return response.headers['ETag'].replace('"', "")
 
     # use encoded url path if ETag is not available
-    return md5(base64.urlsafe_b64encode(url.encode())).hexdigest()
+    return hashlib.md5(base64.urlsafe_b64encode(url.encode())).hexdigest()
+
+
+_manifest_lock = threading.Lock()
+_url_locks = {}
+
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_manifest(manifest_path, url, entry):
+    """
+    Re-read the manifest and replace it atomically, so processes sharing the cache folder do not drop each other's
+    entries except in a simultaneous update
+    """
+    with _manifest_lock:
+        manifest = _load_manifest(manifest_path)
+        manifest[url] = entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(manifest_path), suffix=".manifest.tmp")
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, manifest_path)
+
+
+def _sha256_file(path, chunk_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _is_intact(entry, verify_checksum=False):
+    if entry is None or not os.path.isfile(entry['path']) or os.path.getsize(entry['path']) != entry['size']:
+        return False
+    return not verify_checksum or _sha256_file(entry['path']) == entry['sha256']
 
 
-def file_cacher(file_path, tempfolder=None):
+def _download(url, out_path, timeout=None):
+    """
+    Download to a temporary file next to out_path and rename it into place, concurrent downloads of the same file
+    never expose a partial file
+
+    Returns:
+        (size, sha256)
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix=".download")
+    try:
+        with os.fdopen(fd, "wb") as f, requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+
+            expected_size = response.headers.get('Content-Length')
+            if expected_size is not None and 'Content-Encoding' not in response.headers and \
+                    int(expected_size) != size:
+                raise IOError(f"incomplete download of {url}: {size} of {expected_size} bytes")
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size, sha256.hexdigest()
+
+
+def file_cacher(file_path, tempfolder=None, revalidate_after=DEFAULT_CACHE_REVALIDATE_SECONDS, offline=None,
+                verify_checksum=False, timeout=(10, 600)):
     """
     If the input file_path is a http url, cache the file (by ETag if possible) to local tempfolder
 
+    The cached files are recorded in tempfolder/manifest.json with their URL, ETag, size, sha256, and fetch time.
+    A cached file is used without any request until revalidate_after seconds after its last validation, then its
+    ETag is checked with a HEAD request. If the server cannot be reached, the cached file is used
+
     Args:
-        file_path:
-        tempfolder:
+        file_path: a local path or a http url
+        tempfolder: the cache folder, defaults to <system temp folder>/t_ragx
+        revalidate_after: seconds between the ETag checks of a cached file, None never revalidates
+        offline: never touch the network, only cached files are used. Defaults to the T_RAGX_OFFLINE environment
+                    variable
+        verify_checksum: check the sha256 of the cached file on every call, otherwise only its size is checked
+        timeout: the requests timeout of the HEAD and download requests
 
     Returns:
+        the local path of the file
 
+    Raises:
+        FileNotFoundError: offline and the url is not cached
     """
+    if "http" not in file_path:
+        return file_path
+
     if tempfolder is None:
         tempfolder = tempfile.gettempdir() + "/t_ragx"
-        pathlib.Path(tempfolder).mkdir(parents=True, exist_ok=True)
-    out_path = file_path
-    if "http" in file_path:
-        file_id = get_http_file_id(file_path)
-        file_extension = pathlib.Path(file_path).suffix
-        out_path = f"{tempfolder}/{file_id}{file_extension}"
+    pathlib.Path(tempfolder).mkdir(parents=True, exist_ok=True)
+
+    if offline is None:
+        offline = os.environ.get("T_RAGX_OFFLINE", "").lower() in ("1", "true", "yes")
+
+    manifest_path = f"{tempfolder}/manifest.json"
+    entry = _load_manifest(manifest_path).get(file_path)
+    intact = _is_intact(entry, verify_checksum=verify_checksum)
+
+    if offline:
+        if not intact:
+            raise FileNotFoundError(f"{file_path} is missing or damaged in the cache {tempfolder} and offline mode "
+                                    f"is on")
+        return entry['path']
+
+    if intact and (revalidate_after is None or time.time() - entry['validated_at'] < revalidate_after):
+        return entry['path']
+
+    # one revalidation/ download per url at a time in this process
+    with _manifest_lock:
+        url_lock = _url_locks.setdefault(file_path, threading.Lock())
+    with url_lock:
+        return _revalidate(file_path, tempfolder, manifest_path, revalidate_after, verify_checksum, timeout)
+
+
+def _revalidate(file_path, tempfolder, manifest_path, revalidate_after, verify_checksum, timeout):
+    # another thread may have refreshed the entry while this one waited for the url lock
+    entry = _load_manifest(manifest_path).get(file_path)
+    intact = _is_intact(entry, verify_checksum=verify_checksum)
+    now = time.time()
+    if intact and (revalidate_after is None or now - entry['validated_at'] < revalidate_after):
+        return entry['path']
+
+    try:
+        file_id = get_http_file_id(file_path, timeout=timeout)
+    except requests.RequestException as e:
+        if intact:
+            logger.warning(f"could not revalidate {file_path}, using the cached file: {e}")
+            return entry['path']
+        raise
 
-        if not os.path.isfile(out_path):
-            urllib.request.urlretrieve(file_path, out_path)
+    if intact and entry['etag'] == file_id:
+        _update_manifest(manifest_path, file_path, entry | {'validated_at': now})
+        return entry['path']
 
+    file_extension = pathlib.Path(file_path).suffix
+    # weak ETags look like W/"..."
+    out_path = f"{tempfolder}/{file_id.replace('/', '_')}{file_extension}"
+    size, sha256 = _download(file_path, out_path, timeout=timeout)
+    _update_manifest(manifest_path, file_path, {
+        'url': file_path,
+        'etag': file_id,
+        'path': out_path,
+        'size': size,
+        'sha256': sha256,
+        'fetched_at': now,
+        'validated_at': now,
+    })
+    # the file of the previous ETag is superseded
+    if entry is not None and entry['path'] != out_path and os.path.isfile(entry['path']):
+        os.remove(entry['path'])
     return out_path
@@ -1,3 +1,6 @@
 DEFAULT_GLOSSARY_PARQUET_FOLDER = "https://t-ragx-public.s3.us-west-004.backblazeb2.com/glossary"
 
 DEFAULT_MEMORY_INDEX = "translation_memory"
+
+# seconds before a cached glossary file is checked against its URL again
+DEFAULT_CACHE_REVALIDATE_SECONDS = 24 * 60 * 60
@@ -0,0 +1,391 @@
+"""
+A local HTTP translation service around TRagx
+
+Concurrent requests are gathered into micro-batches, so one memory search, one glossary search, and one generation
+round serve all the texts that arrived within a few milliseconds of each other.
+
+Endpoints:
+    POST /translate  {"text": "...", "source_lang": "ja", "target_lang": "en", "pre_text": [preceding texts]}
+                     or {"texts": [...], ...}, answers {"translation": "..."} or {"translations": [...]}
+    GET  /metrics    queue depth, batch sizes, and latency histograms as JSON
+    GET  /health     {"status": "ok"}
+"""
+import bisect
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("t_ragx")
+
+# upper bounds in seconds, the last bucket is +inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram, the quantiles are estimated by the upper bound of the bucket they fall in
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count > 0 else None,
+                'p50': self.quantile(0.5),
+                'p90': self.quantile(0.9),
+                'p99': self.quantile(0.99),
+                'buckets': {str(bound): count for bound, count in zip(self.buckets + ("+inf",), self.counts)},
+            }
+
+
+class _Request:
+    __slots__ = ('text', 'pre_text', 'lang_pair', 'future', 'enqueued')
+
+    def __init__(self, text, pre_text, lang_pair):
+        self.text = text
+        self.pre_text = pre_text
+        self.lang_pair = lang_pair
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Gathers the texts submitted from many threads into batches for TRagx.batch_translate
+
+    A worker takes the first queued text, then waits at most max_wait_ms for more, up to max_batch_size texts. The
+    texts are grouped by language pair, each group is translated with a single batch_translate call
+    """
+
+    def __init__(self, translator, max_batch_size=32, max_wait_ms=5, max_queue_size=1024, num_workers=1,
+                 translate_args: dict = None):
+        """
+
+        Args:
+            translator: a TRagx instance
+            max_batch_size: the maximum number of texts per batch
+            max_wait_ms: how long a batch may wait for more texts after its first text
+            max_queue_size: submit raises queue.Full beyond this many waiting texts
+            num_workers: number of batches translated concurrently
+            translate_args: other arguments of TRagx.batch_translate, e.g. memory_search_args
+        """
+        self.translator = translator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.translate_args = translate_args if translate_args is not None else {}
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.queue_wait = Histogram()
+        self.batch_latency = Histogram()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.max_queue_depth = 0
+        self.errors = 0
+        # serializes the submitters, so that a capacity check holds until the texts are queued, and guards the
+        # counters updated by several threads
+        self._submit_lock = threading.Lock()
+
+        self._stopped = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"t_ragx_batcher_{i}", daemon=True) for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, text, source_lang_code='ja', target_lang_code='en', pre_text: list = None) -> Future:
+        """
+        Queue a text for translation
+
+        Raises:
+            queue.Full: the queue already holds max_queue_size texts
+        """
+        return self.submit_many([text], source_lang_code, target_lang_code, pre_text_list=[pre_text])[0]
+
+    def submit_many(self, texts: list, source_lang_code='ja', target_lang_code='en',
+                    pre_text_list: list = None) -> list:
+        """
+        Queue several texts for translation, either all of them or none
+
+        Returns:
+            the futures of the texts, in order
+
+        Raises:
+            queue.Full: the queue has no room for all the texts, none of them is queued
+        """
+        if pre_text_list is None:
+            pre_text_list = [None] * len(texts)
+        requests = [_Request(text, pre_text, (source_lang_code, target_lang_code))
+                    for text, pre_text in zip(texts, pre_text_list)]
+        with self._submit_lock:
+            # the workers only take texts out, so the room can only grow until the texts are queued
+            if self.queue.maxsize > 0 and self.queue.maxsize - self.queue.qsize() < len(requests):
+                raise queue.Full
+            for request in requests:
+                self.queue.put_nowait(request)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return [request.future for request in requests]
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while not self._stopped.is_set():
+            # the requests whose client gave up are skipped
+            batch = [request for request in self._next_batch() if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.lang_pair, []).append(request)
+
+            for (source_lang_code, target_lang_code), requests in groups.items():
+                start = time.perf_counter()
+                for request in requests:
+                    self.queue_wait.observe(start - request.enqueued)
+                self.batch_size.observe(len(requests))
+
+                try:
+                    translations = self.translator.batch_translate(
+                        [r.text for r in requests],
+                        pre_text_list=[r.pre_text for r in requests],
+                        batch_size=len(requests),
+                        source_lang_code=source_lang_code,
+                        target_lang_code=target_lang_code,
+                        pbar=False,
+                        **self.translate_args
+                    )
+                except Exception as e:
+                    logger.exception(f"batch of {len(requests)} texts failed")
+                    with self._submit_lock:
+                        self.errors += 1
+                    for request in requests:
+                        request.future.set_exception(e)
+                    continue
+
+                self.batch_latency.observe(time.perf_counter() - start)
+                for request, translation in zip(requests, translations):
+                    request.future.set_result(translation)
+
+    def stop(self):
+        self._stopped.set()
+        for worker in self._workers:
+            worker.join()
+
+    def metrics(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'errors': self.errors,
+            'queue_wait_seconds': self.queue_wait.snapshot(),
+            'batch_seconds': self.batch_latency.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+        }
+
+
+def _is_str_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _parse_translate_request(payload, source_lang_code, target_lang_code):
+    """
+    Validate the JSON body of a POST /translate request
+
+    Args:
+        payload: the decoded JSON body
+        source_lang_code: the source language when the body has no "source_lang"
+        target_lang_code: the target language when the body has no "target_lang"
+
+    Returns:
+        the texts, the source and target language codes, the preceding texts of each text, and whether the body held
+        a list of texts
+
+    Raises:
+        ValueError: the body is not a valid translation request
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("the body must be a JSON object")
+
+    source_lang_code = payload.get('source_lang', source_lang_code)
+    target_lang_code = payload.get('target_lang', target_lang_code)
+    if not isinstance(source_lang_code, str) or not isinstance(target_lang_code, str):
+        raise ValueError("source_lang and target_lang must be strings")
+
+    if 'texts' in payload:
+        texts = payload['texts']
+        if not _is_str_list(texts) or len(texts) == 0:
+            raise ValueError("texts must be a non-empty list of strings")
+        return texts, source_lang_code, target_lang_code, [None] * len(texts), True
+
+    text = payload.get('text')
+    if not isinstance(text, str):
+        raise ValueError("text must be a string")
+    # the preceding texts of a single text
+    pre_text = payload.get('pre_text')
+    if pre_text is not None and not _is_str_list(pre_text):
+        raise ValueError("pre_text must be a list of strings")
+    return [text], source_lang_code, target_lang_code, [pre_text], False
+
+
+def _wait_results(futures, deadline):
+    """
+    The results of the futures, in order
+
+    Raises:
+        TimeoutError: the deadline (time.perf_counter) passed, the futures still waiting in the queue are cancelled
+    """
+    try:
+        return [f.result(timeout=max(deadline - time.perf_counter(), 0)) for f in futures]
+    except TimeoutError:
+        # the texts still waiting in the queue are not translated
+        for f in futures:
+            f.cancel()
+        raise
+
+
+class TranslationRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "TranslationServer"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts, source_lang_code, target_lang_code, pre_text_list, multi = _parse_translate_request(
+                payload, self.server.source_lang_code, self.server.target_lang_code)
+        except ValueError as e:
+            self._send_json(400, {'error': f"invalid request: {e}"})
+            return
+
+        try:
+            futures = self.server.batcher.submit_many(texts, source_lang_code, target_lang_code,
+                                                      pre_text_list=pre_text_list)
+        except queue.Full:
+            self._send_json(503, {'error': "the translation queue is full"})
+            return
+
+        try:
+            translations = _wait_results(futures, start + self.server.request_timeout)
+        except TimeoutError:
+            self._send_json(504, {'error': "translation timed out"})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self.server.request_latency.observe(time.perf_counter() - start)
+        if multi:
+            self._send_json(200, {'translations': translations})
+        else:
+            self._send_json(200, {'translation': translations[0]})
+
+
+class TranslationServer(ThreadingHTTPServer):
+    """
+    A threading HTTP server answering translation requests through a MicroBatcher
+    """
+    daemon_threads = True
+
+    def __init__(self, translator, server_address=("127.0.0.1", 8000), source_lang_code='ja',
+                 target_lang_code='en', request_timeout=300, **batcher_args):
+        """
+
+        Args:
+            translator: a TRagx instance
+            server_address: (host, port), port 0 picks a free port
+            source_lang_code: the source language of the requests without "source_lang"
+            target_lang_code: the target language of the requests without "target_lang"
+            request_timeout: seconds a request may wait for its translation
+            batcher_args: the arguments of MicroBatcher
+        """
+        super().__init__(server_address, TranslationRequestHandler)
+        self.source_lang_code = source_lang_code
+        self.target_lang_code = target_lang_code
+        self.request_timeout = request_timeout
+        self.request_latency = Histogram()
+        self.batcher = MicroBatcher(translator, **batcher_args)
+
+    def metrics(self):
+        return self.batcher.metrics() | {'request_seconds': self.request_latency.snapshot()}
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
+
+
+def serve(translator, host="127.0.0.1", port=8000, **server_args):
+    """
+    Serve translations until interrupted, see TranslationServer for the arguments
+    """
+    server = TranslationServer(translator, (host, port), **server_args)
+    logger.info(f"serving translations on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
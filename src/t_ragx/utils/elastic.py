@@ -177,19 +177,23 @@
 #         logger.warning(f"The columns of the CSV are {df.columns}")
 
 #     upload_df(df, es_client, id_key=id_key, batch_size=batch_size, index=index)
+from __future__ import annotations
+
 import json
 import logging
+import os
+from collections import deque
 from hashlib import sha1
 
-import numpy as np
-import pandas as pd
-from elasticsearch import Elasticsearch
-from tqdm import tqdm
-
-from .heuristic import clean_text, is_noise
-from .heuristic import lang_detect as heuristic_lang_detect
+from .._lazy import lazy_import
 from ..processors.constants import DEFAULT_MEMORY_INDEX
 
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+elasticsearch = lazy_import("elasticsearch")
+es_helpers = lazy_import("elasticsearch.helpers")
+tqdm = lazy_import("tqdm")
+
 logger = logging.getLogger("t_ragx")
 
 # 仅保留中英文语言配置
@@ -198,6 +202,16 @@ EN_ZH_LANG_CODES = {
     'zh': 'Chinese'
 }
 
+# pandas 的 str 方法（re 或 pyarrow 的 RE2）不支持 \p{Han} 等 Unicode 属性，这里用常用区段近似 heuristic.lang_detect
+# 使用普通字符串让 Python 展开 \u 转义，两种正则后端都能识别
+_ZH_CHAR_PATTERN = ("[\u2e80-\u2fdf\u3005\u3007\u3021-\u3029\u3038-\u303b\u3400-\u4dbf\u4e00-\u9fff"
+                    "\uf900-\ufaff\U00020000-\U0003134f]")
+_JA_CHAR_PATTERN = "[\u3041-\u309f\u30a0-\u30fa\u30fd-\u30ff\u31f0-\u31ff\uff66-\uff6f\uff71-\uff9d]"
+_EN_CHAR_PATTERN = r"[a-zA-Z]"
+
+# 与 heuristic.is_number / is_date 等价的整串匹配模式
+_NOISE_PATTERN = r"\d+\.?\d*|\d+年\d+月|\d+年\d+月\d+日|\d+年|\d+月\d+日|\d+日|\d+月"
+
 
 def index_doc(df, index="translation_memory_demo"):
     """生成索引操作的格式化数据"""
@@ -228,9 +242,44 @@ def upsert_doc(df: pd.DataFrame, index: str = None):
         yield '{ "doc" : %s, "doc_as_upsert" : true }' % json.dumps(record, default=int)
 
 
+def vectorized_lang_detect(text: pd.Series) -> pd.Series:
+    """
+    heuristic.lang_detect 的向量化版本：统计日/英/中字符数，取最多者（并列时按 ja、en、zh 的顺序）
+
+    Returns:
+        与输入同索引的语言代码 Series，空值对应 NaN
+    """
+    counts = pd.DataFrame({
+        'ja': text.str.count(_JA_CHAR_PATTERN),
+        'en': text.str.count(_EN_CHAR_PATTERN),
+        'zh': text.str.count(_ZH_CHAR_PATTERN),
+    }, index=text.index).fillna(0)
+    if len(counts) == 0:
+        return pd.Series(index=text.index, dtype=object)
+    return counts.idxmax(axis=1).where(text.notna())
+
+
+def hash_ids(values: pd.Series, method: str = 'sha1') -> pd.Series:
+    """
+    为一列文本生成文档ID
+
+    Args:
+        values: 用于生成ID的文本列
+        method: 'sha1' 与 upsert_doc 生成的ID一致（可与已有索引合并）；
+                'hash64' 使用 pandas 的向量化 64 位哈希，速度更快但ID与 sha1 不兼容
+    """
+    if method == 'sha1':
+        ids = [sha1(v).hexdigest() for v in values.str.encode('utf8')]
+    elif method == 'hash64':
+        ids = pd.util.hash_array(values.to_numpy(dtype=object)).astype(str)
+    else:
+        raise ValueError(f"不支持的ID哈希方法: {method}")
+    return pd.Series(ids, index=values.index)
+
+
 def filter_df_en_zh(df: pd.DataFrame, source_lang: str = 'en', lang_cols: list = None):
     """
-    过滤并清洗中英文翻译数据
+    过滤并清洗中英文翻译数据（全部使用向量化的 str 操作）
     
     Args:
         df: 包含中英文列的数据框
@@ -249,18 +298,21 @@ def filter_df_en_zh(df: pd.DataFrame, source_lang: str = 'en', lang_cols: list =
     if source_lang not in lang_cols:
         raise ValueError(f"源语言列 '{source_lang}' 不在数据框列中")
     
-    # 移除所有语言列都为空的行
-    df.dropna(subset=lang_cols, how='all', inplace=True)
+    # 移除所有语言列都为空的行，以及无法生成ID的行
+    df = df.dropna(subset=lang_cols, how='all')
+    df = df[df[source_lang].notna()]
     
     # 基于源语言去重
-    df.drop_duplicates(subset=[source_lang], inplace=True)
+    df = df.drop_duplicates(subset=[source_lang])
     
-    # 清理源语言文本
-    df[source_lang] = df[source_lang].apply(clean_text)
+    # 整列为空的分块会被 read_csv 推断为 float，统一转为 object 以便使用 str 方法
+    # 同时清理源语言文本（等价于 heuristic.clean_text）
+    df = df.astype({c: object for c in lang_cols}).assign(
+        **{source_lang: lambda d: d[source_lang].astype(str).str.normalize('NFKD').str.strip()}
+    )
     
-    # 移除噪音文本
-    df = df[~df[source_lang].map(is_noise)]
-    df.reset_index(drop=True, inplace=True)
+    # 移除噪音文本（纯数字或日期）
+    df = df[~df[source_lang].str.fullmatch(_NOISE_PATTERN)]
 
     # 移除包含换行符的文本（避免格式问题）
     for c in lang_cols:
@@ -277,19 +329,225 @@ def filter_df_en_zh(df: pd.DataFrame, source_lang: str = 'en', lang_cols: list =
 
     # 语言检测验证（确保列内容与语言代码匹配）
     for c in lang_cols:
-        detected_lang = df[c].apply(heuristic_lang_detect)
+        detected_lang = vectorized_lang_detect(df[c])
         if c == 'zh':
             # 允许中文变体（zh-cn/zh-tw等）
-            df = df[(detected_lang.str.startswith('zh')) | (detected_lang.isna())]
+            df = df[(detected_lang.str.startswith('zh', na=True))]
         else:  # en
             df = df[(detected_lang == 'en') | (detected_lang.isna())]
 
-    df.reset_index(drop=True, inplace=True)
+    df = df.reset_index(drop=True)
     return df
 
 
-def upload_df_en_zh(df: pd.DataFrame, es_client: Elasticsearch, id_key: str = 'en', batch_size: int = 10000,
-                   index: str = None) -> None:
+def df_to_upsert_actions(df: pd.DataFrame, index: str = None, id_key: str = 'en', id_hash: str = 'sha1'):
+    """
+    将数据框转换为 (action, NDJSON body) 二元组，供 parallel_bulk 使用
+
+    文档体按空值模式分组后用 DataFrame.to_json 一次性序列化，空值字段不会写入文档，
+    因此不会在 upsert 合并时覆盖已有字段。
+    """
+    if index is None:
+        index = DEFAULT_MEMORY_INDEX
+    if len(df) < 1:
+        return
+
+    ids = hash_ids(df[id_key], method=id_hash).to_numpy()
+    null_mask = df.isna().to_numpy()
+    # 同一空值模式的行一起序列化
+    _, pattern_idx = np.unique(null_mask, axis=0, return_inverse=True)
+    for pattern in np.unique(pattern_idx):
+        rows = np.flatnonzero(pattern_idx == pattern)
+        cols = df.columns[~null_mask[rows[0]]]
+        ndjson = df.iloc[rows][cols].to_json(orient="records", lines=True, force_ascii=False)
+        # to_json 会转义字符串内的换行，因此可以安全地按行切分
+        for doc_id, body in zip(ids[rows], ndjson.rstrip("\n").split("\n")):
+            yield (
+                {"update": {"_index": index, "_id": doc_id, "retry_on_conflict": 3}},
+                '{"doc":%s,"doc_as_upsert":true}' % body
+            )
+
+
+def _bulk_passthrough(action):
+    # df_to_upsert_actions 已生成 (action, body)，无需再展开
+    return action
+
+
+def _read_checkpoint(checkpoint_path: str, file_path: str, index: str, id_key: str) -> dict:
+    if checkpoint_path is None or not os.path.isfile(checkpoint_path):
+        return {}
+    with open(checkpoint_path, 'r', encoding='utf8') as f:
+        checkpoint = json.load(f)
+
+    stat = os.stat(file_path)
+    if checkpoint.get('file_size') != stat.st_size or checkpoint.get('file_mtime') != stat.st_mtime:
+        logger.warning(f"CSV文件已变化，忽略断点文件 {checkpoint_path}")
+        return {}
+    if checkpoint.get('index') != index or checkpoint.get('id_key', id_key) != id_key:
+        logger.warning(f"断点文件 {checkpoint_path} 属于索引 {checkpoint.get('index')}"
+                       f"（id_key={checkpoint.get('id_key')}），与本次导入不符，忽略")
+        return {}
+    if 'rows_committed' not in checkpoint:
+        # 旧版本断点只记录了分块序号，按写入时的 chunksize 换算为行数
+        if 'chunksize' not in checkpoint:
+            logger.warning(f"断点文件 {checkpoint_path} 缺少已提交行数，忽略")
+            return {}
+        checkpoint['rows_committed'] = checkpoint.get('chunks_committed', 0) * checkpoint['chunksize']
+    return checkpoint
+
+
+def _write_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _resume_checkpoint(checkpoint_path: str, file_path: str, index: str, id_key: str, read_csv_config: dict) -> dict:
+    """
+    读取断点文件，返回已提交的统计信息，并在 read_csv_config 中设置 skiprows 以跳过已提交的数据行
+    """
+    checkpoint = _read_checkpoint(checkpoint_path, file_path, index, id_key)
+    stats = {
+        'chunks': checkpoint.get('chunks_committed', 0),
+        'rows': checkpoint.get('rows_committed', 0),
+        'success': checkpoint.get('success', 0),
+        'failed': checkpoint.get('failed', 0),
+    }
+    if stats['rows'] > 0:
+        logger.info(f"从断点继续：跳过前 {stats['rows']} 个已提交的数据行")
+        # 跳过已提交的数据行（保留表头）
+        read_csv_config['skiprows'] = range(1, stats['rows'] + 1)
+    return stats
+
+
+def _checkpoint_writer(checkpoint_path: str, file_path: str, index: str, id_key: str, chunksize: int):
+    """
+    返回把已提交的统计信息写入断点文件的函数，checkpoint_path 为 None 时该函数不做任何事
+    """
+    if checkpoint_path is None:
+        return lambda stats: None
+
+    stat = os.stat(file_path)
+    checkpoint = {
+        'file_path': str(file_path),
+        'file_size': stat.st_size,
+        'file_mtime': stat.st_mtime,
+        'index': index,
+        'id_key': id_key,
+        'chunksize': chunksize,
+    }
+
+    def write(stats: dict) -> None:
+        _write_checkpoint(checkpoint_path, {
+            **checkpoint,
+            'chunks_committed': stats['chunks'],
+            'rows_committed': stats['rows'],
+            'success': stats['success'],
+            'failed': stats['failed'],
+        })
+
+    return write
+
+
+def stream_csv_to_elastic(file_path,
+                          es_client: elasticsearch.Elasticsearch,
+                          id_key: str = 'en',
+                          index: str = None,
+                          chunksize: int = 10000,
+                          read_csv_config: dict = None,
+                          checkpoint_path: str = None,
+                          id_hash: str = 'sha1',
+                          thread_count: int = 4,
+                          queue_size: int = 4,
+                          bulk_chunk_size: int = 500,
+                          filter_func=filter_df_en_zh) -> dict:
+    """
+    分块流式读取CSV并通过 parallel_bulk 上传到Elasticsearch
+
+    内存占用只与 chunksize 和在途的 bulk 请求数有关，与CSV大小无关。
+    每个CSV分块的全部文档都得到ES确认后才会写入断点文件，中断后重新运行会从最后一个已提交的分块之后继续。
+    断点记录的是已提交的数据行数，因此续传时可以使用不同的 chunksize；目标索引或 id_key 不同的断点会被忽略。
+    续传通过 skiprows 跳过已提交的行，skiprows 按物理行计数，因此包含带引号的多行字段的CSV不能续传
+    （跳过的行数与数据行数不一致），这类文件请不要设置 checkpoint_path。
+
+    Args:
+        file_path: CSV文件路径
+        es_client: Elasticsearch客户端实例
+        id_key: 用于生成唯一ID的语言列（'en'或'zh'）
+        index: 目标索引名称
+        chunksize: 每次读取的CSV行数
+        read_csv_config: pandas.read_csv的配置参数
+        checkpoint_path: 断点文件路径，None 表示不使用断点续传
+        id_hash: 文档ID哈希方法，见 hash_ids
+        thread_count: parallel_bulk 的并发线程数
+        queue_size: parallel_bulk 的待发送批次队列长度
+        bulk_chunk_size: 每个bulk请求的文档数
+        filter_func: 分块清洗函数，签名同 filter_df_en_zh
+
+    Returns:
+        统计信息：{"chunks": 已提交分块数, "rows": 已提交的CSV数据行数, "success": 成功数量, "failed": 失败数量}
+    """
+    read_csv_config = dict(read_csv_config or {})
+    if index is None:
+        index = DEFAULT_MEMORY_INDEX
+
+    stats = _resume_checkpoint(checkpoint_path, file_path, index, id_key, read_csv_config)
+    start_chunk = stats['chunks']
+    start_row = stats['rows']
+    write_checkpoint = _checkpoint_writer(checkpoint_path, file_path, index, id_key, chunksize)
+    # (分块序号, 该分块结束时累计的CSV行数, 该分块结束时累计的action数)，在分块的action发出前登记
+    boundaries = deque()
+
+    def generate_actions():
+        action_count = 0
+        row_count = start_row
+        reader = pd.read_csv(file_path, chunksize=chunksize, **read_csv_config)
+        for chunk_no, chunk in enumerate(reader, start=start_chunk):
+            if chunk_no == start_chunk and len(chunk.columns) < 2:
+                raise ValueError("CSV文件至少需要包含中英文两列")
+            row_count += len(chunk)
+            chunk = filter_func(chunk, source_lang=id_key)
+            chunk['id_key'] = id_key
+            action_count += len(chunk)
+            boundaries.append((chunk_no, row_count, action_count))
+            yield from df_to_upsert_actions(chunk, index=index, id_key=id_key, id_hash=id_hash)
+
+    def commit(acknowledged):
+        while boundaries and boundaries[0][2] <= acknowledged:
+            chunk_no, row_count, _ = boundaries.popleft()
+            stats['chunks'] = chunk_no + 1
+            stats['rows'] = row_count
+            write_checkpoint(stats)
+
+    acknowledged = 0
+    with tqdm.tqdm(desc="上传数据到Elasticsearch", unit="doc") as pbar:
+        for ok, info in es_helpers.parallel_bulk(es_client, generate_actions(),
+                                                 thread_count=thread_count,
+                                                 queue_size=queue_size,
+                                                 chunk_size=bulk_chunk_size,
+                                                 expand_action_callback=_bulk_passthrough,
+                                                 raise_on_error=False):
+            acknowledged += 1
+            if ok:
+                stats['success'] += 1
+            else:
+                stats['failed'] += 1
+                logger.warning(f"批量上传存在错误: {info}")
+            commit(acknowledged)
+            pbar.update(1)
+
+    # 过滤后为空的尾部分块
+    commit(acknowledged)
+
+    if checkpoint_path is not None and os.path.isfile(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return stats
+
+
+def upload_df_en_zh(df: pd.DataFrame, es_client: elasticsearch.Elasticsearch, id_key: str = 'en',
+                   batch_size: int = 10000, index: str = None) -> None:
     """
     上传中英文数据到Elasticsearch
     
@@ -308,58 +566,62 @@ def upload_df_en_zh(df: pd.DataFrame, es_client: Elasticsearch, id_key: str = 'e
         logger.info("过滤后无有效数据可上传")
         return
     
-    # 分批处理
-    batch_idx = np.array_split(range(len(df)), max(int(len(df) / batch_size), 1))
-    for select_idx in tqdm(batch_idx, desc="上传数据到Elasticsearch"):
-        try:
-            response = es_client.bulk(upsert_doc(df.iloc[select_idx], index=index), index=index)
-            if response.get('errors', False):
-                logger.warning(f"批量上传存在错误: {response['errors']}")
-        except Exception as e:
-            logger.error(f"批量上传失败: {str(e)}")
-            raise
+    actions = df_to_upsert_actions(df, index=index, id_key=id_key)
+    for ok, info in tqdm.tqdm(es_helpers.parallel_bulk(es_client, actions,
+                                                       chunk_size=batch_size,
+                                                       expand_action_callback=_bulk_passthrough,
+                                                       raise_on_error=False),
+                              total=len(df), desc="上传数据到Elasticsearch"):
+        if not ok:
+            logger.warning(f"批量上传存在错误: {info}")
 
 
 def csv_to_elastic(file_path,
                    id_key='en',  # 默认使用英文列作为ID基准
                    elasticsearch_host: str = "localhost",
-                   es_client: Elasticsearch = None,
+                   es_client: elasticsearch.Elasticsearch = None,
                    batch_size=10000,
                    read_csv_config: dict = {},
                    index=None,
-                   elastic_client_args: dict = {}):
+                   elastic_client_args: dict = {},
+                   resume: bool = True):
     """
-    从CSV文件上传中英文翻译数据到Elasticsearch
+    从CSV文件分块流式上传中英文翻译数据到Elasticsearch
     
     Args:
         file_path: CSV文件路径
         id_key: 用于生成ID的语言列（'en'或'zh'）
         elasticsearch_host: Elasticsearch主机地址
         es_client: 已初始化的Elasticsearch客户端（可选）
-        batch_size: 批量处理大小
+        batch_size: 每次读取的CSV行数
         read_csv_config: pandas.read_csv的配置参数
         index: 目标索引名称
         elastic_client_args: Elasticsearch客户端初始化参数
+        resume: 是否使用断点文件（<file_path>.<index>.checkpoint.json）支持中断后续传
     """
     # 初始化ES客户端
     if es_client is None:
-        es_client = Elasticsearch(elasticsearch_host, **elastic_client_args)
+        es_client = elasticsearch.Elasticsearch(elasticsearch_host, **elastic_client_args)
     
-    # 读取CSV数据
-    df = pd.read_csv(file_path,** read_csv_config)
-    if len(df.columns) < 2:
+    # 验证是否包含中英文列（只读取表头）
+    columns = pd.read_csv(file_path, nrows=0, **read_csv_config).columns
+    if len(columns) < 2:
         raise ValueError("CSV文件至少需要包含中英文两列")
-    
-    # 验证是否包含中英文列
     required_cols = {'en', 'zh'}
-    if not required_cols.intersection(df.columns):
-        raise ValueError(f"CSV文件必须包含'en'和'zh'列，当前列: {df.columns}")
+    if not required_cols.intersection(columns):
+        raise ValueError(f"CSV文件必须包含'en'和'zh'列，当前列: {columns}")
     
+    checkpoint_path = None
+    if resume:
+        checkpoint_path = f"{file_path}.{index or DEFAULT_MEMORY_INDEX}.checkpoint.json"
+
     # 上传数据
-    upload_df_en_zh(
-        df=df,
+    return stream_csv_to_elastic(
+        file_path,
         es_client=es_client,
         id_key=id_key,
-        batch_size=batch_size,
-        index=index
-    )
\ No newline at end of file
+        index=index,
+        chunksize=batch_size,
+        read_csv_config=read_csv_config,
+        checkpoint_path=checkpoint_path
+    )
@@ -1,6 +1,95 @@
+from collections import deque
+from itertools import islice
+
+
 def get_preceding_text(text_list, max_sent=3):
     out_list = []
     for i in range(len(text_list)):
         out_list.append(text_list[max(i - max_sent, 0):i])
 
     return out_list
+
+
+def iter_preceding_text(text_iter, max_sent=3):
+    """
+    The streaming counterpart of get_preceding_text, yields (text, preceding texts) without holding the whole input
+    """
+    preceding = deque(maxlen=max(max_sent, 0))
+    for text in text_iter:
+        yield text, list(preceding)
+        preceding.append(text)
+
+
+def iter_lines(file_path, encoding="utf8"):
+    """
+    Yield the lines of a text file without the line breaks
+    """
+    with open(file_path, encoding=encoding) as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to size consecutive items
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def padded_length(length, pad_to_multiple_of=None):
+    if pad_to_multiple_of:
+        return -(-length // pad_to_multiple_of) * pad_to_multiple_of
+    return length
+
+
+def token_budget_batches(lengths, max_batch_tokens, max_batch_size=None, pad_to_multiple_of=None):
+    """
+    Group the prompts by length into batches whose padded size (batch size * longest prompt) stays within
+    max_batch_tokens
+
+    A prompt longer than the budget gets a batch of its own
+
+    Args:
+        lengths: the token length of each prompt
+        max_batch_tokens: the budget of padded prompt tokens per batch
+        max_batch_size: the maximum number of prompts per batch
+        pad_to_multiple_of: the padding multiple used by the tokenizer
+
+    Returns:
+        list of index lists, the batches hold the longest prompts first
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches = []
+    batch = []
+    batch_len = 0
+    for i in order:
+        if len(batch) > 0:
+            fits_budget = (len(batch) + 1) * batch_len <= max_batch_tokens
+            fits_size = max_batch_size is None or len(batch) < max_batch_size
+            if fits_budget and fits_size:
+                batch.append(i)
+                continue
+            batches.append(batch)
+        batch = [i]
+        batch_len = padded_length(lengths[i], pad_to_multiple_of)
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def padding_efficiency(lengths, batches, pad_to_multiple_of=None):
+    """
+    The share of real tokens among the padded tokens of the batches
+    """
+    real_tokens = sum(lengths[i] for batch in batches for i in batch)
+    padded_tokens = sum(
+        len(batch) * padded_length(max(lengths[i] for i in batch), pad_to_multiple_of) for batch in batches if batch
+    )
+    return real_tokens / padded_tokens if padded_tokens > 0 else 1.0
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger("t_ragx")
+
+
+class JsonlSink:
+    """
+    An append-only JSONL file of translation records, one {"id", "source", "translation"} object per line
+
+    Every write is flushed, so a stopped run loses at most the batch being written. On open, a truncated last line
+    left by an interrupted write is removed and the complete records are counted, so the run can be resumed
+    """
+
+    def __init__(self, path, resume=True, fsync=False, encoding="utf8"):
+        """
+
+        Args:
+            path: the JSONL file
+            resume: keep the records of an existing file, otherwise the file is overwritten
+            fsync: fsync after every write, survives a power loss at the cost of write throughput
+        """
+        self.path = path
+        self.fsync = fsync
+        self.encoding = encoding
+        self._file = None
+
+        self.n_records = 0
+        if os.path.exists(path):
+            if resume:
+                self.n_records = self._repair()
+            else:
+                os.remove(path)
+
+    def _repair(self):
+        """
+        Count the complete records and cut off a partial last line
+        """
+        n_records = 0
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                n_records += 1
+                valid_size += len(line)
+
+        if valid_size < os.path.getsize(self.path):
+            logger.warning(f"{self.path}: removed a partial record after {n_records} records")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+        return n_records
+
+    def records(self):
+        """
+        Yield the records already in the file
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding=self.encoding) as f:
+            for line in f:
+                yield json.loads(line)
+
+    def write(self, records):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding=self.encoding)
+        self._file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.n_records += len(records)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,156 @@
+"""
+翻译运行结果对比脚本
+对比多次运行（如人工审校 vs 无人工审校）的逐chunk指标：
+1. 每次运行只扫描一遍chunk文件与评估报告，建立 (章节, chunk) 索引
+2. 各指标的平均差值、改进/退步的chunk数
+3. 指定指标改进与退步最多的chunk及其文件路径
+4. 多次运行两两对比的平均差值矩阵
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# 添加项目路径
+current_dir = Path(__file__).parent
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from utils.run_index import build_run_index, compare_two_runs, top_changes, pairwise_delta_matrix
+
+
+def resolve_run(run: str, output_root: str, reports_dir: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    解析运行名称或路径
+
+    Returns:
+        (运行名称, 输出目录, 评估报告路径)，不存在的路径为 None
+    """
+    if os.path.isdir(run):
+        output_dir = run
+        name = os.path.basename(os.path.normpath(run))
+    else:
+        name = run
+        output_dir = os.path.join(output_root, run)
+    candidates = [
+        os.path.join(reports_dir, f"{name}_evaluation.json"),
+        os.path.join(output_dir, "evaluation_report.json"),
+    ]
+    report_file = next((c for c in candidates if os.path.exists(c)), None)
+    return name, (output_dir if os.path.isdir(output_dir) else None), report_file
+
+
+def print_comparison(base_name: str, other_name: str, summary: pd.DataFrame,
+                     improved: pd.DataFrame, regressed: pd.DataFrame, metric: str):
+    print(f"\n{other_name} vs {base_name}:")
+    for metric_name, row in summary.iterrows():
+        if not row["count"]:
+            continue
+        print(f"  {metric_name:20s} {row['other_mean']:6.2f}  ({base_name} {row['base_mean']:6.2f})  "
+              f"delta {row['delta_mean']:+.2f}  ↑{int(row['improved'])} ↓{int(row['regressed'])} / {int(row['count'])}")
+    for title, table in [("改进最多", improved), ("退步最多", regressed)]:
+        if table.empty:
+            continue
+        print(f"  {metric} {title}的chunk:")
+        for (chapter_id, chunk_id), row in table.iterrows():
+            print(f"    章节 {chapter_id} chunk {chunk_id:3d}: {row['base']:.2f} -> {row['other']:.2f} "
+                  f"(delta {row['delta']:+.2f})")
+            print(f"      {base_name}: {row['base_file']}")
+            print(f"      {other_name}: {row['other_file']}")
+
+
+def table_records(table: pd.DataFrame) -> List[Dict]:
+    return json.loads(table.reset_index().to_json(orient="records", force_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="对比多次翻译运行的逐chunk指标",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 人工审校与无人工审校两两对比
+  python compare_runs.py --pairs vgg_nohuman:vgg resnet_nohuman:resnet
+
+  # 以 vgg_nohuman 为基准对比多次运行
+  python compare_runs.py --runs vgg_nohuman vgg vgg_v2 vgg_v3 --baseline vgg_nohuman
+
+  # 多次运行两两对比的 bleu 平均差值矩阵
+  python compare_runs.py --runs run1 run2 run3 run4 --metric bleu
+        """
+    )
+    parser.add_argument("--runs", nargs='+', default=[], help="运行名称（output/ 下的目录名）或输出目录路径")
+    parser.add_argument("--pairs", nargs='+', default=[], help="基准:对比 运行对，如 vgg_nohuman:vgg")
+    parser.add_argument("--baseline", type=str, default=None, help="与所有 --runs 对比的基准运行")
+    parser.add_argument("--metric", type=str, default="quality_score", help="列出改进/退步chunk与差值矩阵所用的指标")
+    parser.add_argument("--top-k", type=int, default=5, help="列出改进/退步最多的chunk数")
+    parser.add_argument("--output-root", type=str, default=str(current_dir / "output"), help="运行输出根目录")
+    parser.add_argument("--reports-dir", type=str, default=str(current_dir / "reports"),
+                        help="评估报告目录（查找 {运行名称}_evaluation.json）")
+    parser.add_argument("--output", type=str, default=None, help="将对比结果保存为 JSON")
+    args = parser.parse_args()
+
+    pairs = [tuple(p.split(":", 1)) for p in args.pairs]
+    if any(len(p) != 2 for p in pairs):
+        parser.error("--pairs 的格式应为 基准:对比")
+    runs = list(dict.fromkeys(args.runs + [r for p in pairs for r in p] + ([args.baseline] if args.baseline else [])))
+    if len(runs) < 2:
+        parser.error("至少需要两次运行")
+    if not pairs:
+        if args.baseline:
+            pairs = [(args.baseline, r) for r in runs if r != args.baseline]
+        elif len(runs) == 2:
+            pairs = [(runs[0], runs[1])]
+
+    # 1. 每次运行建立一次索引
+    indexes = {}
+    for run in runs:
+        name, output_dir, report_file = resolve_run(run, args.output_root, args.reports_dir)
+        index = build_run_index(output_dir, report_file)
+        if index.empty:
+            print(f"[WARNING] 运行 {run} 没有找到chunk文件或评估报告，跳过")
+            continue
+        indexes[run] = index
+        print(f"  {run}: {len(index)} 个chunk（输出目录: {output_dir or '无'}，评估报告: {report_file or '无'}）")
+
+    result = {"comparisons": []}
+
+    # 2. 成对对比
+    for base_name, other_name in pairs:
+        if base_name not in indexes or other_name not in indexes:
+            continue
+        summary, merged = compare_two_runs(indexes[base_name], indexes[other_name])
+        improved, regressed = top_changes(merged, args.metric, args.top_k)
+        print_comparison(base_name, other_name, summary, improved, regressed, args.metric)
+        result["comparisons"].append({
+            "base": base_name,
+            "other": other_name,
+            "summary": table_records(summary),
+            "top_improved": table_records(improved),
+            "top_regressed": table_records(regressed),
+        })
+
+    # 3. 多次运行的平均差值矩阵
+    if len(indexes) > 2 or not pairs:
+        matrix = pairwise_delta_matrix(indexes, args.metric)
+        if not matrix.empty:
+            print(f"\n{args.metric} 两两平均差值（行 - 列，仅计共有chunk）:")
+            with pd.option_context("display.width", 200, "display.max_columns", None):
+                print(matrix.to_string(float_format=lambda x: f"{x:+.2f}"))
+            result["delta_matrix"] = {"metric": args.metric, "runs": list(matrix.index),
+                                      "values": json.loads(matrix.to_json(orient="values"))}
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n√ 对比结果已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
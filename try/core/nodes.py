@@ -17,11 +17,10 @@ from utils.memory_storage import (
     get_previous_chapter_summaries,
     get_chapter_translation_memory
 )
+from utils.chapter_store import get_chapter_store
 
 from typing import Any
 
-import json
-import os
 import time
 from collections import deque
 from threading import Lock
@@ -150,6 +149,7 @@ class TranslationState(BaseModel):
     chapter_memory: List[str] = Field(default_factory=list)
     global_glossary: Dict[str, Any] = Field(default_factory=dict)      # 全书术语表
     rag_context: List[str] = Field(default_factory=list)              # ES / 外部检索结果
+    context_text: str = ""  # 与上一 chunk 重叠的原文，只作为只读上下文，不翻译、不评估
     # ===== 中间结果 =====
     style_guide: Dict[str, Any] = Field(default_factory=dict)
     raw_terms: List[str] = Field(default_factory=list) # 初步识别的难词
@@ -471,6 +471,11 @@ def node_translate_fusion(state: TranslationState):
         for i, mem in enumerate(previous_memories, 1):
             examples_text += f"\n参考{i}:\n原文: {mem['source_text'][:150]}...\n译文: {mem['translation'][:150]}...\n"
     
+    # 重叠上下文只供理解，不翻译（各 chunk 只为新内容付费）
+    context_section = ""
+    if state.context_text:
+        context_section = f"\n【上文（上一段已翻译的原文，仅用于理解上下文，不要翻译或输出）】\n{state.context_text}\n"
+    
     # 多步骤引导翻译的prompt
     prompt = f"""
 你是一个高级翻译引擎，需要参考已翻译的文本对来保持翻译风格的一致性。
@@ -509,11 +514,11 @@ def node_translate_fusion(state: TranslationState):
     - 重要：人名（包括作者名、研究者姓名等）必须保留英文原文，不要翻译成中文。例如："Krizhevsky"、"Alex"、"John Smith" 等应保持原样
 
 {examples_text if examples_text else ""}
-
+{context_section}
 【待翻译原文】
 {source_text_cleaned}
 
-请只输出最终融合后的译文，不要输出中间步骤。
+请只输出【待翻译原文】的最终融合后的译文，不要输出中间步骤。
 """
     
     # 添加重试机制
@@ -602,6 +607,10 @@ Text to translate:
             for t in state.glossary[:20]
         ])
     
+    context_section = ""
+    if state.context_text:
+        context_section = f"\n    【上文（仅用于理解上下文，不在评估范围内）】\n    {state.context_text}\n"
+    
     eval_prompt = f"""
     你是专业的翻译质量评估系统，需要对翻译进行多维度评估。
 
@@ -614,7 +623,7 @@ Text to translate:
 
     【术语表（必须严格遵守）】
     {glossary_text if glossary_text else "无术语表"}
-
+{context_section}
     【原文】
     {state.source_text}
 
@@ -743,6 +752,10 @@ def node_refine_translation(state: TranslationState):
     
     style_str = str(state.style_guide)
     
+    context_section = ""
+    if state.context_text:
+        context_section = f"\n    【上文（仅用于理解上下文，不要翻译或输出）】\n    {state.context_text}\n"
+    
     # 构建修正提示词
     refine_prompt = f"""
     你是专业的翻译修正专家。当前译文已经过评估，发现了一些问题，需要你进行针对性修正。
@@ -770,7 +783,7 @@ def node_refine_translation(state: TranslationState):
 
     【风格要求】
     {style_str}
-
+{context_section}
     【原文】
     {state.source_text}
 
@@ -794,7 +807,7 @@ def node_refine_translation(state: TranslationState):
     - 如果文本中包含LaTeX公式（如 $...$ 或 $$...$$），请保持原样
     - 重要：人名（包括作者名、研究者姓名等）必须保留英文原文，不要翻译成中文
 
-    请输出修正后的完整译文：
+    请输出【原文】修正后的完整译文：
     """
     
     # 执行修正
@@ -842,6 +855,7 @@ def node_persistence(state: TranslationState):
         chunk_id = state.chunk_id
         translation = state.combined_translation
         source_text = state.source_text
+        context_text = state.context_text
         quality_score = state.quality_score
         glossary = state.glossary
         refinement_history = state.refinement_history
@@ -853,6 +867,7 @@ def node_persistence(state: TranslationState):
         chunk_id = state.get("chunk_id")
         translation = state.get("combined_translation")
         source_text = state.get("source_text")
+        context_text = state.get("context_text", "")
         quality_score = state.get("quality_score")
         glossary = state.get("glossary")
         refinement_history = state.get("refinement_history", [])
@@ -865,16 +880,10 @@ def node_persistence(state: TranslationState):
         print(f"  [WARNING] Chunk {chunk_id} 的source_text为空，跳过保存")
         return {"need_human_review": False}
 
-    # 路径构造
-    base_dir = f"./output/{book_id}/chapter_{chapter_id}"
-    os.makedirs(base_dir, exist_ok=True)
-    
-    # 建议 chunk_id 格式化为 3 位或 4 位数字，方便排序
-    file_path = os.path.join(base_dir, f"chunk_{int(chunk_id):03d}.json")
-    
     data_to_save = {
         "chunk_id": chunk_id,
         "source_text": source_text,
+        "context_text": context_text,  # 重叠上下文（未翻译），合并整书时无需去重
         "translation": translation,
         "quality_score": quality_score,
         "glossary": glossary,
@@ -882,10 +891,11 @@ def node_persistence(state: TranslationState):
         "revision_count": state.revision_count  # 保存迭代次数
     }
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data_to_save, f, ensure_ascii=False, indent=2)
+    # 写入章节存储（output/{book_id}/chapter_{chapter_id}/chunks.jsonl），后续各阶段直接读取内存缓存
+    store = get_chapter_store(book_id, chapter_id)
+    store.put(chunk_id, data_to_save)
     
-    print(f"File saved: {file_path}")
+    print(f"Chunk saved: {store.store_file}")
     
     # 保存翻译记忆到Memory系统
     try:
@@ -8,6 +8,7 @@
 import json
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
@@ -40,7 +41,19 @@ current_dir = Path(__file__).parent
 if str(current_dir) not in sys.path:
     sys.path.insert(0, str(current_dir))
 
-from utils.translation_evaluator import TranslationEvaluator, load_reference_translations
+from utils.translation_evaluator import TranslationEvaluator, load_reference_translations, HAS_EMBEDDING
+from utils.corpus_metrics import NgramStatsCache, summarize_statistics
+from utils.incremental_eval import (
+    EvalResultStore, chunk_eval_inputs, chunk_cache_key, evaluate_chunk, evaluate_chunk_task, init_worker,
+    is_cacheable
+)
+
+# chunk 级 n-gram 统计量缓存（多次运行共用，只重算改动过的chunk）
+DEFAULT_STATS_CACHE = str(current_dir / "reports" / "ngram_stats_cache.json")
+# 语义相似度向量缓存目录（按文本哈希缓存，未改动的文本不再重新编码）
+DEFAULT_EMBEDDING_CACHE = str(current_dir / "reports" / "embedding_cache")
+# 逐chunk评估结果缓存（按chunk内容、参考译文、指标集合与指标版本的哈希索引）
+DEFAULT_RESULT_STORE = str(current_dir / "reports" / "eval_result_cache.jsonl")
 
 
 def load_reference_translations_enhanced(reference_file: str) -> Dict:
@@ -154,7 +167,13 @@ def evaluate_translation_results(
     output_dir: str,
     reference_file: Optional[str] = None,
     output_report: Optional[str] = None,
-    enabled_metrics: Optional[List[str]] = None
+    enabled_metrics: Optional[List[str]] = None,
+    stats_cache_file: Optional[str] = DEFAULT_STATS_CACHE,
+    embedding_cache_dir: Optional[str] = DEFAULT_EMBEDDING_CACHE,
+    embedding_batch_size: int = 64,
+    embedding_threads: Optional[int] = None,
+    workers: int = 1,
+    result_store_file: Optional[str] = DEFAULT_RESULT_STORE
 ) -> Dict:
     """
     评估翻译结果
@@ -164,6 +183,12 @@ def evaluate_translation_results(
         reference_file: 参考译文文件路径（可选）
         output_report: 评估报告输出路径（可选）
         enabled_metrics: 启用的评估指标列表，可选值: ['bleu', 'mqm', 'score']
+        stats_cache_file: 语料级 BLEU/chrF 的 n-gram 统计量缓存文件（None 表示不落盘）
+        embedding_cache_dir: 语义相似度向量缓存目录（None 表示不缓存）
+        embedding_batch_size: 向量编码批大小
+        embedding_threads: 向量编码使用的CPU线程数
+        workers: 并行评估的进程数（1 为串行）
+        result_store_file: 逐chunk评估结果缓存文件（None 表示不缓存，全部重新评估）
     
     Returns:
         评估结果字典
@@ -192,65 +217,124 @@ def evaluate_translation_results(
         print("\n步骤 2: 加载参考译文...")
         reference_translations = load_reference_translations_enhanced(reference_file)
     
-    # 3. 初始化评估器
-    evaluator = TranslationEvaluator(reference_translations, enabled_metrics=enabled_metrics)
-    
-    # 4. 读取并评估所有chunk
+    # 3. 读取所有chunk，按内容哈希查找已缓存的评估结果
     print("\n步骤 3: 评估chunk...")
+    enabled_metrics = enabled_metrics or ['bleu', 'mqm', 'score']
+    semantic_enabled = 'mqm' in enabled_metrics and HAS_EMBEDDING
+    result_store = EvalResultStore(result_store_file)
+    stats_cache = NgramStatsCache(stats_cache_file)
     valid_chunks = []
     quality_scores = []
-    chunk_results = []
+    chunk_entries = []
+    pending = []
     
     for chapter_id, chunk_id, chunk_path in all_chunks:
         try:
             with open(chunk_path, 'r', encoding='utf-8') as f:
                 chunk_data = json.load(f)
-            
-            source_text = chunk_data.get('source_text', '').strip()
-            
-            # 跳过source_text为空的chunk
-            if not source_text:
-                continue
-            
-            translation = chunk_data.get('translation', '')
-            quality_score = chunk_data.get('quality_score', 0)
-            glossary = chunk_data.get('glossary', [])
-            
-            # 获取回译文（从refinement_history中）
-            back_translation = None
-            refinement_history = chunk_data.get('refinement_history', [])
-            if refinement_history:
-                last_refinement = refinement_history[-1]
-                back_translation = last_refinement.get('back_translation')
-            
-            valid_chunks.append((chapter_id, chunk_id, chunk_path))
-            if quality_score:
-                quality_scores.append(quality_score)
-            
-            # 进行综合评估
-            eval_result = evaluator.evaluate_comprehensive(
-                source_text=source_text,
-                translation=translation,
-                back_translation=back_translation,
-                glossary=glossary,
-                chapter_id=chapter_id,
-                chunk_id=chunk_id,
-                quality_score=quality_score
-            )
-            
-            chunk_results.append({
-                "chapter_id": chapter_id,
-                "chunk_id": chunk_id,
-                "chunk_file": chunk_path,
-                "source_text": source_text[:200] + "..." if len(source_text) > 200 else source_text,
-                "translation": translation[:200] + "..." if len(translation) > 200 else translation,
-                "quality_score": quality_score,
-                "evaluation": eval_result
-            })
-            
         except Exception as e:
-            print(f"  [WARNING] 评估chunk失败 {chunk_path}: {e}")
+            print(f"  [WARNING] 读取chunk失败 {chunk_path}: {e}")
             continue
+        
+        inputs = chunk_eval_inputs(chunk_data)
+        # 跳过source_text为空的chunk
+        if not inputs["source_text"]:
+            continue
+        
+        valid_chunks.append((chapter_id, chunk_id, chunk_path))
+        if inputs["quality_score"]:
+            quality_scores.append(inputs["quality_score"])
+        
+        reference = reference_translations.get(chapter_id, {}).get(chunk_id)
+        key = chunk_cache_key(inputs, reference, enabled_metrics, semantic_enabled)
+        entry = {"chapter_id": chapter_id, "chunk_id": chunk_id, "chunk_path": chunk_path,
+                 "inputs": inputs, "reference": reference, "key": key,
+                 "evaluation": result_store.get(key)}
+        chunk_entries.append(entry)
+        if entry["evaluation"] is None:
+            pending.append(entry)
+    
+    print(f"  评估结果缓存命中 {result_store.hits}/{len(chunk_entries)}，需要评估 {len(pending)} 个chunk")
+    
+    # 4. 评估新增或改动过的chunk
+    if pending:
+        evaluator = TranslationEvaluator(reference_translations, enabled_metrics=enabled_metrics,
+                                         stats_cache=stats_cache, embedding_cache_dir=embedding_cache_dir,
+                                         embedding_batch_size=embedding_batch_size,
+                                         embedding_threads=embedding_threads)
+        # 语义相似度对全部 (译文, 参考译文) 批量编码
+        if evaluator.embedding_model is not None:
+            semantic_pairs = [(e["inputs"]["translation"], e["reference"]) for e in pending if e["reference"]]
+            if semantic_pairs:
+                evaluator.precompute_semantic_similarity(semantic_pairs)
+                if evaluator.embedding_cache is not None:
+                    print(f"  语义相似度: {len(semantic_pairs)} 对批量编码，向量缓存命中 "
+                          f"{evaluator.embedding_cache.hits}/{evaluator.embedding_cache.hits + evaluator.embedding_cache.misses}")
+        
+        # 需要语义相似度但没有预先算出结果的chunk（批量编码失败）留在主进程逐条重试，工作进程没有向量模型
+        def needs_main_process(e):
+            return (evaluator.embedding_model is not None and e["reference"]
+                    and (e["inputs"]["translation"], e["reference"]) not in evaluator._semantic_results)
+        
+        outputs = []
+        local_indices = list(range(len(pending)))
+        if workers > 1 and len(pending) > 1:
+            local_indices = [i for i, e in enumerate(pending) if needs_main_process(e)]
+            local_set = set(local_indices)
+            tasks = [
+                (i, e["chapter_id"], e["chunk_id"], e["inputs"],
+                 evaluator._semantic_results.get((e["inputs"]["translation"], e["reference"])))
+                for i, e in enumerate(pending) if i not in local_set
+            ]
+            if tasks:
+                print(f"  使用 {workers} 个进程并行评估 {len(tasks)} 个chunk...")
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                         initargs=(reference_translations, enabled_metrics)) as executor:
+                    outputs = list(executor.map(evaluate_chunk_task, tasks,
+                                                chunksize=max(1, len(tasks) // (workers * 4))))
+            # 工作进程的 n-gram 统计量不会写入磁盘缓存，由主进程登记
+            for i, eval_result, error in outputs:
+                if error is None and "ngram_stats" in eval_result and pending[i]["reference"]:
+                    stats_cache.put(pending[i]["inputs"]["translation"], pending[i]["reference"],
+                                    eval_result["ngram_stats"])
+        for i in local_indices:
+            e = pending[i]
+            try:
+                outputs.append((i, evaluate_chunk(evaluator, e["chapter_id"], e["chunk_id"], e["inputs"]), None))
+            except Exception as ex:
+                outputs.append((i, None, str(ex)))
+        
+        uncached = 0
+        for i, eval_result, error in outputs:
+            entry = pending[i]
+            if error is not None:
+                print(f"  [WARNING] 评估chunk失败 {entry['chunk_path']}: {error}")
+                continue
+            entry["evaluation"] = eval_result
+            if is_cacheable(eval_result, semantic_enabled):
+                result_store.put(entry["key"], eval_result)
+            else:
+                uncached += 1
+        if uncached:
+            reason = "模型加载失败" if evaluator.embedding_model is None else "计算失败"
+            print(f"  [WARNING] {uncached} 个chunk的语义相似度{reason}，结果未写入评估结果缓存")
+        result_store.flush()
+    
+    chunk_results = []
+    for entry in chunk_entries:
+        if entry["evaluation"] is None:
+            continue
+        source_text = entry["inputs"]["source_text"]
+        translation = entry["inputs"]["translation"]
+        chunk_results.append({
+            "chapter_id": entry["chapter_id"],
+            "chunk_id": entry["chunk_id"],
+            "chunk_file": entry["chunk_path"],
+            "source_text": source_text[:200] + "..." if len(source_text) > 200 else source_text,
+            "translation": translation[:200] + "..." if len(translation) > 200 else translation,
+            "quality_score": entry["inputs"]["quality_score"],
+            "evaluation": entry["evaluation"]
+        })
     
     print(f"  有效chunk数: {len(valid_chunks)}")
     print(f"  已评估chunk数: {len(chunk_results)}")
@@ -317,6 +401,15 @@ def evaluate_translation_results(
                 "direction_cn": "越高越好" if direction == "higher_is_better" else ("越低越好" if direction == "lower_is_better" else "越接近理想值越好")
             }
     
+    # 语料级 BLEU / chrF：对所有chunk的n-gram统计量求和后计算，而不是平均逐chunk分数
+    corpus_metrics = {}
+    ngram_stats = [r["evaluation"]["ngram_stats"] for r in chunk_results if "ngram_stats" in r["evaluation"]]
+    if ngram_stats:
+        corpus_metrics = summarize_statistics(ngram_stats)
+        stats_cache.save()
+        print(f"  语料级 BLEU: {corpus_metrics['bleu']:.2f}  chrF: {corpus_metrics['chrf']:.2f} "
+              f"（{corpus_metrics['count']} 个chunk）")
+    
     # 计算总体评估分数
     overall_eval_score = 0.0
     if chunk_results:
@@ -362,6 +455,7 @@ def evaluate_translation_results(
             }
         },
         "metric_summary": metric_summary,
+        "corpus_metrics": corpus_metrics,
         "chapter_statistics": {},
         "chunk_details": chunk_results
     }
@@ -374,7 +468,8 @@ def evaluate_translation_results(
             chapter_stats[chapter_id] = {
                 "chunk_count": 0,
                 "quality_scores": [],
-                "eval_scores": []
+                "eval_scores": [],
+                "ngram_stats": []
             }
         
         chapter_stats[chapter_id]["chunk_count"] += 1
@@ -384,6 +479,8 @@ def evaluate_translation_results(
             eval_score = result["evaluation"].get("overall_score", 0)
             if eval_score:
                 chapter_stats[chapter_id]["eval_scores"].append(eval_score)
+            if "ngram_stats" in result["evaluation"]:
+                chapter_stats[chapter_id]["ngram_stats"].append(result["evaluation"]["ngram_stats"])
     
     for chapter_id, stats in chapter_stats.items():
         report["chapter_statistics"][chapter_id] = {
@@ -391,6 +488,10 @@ def evaluate_translation_results(
             "quality_score_avg": round(sum(stats["quality_scores"]) / len(stats["quality_scores"]), 2) if stats["quality_scores"] else None,
             "evaluation_score_avg": round(sum(stats["eval_scores"]) / len(stats["eval_scores"]), 2) if stats["eval_scores"] else None
         }
+        if stats["ngram_stats"]:
+            chapter_corpus = summarize_statistics(stats["ngram_stats"])
+            report["chapter_statistics"][chapter_id]["corpus_bleu"] = chapter_corpus["bleu"]
+            report["chapter_statistics"][chapter_id]["corpus_chrf"] = chapter_corpus["chrf"]
     
     # 8. 保存评估报告
     if output_report:
@@ -407,6 +508,7 @@ def evaluate_translation_results(
         metrics_summary = {
             "evaluation_info": report["evaluation_info"],
             "metrics_summary": metric_summary,
+            "corpus_metrics": corpus_metrics,
             "overall_statistics": {
                 "quality_score": report["overall_statistics"]["quality_score"],
                 "evaluation_score": report["overall_statistics"]["evaluation_score"],
@@ -434,6 +536,7 @@ def evaluate_translation_results(
         metrics_summary = {
             "evaluation_info": report["evaluation_info"],
             "metrics_summary": metric_summary,
+            "corpus_metrics": corpus_metrics,
             "overall_statistics": {
                 "quality_score": report["overall_statistics"]["quality_score"],
                 "evaluation_score": report["overall_statistics"]["evaluation_score"],
@@ -462,6 +565,11 @@ def evaluate_translation_results(
             direction_text = stats.get('direction_cn', '')
             print(f"  - {metric_name}: {stats['average']}/10 (范围: {stats['min']}-{stats['max']}) {direction_mark} {direction_text}")
     
+    if corpus_metrics:
+        print(f"\n语料级指标（{corpus_metrics['count']} 个chunk）:")
+        print(f"  - BLEU: {corpus_metrics['bleu']} (BP={corpus_metrics['brevity_penalty']}) ↑ 越高越好")
+        print(f"  - chrF: {corpus_metrics['chrf']} ↑ 越高越好")
+    
     if chapter_stats:
         print("\n各章节统计:")
         for chapter_id in sorted(chapter_stats.keys()):
@@ -494,6 +602,9 @@ def main():
   
   # 只评估MQM指标
   python eval.py --output-dir try/output/vgg --gt-dir data/vgg_ch.json --metrics mqm
+  
+  # 4 个进程并行评估（未改动的chunk直接使用 reports/eval_result_cache.jsonl 中的结果）
+  python eval.py --output-dir try/output/vgg --gt-dir data/vgg_ch.json --workers 4
         """
     )
     
@@ -527,6 +638,66 @@ def main():
         help="指定要评估的指标，可选: bleu (BLEU分数), mqm (语义相似度/MQM), score (质量分数)。可多选，默认全部启用"
     )
     
+    parser.add_argument(
+        "--stats-cache",
+        type=str,
+        default=DEFAULT_STATS_CACHE,
+        help="语料级 BLEU/chrF 的 n-gram 统计量缓存文件，多次运行共用，只重算改动过的chunk（默认 reports/ngram_stats_cache.json）"
+    )
+    
+    parser.add_argument(
+        "--no-stats-cache",
+        action="store_true",
+        help="不读写 n-gram 统计量缓存"
+    )
+    
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=DEFAULT_EMBEDDING_CACHE,
+        help="语义相似度向量缓存目录（float16 内存映射矩阵，按文本哈希索引，默认 reports/embedding_cache）"
+    )
+    
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="不读写向量缓存"
+    )
+    
+    parser.add_argument(
+        "--embedding-batch-size",
+        type=int,
+        default=64,
+        help="语义相似度向量编码的批大小（默认 64）"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="并行评估的进程数（默认 1，即串行）"
+    )
+    
+    parser.add_argument(
+        "--result-cache",
+        type=str,
+        default=DEFAULT_RESULT_STORE,
+        help="逐chunk评估结果缓存文件，只重新评估新增或改动过的chunk（默认 reports/eval_result_cache.jsonl）"
+    )
+    
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="不使用评估结果缓存，重新评估全部chunk"
+    )
+    
+    parser.add_argument(
+        "--embedding-threads",
+        type=int,
+        default=None,
+        help="向量编码使用的CPU线程数（默认由torch决定）"
+    )
+    
     args = parser.parse_args()
     
     # 验证输出目录（尝试多种可能的路径）
@@ -580,7 +751,13 @@ def main():
             output_dir=args.output_dir,
             reference_file=args.gt_dir,
             output_report=args.output_report,
-            enabled_metrics=args.metrics
+            enabled_metrics=args.metrics,
+            stats_cache_file=None if args.no_stats_cache else args.stats_cache,
+            embedding_cache_dir=None if args.no_embedding_cache else args.embedding_cache,
+            embedding_batch_size=args.embedding_batch_size,
+            embedding_threads=args.embedding_threads,
+            workers=args.workers,
+            result_store_file=None if args.no_result_cache else args.result_cache
         )
         
         if "error" in report:
@@ -2,8 +2,10 @@ from utils.config_loader import ConfigLoader
 from utils.logger import setup_logger
 from utils.human import review_glossary
 from utils.book_cut import split_epub_by_chapter
-from utils.book_cut import split_chapter_into_chunks
+from utils.book_cut import iter_context_chunks
 from utils.glossary_storage import load_reviewed_glossary
+from utils.chapter_store import get_chapter_store
+from utils.book_assembler import assemble_book
 from utils.memory_storage import (
     get_previous_chapter_summaries,
     save_chapter_summary,
@@ -99,20 +101,14 @@ def collect_chapter_glossaries(book_id, chapter_id, num_chunks):
     """
     收集整个chapter所有chunk的术语表和原文
     """
-    import json
-    import os
     all_glossaries = []
     chapter_source_text = []  # 收集所有原文，用于显示上下文
     
-    for chunk_id in range(num_chunks):
-        chunk_file = f"output/{book_id}/chapter_{chapter_id}/chunk_{chunk_id:03d}.json"
-        if os.path.exists(chunk_file):
-            with open(chunk_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'glossary' in data:
-                    all_glossaries.extend(data['glossary'])
-                if 'source_text' in data:
-                    chapter_source_text.append(data['source_text'])
+    for chunk_id, data in get_chapter_store(book_id, chapter_id).chunks(num_chunks):
+        if 'glossary' in data:
+            all_glossaries.extend(data['glossary'])
+        if 'source_text' in data:
+            chapter_source_text.append(data['source_text'])
     
     # 去重：相同src的术语只保留一个（保留第一个出现的）
     seen_src = set()
@@ -130,7 +126,7 @@ def collect_chapter_glossaries(book_id, chapter_id, num_chunks):
 
 def update_chunks_with_reviewed_glossary(book_id, chapter_id, num_chunks, reviewed_glossary):
     """
-    将人工审查后的术语表更新到所有chunk文件中，并更新译文中的术语翻译
+    将人工审查后的术语表更新到章节存储的所有chunk中，并更新译文中的术语翻译
     
     Args:
         book_id: 书籍ID
@@ -138,10 +134,6 @@ def update_chunks_with_reviewed_glossary(book_id, chapter_id, num_chunks, review
         num_chunks: chunk数量
         reviewed_glossary: 审查后的术语列表
     """
-    import json
-    import os
-    import re
-    
     # 创建术语字典，方便查找
     reviewed_dict = {term.get('src', ''): term for term in reviewed_glossary if term.get('src')}
     
@@ -153,20 +145,18 @@ def update_chunks_with_reviewed_glossary(book_id, chapter_id, num_chunks, review
             new_trans = term.get('suggested_trans', '')
             if original_trans and new_trans and original_trans != new_trans:
                 translation_updates[original_trans] = new_trans
+    # 按长度降序排序，优先替换较长的术语，避免短术语被长术语包含
+    sorted_updates = sorted(translation_updates.items(), key=lambda x: len(x[0]), reverse=True)
     
-    updated_count = 0
-    translation_updated_count = 0
+    store = get_chapter_store(book_id, chapter_id)
+    updated_chunks = []  # [(chunk_id, data)]
+    memory_updates = {}  # {memory_key: translation}
     
-    for chunk_id in range(num_chunks):
-        chunk_file = f"output/{book_id}/chapter_{chapter_id}/chunk_{chunk_id:03d}.json"
-        if not os.path.exists(chunk_file):
-            continue
-        
+    for chunk_id, original_data in store.chunks(num_chunks):
         try:
-            # 读取chunk文件
-            with open(chunk_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
+            # 在副本上修改，统一写回存储
+            data = dict(original_data)
+            changed = False
             translation_updated = False
             
             # 更新术语表
@@ -191,57 +181,53 @@ def update_chunks_with_reviewed_glossary(book_id, chapter_id, num_chunks, review
                 # 添加人工审查标记
                 data['human_reviewed'] = True
                 data['reviewed_glossary_count'] = len([t for t in updated_glossary if t.get('human_reviewed', False)])
+                changed = True
                 
             # 更新译文中的术语翻译
-            if 'translation' in data and data['translation'] and translation_updates:
+            if 'translation' in data and data['translation'] and sorted_updates:
                 translation = data['translation']
-                # 按长度降序排序，优先替换较长的术语，避免短术语被长术语包含
-                sorted_updates = sorted(translation_updates.items(), key=lambda x: len(x[0]), reverse=True)
-                
                 for original_trans, new_trans in sorted_updates:
                     # 直接替换，因为术语通常是完整的词或短语
-                    # 如果原文中存在该术语，则替换
                     if original_trans in translation:
-                        # 使用字符串替换（简单直接）
                         translation = translation.replace(original_trans, new_trans)
                         translation_updated = True
                 
-                data['translation'] = translation
-                
                 # 添加译文更新标记
                 if translation_updated:
+                    data['translation'] = translation
                     data['translation_updated_by_glossary'] = True
                     data['translation_updated_at'] = datetime.now().isoformat()
+                    memory_updates[f"{book_id}_ch{chapter_id}_ck{chunk_id}"] = translation
+                    changed = True
             
-                # 保存更新后的文件
-                with open(chunk_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                updated_count += 1
-            if translation_updated:
-                translation_updated_count += 1
-                
-                # 同时更新翻译记忆库
-                try:
-                    from utils.memory_storage import load_translation_memory, save_translation_memory
-                    memory_key = f"{book_id}_ch{chapter_id}_ck{chunk_id}"
-                    memory = load_translation_memory(book_id)
-                    if memory_key in memory:
-                        memory[memory_key]['translation'] = data['translation']
-                        memory[memory_key]['updated_at'] = datetime.now().isoformat()
-                        # 保存更新后的记忆库
-                        memory_file = f"output/{book_id}/translation_memory.json"
-                        with open(memory_file, 'w', encoding='utf-8') as f:
-                            json.dump(memory, f, ensure_ascii=False, indent=2)
-                except Exception as e:
-                    print(f"  [WARNING] 更新翻译记忆库失败: {e}")
+            if changed:
+                updated_chunks.append((chunk_id, data))
                     
         except Exception as e:
-            print(f"  [WARNING] 更新 chunk_{chunk_id:03d}.json 失败: {e}")
+            print(f"  [WARNING] 更新 chunk_{chunk_id:03d} 失败: {e}")
+    
+    # 一次性写回章节存储
+    store.put_many(updated_chunks)
+    
+    # 同时更新翻译记忆库（只读写一次）
+    if memory_updates:
+        try:
+            from utils.memory_storage import load_translation_memory
+            memory = load_translation_memory(book_id)
+            updated_at = datetime.now().isoformat()
+            for memory_key, translation in memory_updates.items():
+                if memory_key in memory:
+                    memory[memory_key]['translation'] = translation
+                    memory[memory_key]['updated_at'] = updated_at
+            memory_file = f"output/{book_id}/translation_memory.json"
+            with open(memory_file, 'w', encoding='utf-8') as f:
+                json.dump(memory, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"  [WARNING] 更新翻译记忆库失败: {e}")
     
-    print(f"  √ 已更新 {updated_count} 个chunk文件中的术语表")
-    if translation_updated_count > 0:
-        print(f"  √ 已更新 {translation_updated_count} 个chunk文件中的译文（根据术语审查结果）")
+    print(f"  √ 已更新 {len(updated_chunks)} 个chunk的术语表")
+    if memory_updates:
+        print(f"  √ 已更新 {len(memory_updates)} 个chunk的译文（根据术语审查结果）")
 
 def generate_chapter_summary(book_id, chapter_id, chunks_data, enable_human_review=True):
     """
@@ -324,7 +310,6 @@ def review_chapter_translation(book_id, chapter_id, num_chunks):
     Returns:
         审查结果字典，包含 accepted 和 feedback 字段
     """
-    import json
     import os
     
     print("\n" + "="*60)
@@ -333,20 +318,16 @@ def review_chapter_translation(book_id, chapter_id, num_chunks):
     
     # 收集所有chunk的翻译（过滤掉source_text为空的）
     translations = []
-    for chunk_id in range(num_chunks):
-        chunk_file = f"output/{book_id}/chapter_{chapter_id}/chunk_{chunk_id:03d}.json"
-        if os.path.exists(chunk_file):
-            with open(chunk_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                source_text = data.get('source_text', '').strip()
-                # 只添加source_text不为空的chunk
-                if source_text:
-                    translations.append({
-                        "chunk_id": chunk_id,
-                        "source_text": source_text,
-                        "translation": data.get('translation', ''),
-                        "quality_score": data.get('quality_score', 0)
-                    })
+    for chunk_id, data in get_chapter_store(book_id, chapter_id).chunks(num_chunks):
+        source_text = data.get('source_text', '').strip()
+        # 只添加source_text不为空的chunk
+        if source_text:
+            translations.append({
+                "chunk_id": chunk_id,
+                "source_text": source_text,
+                "translation": data.get('translation', ''),
+                "quality_score": data.get('quality_score', 0)
+            })
     
     if not translations:
         print("  [WARNING] 未找到有效的翻译结果（所有chunk的source_text都为空）")
@@ -507,22 +488,27 @@ def run_book_translation(json_path, agent, book_id="AlexNet_Paper", enable_human
         except Exception as e:
             print(f"  [WARNING] 加载章节摘要失败: {e}")
         
-        # 如果内容超过一定长度，仍然需要分割
-        chunks = split_chapter_into_chunks(content)
+        # 如果内容超过一定长度，仍然需要分割；与上一 chunk 重叠的句子只作为上下文传入，不重复翻译
+        chunks = list(iter_context_chunks(content))
         print(f"  Total chunks: {len(chunks)}")
+        # 之前的运行切出的chunk更多时，删除多出的尾部chunk，避免混入合并结果
+        stale = get_chapter_store(book_id, chapter_id).truncate(len(chunks))
+        if stale:
+            print(f"  删除了上次运行遗留的 {len(stale)} 个chunk（{stale[0]}-{stale[-1]}）")
         
         # ===== 阶段1: 自动翻译所有chunks =====
         print(f"\n  Phase 1: Auto-translating all chunks...")
         chunk_results = []
         chunks_data = []  # 用于生成摘要
         
-        for chunk_id, chunk_text in enumerate(chunks):
+        for chunk_id, (context_text, chunk_text) in enumerate(chunks):
             task = {
                 "input": {
                     "book_id": book_id,
                     "chapter_id": chapter_id,
                     "chunk_id": chunk_id,
                     "source_text": chunk_text,
+                    "context_text": context_text,
                     "thread_id": f"ch{chapter_id}_ck{chunk_id}",
                     # 传递全局术语表
                     "global_glossary": global_glossary,
@@ -601,13 +587,14 @@ def run_book_translation(json_path, agent, book_id="AlexNet_Paper", enable_human
                         chunk_results = []
                         chunks_data = []
                         
-                        for chunk_id, chunk_text in enumerate(chunks):
+                        for chunk_id, (context_text, chunk_text) in enumerate(chunks):
                             task = {
                                 "input": {
                                     "book_id": book_id,
                                     "chapter_id": chapter_id,
                                     "chunk_id": chunk_id,
                                     "source_text": chunk_text,
+                                    "context_text": context_text,
                                     "thread_id": f"ch{chapter_id}_ck{chunk_id}_retry{retry_count + 1}",
                                     "global_glossary": global_glossary,
                                     "critique": feedback,  # 传递修改意见到critique字段
@@ -638,8 +625,17 @@ def run_book_translation(json_path, agent, book_id="AlexNet_Paper", enable_human
             print(f"\n  Phase 4: Auto-accepting chapter translation (人工审查已禁用)...")
             print(f"  √ 章节翻译已自动接受")
         
+        # 导出旧的逐chunk文件布局（chapter_N/chunk_XXX.json），供评估与对比脚本使用
+        exported = get_chapter_store(book_id, chapter_id).export_legacy()
+        print(f"\n  √ 已导出 {len(exported)} 个chunk文件")
+        
         print(f"\n  √ Chapter {chapter_id} completed!")
         print("-" * 60 + "\n")
+    
+    # ===== 合并整书译文（只重新渲染有变化的章节） =====
+    titles = {i: chap.get("title") for i, chap in enumerate(chapters) if chap.get("title")}
+    result = assemble_book(book_id, titles=titles)
+    print(f"√ 整书译文已生成: {result['output']}（重新渲染 {len(result['rebuilt'])} 章，复用 {len(result['reused'])} 章）")
 
 def main():
     # 解析命令行参数
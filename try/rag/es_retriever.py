@@ -2,90 +2,172 @@ from elasticsearch import Elasticsearch
 import hashlib
 import json
 import os
+import re
 from datetime import datetime
+from typing import Optional, Tuple
 
 es = Elasticsearch("http://localhost:9200")
 INDEX_NAME = "zh_en_translation_memory"
+# 术语索引（由 ESBuilderScripts/create_es_index_standalone.py 创建，含 keyword / norm / prefix 子字段）
+TERM_INDEX_NAME = "zh_en_term_index"
+# 超过该长度或包含句末标点的查询视为句子，走翻译记忆索引
+MAX_TERM_LENGTH = 64
+MAX_TERM_WORDS = 6
+# 术语索引的检索级别（按代价从低到高）
+TERM_TIERS = ("exact", "prefix", "fuzzy")
 
-def retrieve_translation_memory(term: str, top_k: int = 3, include_context: bool = True) -> str:
+_available_indices = set()
+
+
+def _index_available(index: str) -> bool:
+    """检查索引是否存在（存在的结果会被缓存，避免每次检索都多一次请求）"""
+    if index in _available_indices:
+        return True
+    if es.indices.exists(index=index):
+        _available_indices.add(index)
+        return True
+    return False
+
+
+def _search(index: str, query: dict, size: int) -> list:
+    """执行检索并返回 hits，兼容新旧版本的 elasticsearch 客户端"""
+    try:
+        # 尝试新版本API（直接传参）
+        resp = es.search(index=index, size=size, query=query)
+    except (TypeError, AttributeError):
+        # 回退到旧版本API（使用body参数）
+        resp = es.search(index=index, size=size, body={"query": query})
+    return resp["hits"]["hits"]
+
+
+def looks_like_term(text: str) -> bool:
+    """判断查询是否为单个术语（短、无句末标点），而不是句子片段"""
+    text = text.strip()
+    if not text or len(text) > MAX_TERM_LENGTH:
+        return False
+    if re.search(r'[.!?;。！？；]', text):
+        return False
+    return len(text.split()) <= MAX_TERM_WORDS
+
+
+def search_term_index(term: str, top_k: int = 3, min_hits: int = 1) -> Tuple[list, Optional[str]]:
+    """
+    在术语索引中分级检索：精确匹配 → 前缀匹配 → 模糊匹配
+    累计命中达到 min_hits 时即停止，因此精确命中的查询只需一次廉价的 term 查询；
+    每次检索发出的 ES 查询数 = 停止时所在级别的序号（未命中时为 len(TERM_TIERS)）
+    
+    Args:
+        term: 检索术语
+        top_k: 最多返回的结果数
+        min_hits: 停止进入下一级所需的累计命中数（默认 1，即在第一个有命中的级别停止）
+    
+    Returns:
+        (hits, 停止时所在的级别名称)，未命中时为 ([], None)
+    """
+    queries = {
+        "exact": {"bool": {"should": [
+            {"term": {"en.norm": term}},
+            {"term": {"zh.norm": term}}
+        ]}},
+        "prefix": {"multi_match": {
+            "query": term,
+            "fields": ["en.prefix", "zh.prefix"]
+        }},
+        "fuzzy": {"multi_match": {
+            "query": term,
+            "fields": ["en^2", "zh"],
+            "type": "best_fields",
+            "fuzziness": "AUTO"
+        }},
+    }
+    
+    hits = []
+    seen_ids = set()
+    for tier_name in TERM_TIERS:
+        for h in _search(TERM_INDEX_NAME, queries[tier_name], top_k):
+            if h["_id"] not in seen_ids:
+                seen_ids.add(h["_id"])
+                hits.append(h)
+        if len(hits) >= min(min_hits, top_k):
+            break
+    
+    return hits[:top_k], (tier_name if hits else None)
+
+
+def search_memory_index(term: str, top_k: int = 3) -> list:
+    """在句子级翻译记忆索引中模糊检索"""
+    return _search(INDEX_NAME, {
+        "multi_match": {
+            "query": term,
+            "fields": ["en^2", "zh", "title^0.5"],  # 英文权重更高，标题权重较低
+            "type": "best_fields",
+            "fuzziness": "AUTO"  # 允许模糊匹配
+        }
+    }, top_k)
+
+
+def format_hits(hits: list, include_context: bool = True) -> str:
+    """将检索结果格式化为可直接喂给 LLM 的文本"""
+    snippets = []
+    for h in hits:
+        src = h["_source"].get("en", "")
+        tgt = h["_source"].get("zh", "")
+        
+        if include_context:
+            # 包含上下文信息
+            title = h["_source"].get("title", "")
+            source = h["_source"].get("source", "")
+            pair_type = h["_source"].get("pair_type", "")
+            term_type = h["_source"].get("term_type", "")
+            
+            context_info = []
+            if title:
+                context_info.append(f"章节: {title}")
+            if source:
+                context_info.append(f"来源: {source}")
+            if pair_type:
+                context_info.append(f"类型: {pair_type}")
+            if term_type:
+                context_info.append(f"术语类型: {term_type}")
+            
+            context_str = f" ({', '.join(context_info)})" if context_info else ""
+            snippets.append(f"- {src} → {tgt}{context_str}")
+        else:
+            snippets.append(f"- {src} → {tgt}")
+
+    return "\n".join(snippets)
+
+
+def retrieve_translation_memory(term: str, top_k: int = 3, include_context: bool = True,
+                                use_term_index: bool = True) -> str:
     """
     用术语检索翻译记忆，返回可直接喂给 LLM 的文本
     
+    单个术语优先在术语索引中分级检索（见 search_term_index），
+    未命中或查询是句子片段时，再到句子级翻译记忆索引中模糊检索
+    
     Args:
         term: 检索关键词（可以是术语或句子片段）
         top_k: 返回最相关的k个结果
         include_context: 是否包含上下文信息（标题、章节等）
+        use_term_index: 是否对单个术语使用术语索引
     """
     try:
-        # 检查ES连接
-        if not es.ping():
-            return "No relevant translation memory found (ES not available)."
+        hits = []
         
-        # 检查索引是否存在
-        if not es.indices.exists(index=INDEX_NAME):
-            return "No relevant translation memory found (index not exists)."
+        if use_term_index and looks_like_term(term) and _index_available(TERM_INDEX_NAME):
+            hits, _ = search_term_index(term, top_k=top_k)
         
-        # 构建查询
-        try:
-            # 尝试新版本API（直接传参）
-            resp = es.search(
-                index=INDEX_NAME,
-                size=top_k,
-                query={
-                    "multi_match": {
-                        "query": term,
-                        "fields": ["en^2", "zh", "title^0.5"],  # 英文权重更高，标题权重较低
-                        "type": "best_fields",
-                        "fuzziness": "AUTO"  # 允许模糊匹配
-                    }
-                }
-            )
-        except (TypeError, AttributeError):
-            # 回退到旧版本API（使用body参数）
-            resp = es.search(
-                index=INDEX_NAME,
-                size=top_k,
-                body={
-                    "query": {
-                        "multi_match": {
-                            "query": term,
-                            "fields": ["en^2", "zh", "title^0.5"],
-                            "type": "best_fields",
-                            "fuzziness": "AUTO"
-                        }
-                    }
-                }
-            )
+        if not hits:
+            # 检查索引是否存在（ES不可用时会抛出异常）
+            if not _index_available(INDEX_NAME):
+                return "No relevant translation memory found (index not exists)."
+            hits = search_memory_index(term, top_k=top_k)
 
-        hits = resp["hits"]["hits"]
         if not hits:
             return "No relevant translation memory found."
 
-        snippets = []
-        for h in hits:
-            src = h["_source"].get("en", "")
-            tgt = h["_source"].get("zh", "")
-            
-            if include_context:
-                # 包含上下文信息
-                title = h["_source"].get("title", "")
-                source = h["_source"].get("source", "")
-                pair_type = h["_source"].get("pair_type", "")
-                
-                context_info = []
-                if title:
-                    context_info.append(f"章节: {title}")
-                if source:
-                    context_info.append(f"来源: {source}")
-                if pair_type:
-                    context_info.append(f"类型: {pair_type}")
-                
-                context_str = f" ({', '.join(context_info)})" if context_info else ""
-                snippets.append(f"- {src} → {tgt}{context_str}")
-            else:
-                snippets.append(f"- {src} → {tgt}")
-
-        return "\n".join(snippets)
+        return format_hits(hits, include_context=include_context)
     
     except Exception as e:
         print(f"[WARNING] 检索翻译记忆失败: {e}")
@@ -132,27 +214,35 @@ def update_term_to_es(term_dict: dict) -> bool:
             doc['reviewed_at'] = term_dict['reviewed_at']
         
         # 使用 upsert 操作（存在则更新，不存在则插入）
-        # Elasticsearch 7.x+ 使用 body 参数，8.x+ 可以直接传参
-        try:
-            # 尝试新版本API（直接传参）
-            response = es.update(
-                index=INDEX_NAME,
-                id=doc_id,
-                doc=doc,
-                doc_as_upsert=True
-            )
-        except TypeError:
-            # 回退到旧版本API（使用body参数）
-            response = es.update(
-                index=INDEX_NAME,
-                id=doc_id,
-                body={
-                    "doc": doc,
-                    "doc_as_upsert": True
-                }
-            )
+        # 术语索引存在时同步写入，保证新审核的术语能被分级检索命中
+        indices = [INDEX_NAME]
+        if _index_available(TERM_INDEX_NAME):
+            indices.append(TERM_INDEX_NAME)
+        
+        results = {}
+        for index in indices:
+            # Elasticsearch 7.x+ 使用 body 参数，8.x+ 可以直接传参
+            try:
+                # 尝试新版本API（直接传参）
+                response = es.update(
+                    index=index,
+                    id=doc_id,
+                    doc=doc,
+                    doc_as_upsert=True
+                )
+            except TypeError:
+                # 回退到旧版本API（使用body参数）
+                response = es.update(
+                    index=index,
+                    id=doc_id,
+                    body={
+                        "doc": doc,
+                        "doc_as_upsert": True
+                    }
+                )
+            results[index] = response.get('result')
         
-        return response.get('result') in ['created', 'updated']
+        return results[INDEX_NAME] in ['created', 'updated']
         
     except Exception as e:
         print(f"[WARNING] 更新术语到ES失败: {e}")
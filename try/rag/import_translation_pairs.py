@@ -2,10 +2,14 @@
 导入已有论文翻译对到RAG系统
 支持从JSON格式的中英文对照文件中导入翻译对
 """
+import hashlib
+import itertools
 import json
 import os
 import sys
-from typing import List, Dict, Tuple
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 import re
 from datetime import datetime
 
@@ -16,7 +20,7 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from rag.es_retriever import es, INDEX_NAME, update_term_to_es
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import parallel_bulk
 
 
 def split_into_sentences(text: str) -> List[str]:
@@ -37,16 +41,16 @@ def split_into_sentences(text: str) -> List[str]:
     return sentences
 
 
-def load_translation_pairs(en_file: str, zh_file: str) -> List[Dict[str, str]]:
+def iter_translation_pairs(en_file: str, zh_file: str) -> Iterator[Dict[str, str]]:
     """
-    从JSON文件加载中英文对照的翻译对
+    从JSON文件逐个生成中英文对照的翻译对（惰性对齐，按章节处理）
     
     Args:
         en_file: 英文JSON文件路径
         zh_file: 中文JSON文件路径
     
-    Returns:
-        翻译对列表，每个元素包含：en, zh, title, level, chapter_index
+    Yields:
+        翻译对，每个元素包含：en, zh, title, level, chapter_index
     """
     try:
         with open(en_file, 'r', encoding='utf-8') as f:
@@ -55,19 +59,13 @@ def load_translation_pairs(en_file: str, zh_file: str) -> List[Dict[str, str]]:
             zh_data = json.load(f)
     except Exception as e:
         print(f"× 读取文件失败: {e}")
-        return []
+        return
     
     if len(en_data) != len(zh_data):
         print(f"[WARNING] 警告：英文文件有 {len(en_data)} 个章节，中文文件有 {len(zh_data)} 个章节，数量不匹配")
     
-    translation_pairs = []
-    
     # 按章节匹配
-    min_len = min(len(en_data), len(zh_data))
-    for i in range(min_len):
-        en_chapter = en_data[i]
-        zh_chapter = zh_data[i]
-        
+    for i, (en_chapter, zh_chapter) in enumerate(zip(en_data, zh_data)):
         en_title = en_chapter.get('title', '')
         zh_title = zh_chapter.get('title', '')
         en_content = en_chapter.get('content', '')
@@ -77,6 +75,19 @@ def load_translation_pairs(en_file: str, zh_file: str) -> List[Dict[str, str]]:
         if not en_content or not zh_content:
             continue
         
+        def make_pair(en_text, zh_text, pair_index, pair_type):
+            return {
+                'en': en_text,
+                'zh': zh_text,
+                'title': en_title,
+                'zh_title': zh_title,
+                'level': level,
+                'chapter_index': i,
+                'pair_index': pair_index,
+                'source': 'paper_translation',
+                'pair_type': pair_type
+            }
+        
         # 将内容切分成句子
         en_sentences = split_into_sentences(en_content)
         zh_sentences = split_into_sentences(zh_content)
@@ -91,202 +102,320 @@ def load_translation_pairs(en_file: str, zh_file: str) -> List[Dict[str, str]]:
                 # 使用段落作为翻译对
                 for j, (en_para, zh_para) in enumerate(zip(en_paragraphs, zh_paragraphs)):
                     if len(en_para) > 20 and len(zh_para) > 10:  # 过滤太短的段落
-                        translation_pairs.append({
-                            'en': en_para,
-                            'zh': zh_para,
-                            'title': en_title,
-                            'zh_title': zh_title,
-                            'level': level,
-                            'chapter_index': i,
-                            'pair_index': j,
-                            'source': 'paper_translation',
-                            'pair_type': 'paragraph'
-                        })
-            else:
+                        yield make_pair(en_para, zh_para, j, 'paragraph')
+            elif len(en_content) > 50 and len(zh_content) > 20:
                 # 如果段落也不匹配，使用整个章节内容作为一对
-                if len(en_content) > 50 and len(zh_content) > 20:
-                    translation_pairs.append({
-                        'en': en_content,
-                        'zh': zh_content,
-                        'title': en_title,
-                        'zh_title': zh_title,
-                        'level': level,
-                        'chapter_index': i,
-                        'pair_index': 0,
-                        'source': 'paper_translation',
-                        'pair_type': 'chapter'
-                    })
+                yield make_pair(en_content, zh_content, 0, 'chapter')
         else:
             # 句子数量匹配，使用句子作为翻译对
             for j, (en_sent, zh_sent) in enumerate(zip(en_sentences, zh_sentences)):
                 if len(en_sent) > 20 and len(zh_sent) > 10:  # 过滤太短的句子
-                    translation_pairs.append({
-                        'en': en_sent,
-                        'zh': zh_sent,
-                        'title': en_title,
-                        'zh_title': zh_title,
-                        'level': level,
-                        'chapter_index': i,
-                        'pair_index': j,
-                        'source': 'paper_translation',
-                        'pair_type': 'sentence'
-                    })
+                    yield make_pair(en_sent, zh_sent, j, 'sentence')
+
+
+def load_translation_pairs(en_file: str, zh_file: str) -> List[Dict[str, str]]:
+    """
+    从JSON文件加载中英文对照的翻译对
+    
+    Args:
+        en_file: 英文JSON文件路径
+        zh_file: 中文JSON文件路径
+    
+    Returns:
+        翻译对列表，每个元素包含：en, zh, title, level, chapter_index
+    """
+    return list(iter_translation_pairs(en_file, zh_file))
+
+
+def pair_content_hash(pair: Dict[str, str]) -> bytes:
+    """
+    基于中英文内容计算翻译对的内容哈希（用于导入前去重）
+    """
+    return hashlib.sha1(f"{pair['en']}\x00{pair['zh']}".encode('utf-8')).digest()
+
+
+def _get_index_settings(index: str) -> Dict[str, Optional[str]]:
+    """读取索引当前的 refresh_interval 和副本数（未显式设置时为 None）"""
+    resp = es.indices.get_settings(
+        index=index,
+        name=["index.refresh_interval", "index.number_of_replicas"],
+        flat_settings=True
+    )
+    settings = resp.get(index, {}).get("settings", {})
+    return {
+        "index.refresh_interval": settings.get("index.refresh_interval"),
+        "index.number_of_replicas": settings.get("index.number_of_replicas"),
+    }
+
+
+def _put_index_settings(index: str, settings: Dict[str, Optional[str]]) -> None:
+    try:
+        # 尝试新版本API（直接传参）
+        es.indices.put_settings(index=index, settings=settings)
+    except TypeError:
+        # 回退到旧版本API（使用body参数）
+        es.indices.put_settings(index=index, body=settings)
+
+
+@contextmanager
+def bulk_import_settings(index: str):
+    """
+    导入期间关闭索引刷新并将副本数设为0，结束后恢复原设置并刷新一次
+    
+    Args:
+        index: 索引名称
+    """
+    original_settings = None
+    try:
+        original_settings = _get_index_settings(index)
+        _put_index_settings(index, {
+            "index.refresh_interval": "-1",
+            "index.number_of_replicas": 0
+        })
+    except Exception as e:
+        print(f"  [WARNING] 调整索引导入设置失败，使用默认设置导入: {e}")
+    
+    try:
+        yield
+    finally:
+        if original_settings is not None:
+            try:
+                # None 会将设置恢复为ES默认值
+                _put_index_settings(index, original_settings)
+                es.indices.refresh(index=index)
+            except Exception as e:
+                print(f"  [WARNING] 恢复索引设置失败: {e}")
+
+
+def _ensure_index():
+    """确保翻译记忆索引存在（自动检测IK中文分词插件）"""
+    if es.indices.exists(index=INDEX_NAME):
+        return
+    
+    print(f"创建索引: {INDEX_NAME}")
+    try:
+        # 尝试使用中文分词器（如果安装了IK插件）
+        zh_analyzer = "standard"  # 默认使用standard
+        try:
+            # 先测试IK分词器是否可用（不同ES版本的API可能不同）
+            try:
+                es.indices.analyze(body={"analyzer": "ik_max_word", "text": "测试"})
+            except (TypeError, AttributeError):
+                es.indices.analyze(analyzer="ik_max_word", text="测试")
+            zh_analyzer = "ik_max_word"
+            print(f"  检测到IK中文分词插件，使用ik_max_word分词器")
+        except:
+            # 如果没有IK插件，使用standard分词器
+            print(f"  未检测到IK中文分词插件，使用standard分词器")
+        
+        es.indices.create(
+            index=INDEX_NAME,
+            body={
+                "mappings": {
+                    "properties": {
+                        # keyword 子字段供术语索引按长度筛选短条目（见 ESBuilderScripts/create_es_index_standalone.py），
+                        # 长句子不需要也不应写入 keyword
+                        "en": {"type": "text", "analyzer": "standard",
+                               "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+                        "zh": {"type": "text", "analyzer": zh_analyzer,
+                               "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+                        "title": {"type": "keyword"},
+                        "zh_title": {"type": "keyword"},
+                        "level": {"type": "integer"},
+                        "chapter_index": {"type": "integer"},
+                        "pair_index": {"type": "integer"},
+                        "source": {"type": "keyword"},
+                        "pair_type": {"type": "keyword"}
+                    }
+                }
+            }
+        )
+        print(f"  索引创建成功（中文分词器: {zh_analyzer}）")
+    except Exception as e:
+        print(f" 创建索引失败（可能已存在）: {e}")
+
+
+def _generate_actions(
+    pairs: Iterable[Dict[str, str]],
+    stats: Dict[str, int],
+    json_writer=None
+) -> Iterator[Dict]:
+    """
+    将翻译对流式转换为bulk action，按内容哈希去重
     
-    return translation_pairs
+    Args:
+        pairs: 翻译对迭代器
+        stats: 统计字典（原地更新 total / duplicates）
+        json_writer: 可选的回调，每个发送的翻译对都会传给它（用于流式保存JSON）
+    """
+    seen_hashes = set()
+    for pair in pairs:
+        stats["total"] += 1
+        content_hash = pair_content_hash(pair)
+        if content_hash in seen_hashes:
+            stats["duplicates"] += 1
+            continue
+        seen_hashes.add(content_hash)
+        
+        if json_writer is not None:
+            json_writer(pair)
+        
+        # 生成文档ID（基于英文内容和章节索引）
+        doc_id_str = f"{pair['en']}_{pair['chapter_index']}_{pair['pair_index']}"
+        doc_id = hashlib.sha1(doc_id_str.encode('utf-8')).hexdigest()
+        
+        yield {
+            "_index": INDEX_NAME,
+            "_id": doc_id,
+            "_source": pair
+        }
+
+
+class _StreamingPairsJsonWriter:
+    """
+    边导入边写出翻译对JSON文件，避免在内存中保留全部翻译对
+    输出结构与之前一致：source_files / import_statistics / translation_pairs
+    """
+
+    def __init__(self, json_path: str, en_file: str, zh_file: str):
+        self.json_path = json_path
+        self.count = 0
+        self._f = open(json_path, 'w', encoding='utf-8')
+        self._f.write('{\n  "source_files": ')
+        self._f.write(json.dumps({"en": en_file, "zh": zh_file}, ensure_ascii=False))
+        self._f.write(',\n  "translation_pairs": [')
+
+    def __call__(self, pair: Dict[str, str]):
+        self._f.write(",\n    " if self.count else "\n    ")
+        self._f.write(json.dumps(pair, ensure_ascii=False))
+        self.count += 1
+
+    def close(self, import_statistics: Dict[str, int]):
+        self._f.write('\n  ],\n  "import_statistics": ')
+        self._f.write(json.dumps(import_statistics, ensure_ascii=False))
+        self._f.write('\n}\n')
+        self._f.close()
 
 
 def import_translation_pairs_to_es(
     en_file: str,
     zh_file: str,
-    batch_size: int = 100,
+    batch_size: int = 500,
     save_json: bool = True,
-    json_output_dir: str = "output/imported_translations"
+    json_output_dir: str = "output/imported_translations",
+    thread_count: int = 4,
+    queue_size: int = 4
 ) -> Dict[str, int]:
     """
-    将翻译对导入到Elasticsearch
+    将翻译对流式导入到Elasticsearch
+    
+    翻译对按章节惰性生成，经内容哈希去重后交给 parallel_bulk 并行发送，
+    除去重用的哈希集合外，内存占用只与 thread_count * queue_size * batch_size 有关。
+    导入期间会关闭索引刷新并将副本数设为0，结束后恢复。
     
     Args:
         en_file: 英文JSON文件路径
         zh_file: 中文JSON文件路径
-        batch_size: 批量导入的大小
+        batch_size: 每个bulk请求的文档数
+        save_json: 是否同时把导入的翻译对保存为JSON文件
+        json_output_dir: JSON文件保存目录
+        thread_count: parallel_bulk 的并发线程数
+        queue_size: parallel_bulk 的待发送批次队列长度
     
     Returns:
-        统计信息：{"success": 成功数量, "failed": 失败数量, "total": 总数}
+        统计信息：{"success": 成功数量, "failed": 失败数量, "total": 总数,
+                  "duplicates": 去重跳过数量, "docs_per_second": 导入速度}
     """
     print(f"\n开始导入翻译对...")
     print(f"   英文文件: {en_file}")
     print(f"   中文文件: {zh_file}")
     
-    # 加载翻译对
-    translation_pairs = load_translation_pairs(en_file, zh_file)
+    # 惰性加载翻译对，先取出第一个判断是否为空
+    pairs = iter_translation_pairs(en_file, zh_file)
+    first_pair = next(pairs, None)
     
-    if not translation_pairs:
+    if first_pair is None:
         print("× 未找到任何翻译对")
         return {"success": 0, "failed": 0, "total": 0}
     
-    print(f"√ 加载了 {len(translation_pairs)} 个翻译对")
+    pairs = itertools.chain([first_pair], pairs)
     
     # 检查ES连接
     try:
         if not es.ping():
             print("× 无法连接到Elasticsearch")
-            return {"success": 0, "failed": len(translation_pairs), "total": len(translation_pairs)}
+            total = sum(1 for _ in pairs)
+            return {"success": 0, "failed": total, "total": total}
     except Exception as e:
         print(f"× Elasticsearch连接失败: {e}")
-        return {"success": 0, "failed": len(translation_pairs), "total": len(translation_pairs)}
+        total = sum(1 for _ in pairs)
+        return {"success": 0, "failed": total, "total": total}
     
     # 确保索引存在
-    if not es.indices.exists(index=INDEX_NAME):
-        print(f"创建索引: {INDEX_NAME}")
+    _ensure_index()
+    
+    # 准备流式JSON输出（如果启用）
+    json_writer = None
+    if save_json:
         try:
-            # 尝试使用中文分词器（如果安装了IK插件）
-            zh_analyzer = "standard"  # 默认使用standard
-            try:
-                # 先测试IK分词器是否可用（不同ES版本的API可能不同）
-                try:
-                    es.indices.analyze(body={"analyzer": "ik_max_word", "text": "测试"})
-                except (TypeError, AttributeError):
-                    es.indices.analyze(analyzer="ik_max_word", text="测试")
-                zh_analyzer = "ik_max_word"
-                print(f"  检测到IK中文分词插件，使用ik_max_word分词器")
-            except:
-                # 如果没有IK插件，使用standard分词器
-                print(f"  未检测到IK中文分词插件，使用standard分词器")
-            
-            es.indices.create(
-                index=INDEX_NAME,
-                body={
-                    "mappings": {
-                        "properties": {
-                            "en": {"type": "text", "analyzer": "standard"},
-                            "zh": {"type": "text", "analyzer": zh_analyzer},
-                            "title": {"type": "keyword"},
-                            "zh_title": {"type": "keyword"},
-                            "level": {"type": "integer"},
-                            "chapter_index": {"type": "integer"},
-                            "pair_index": {"type": "integer"},
-                            "source": {"type": "keyword"},
-                            "pair_type": {"type": "keyword"}
-                        }
-                    }
-                }
-            )
-            print(f"  索引创建成功（中文分词器: {zh_analyzer}）")
+            # 确保使用绝对路径
+            if not os.path.isabs(json_output_dir):
+                json_output_dir = os.path.join(project_root, json_output_dir)
+            os.makedirs(json_output_dir, exist_ok=True)
+            # 从文件名提取基础名称
+            base_name = os.path.splitext(os.path.basename(en_file))[0].replace('_en', '')
+            json_path = os.path.join(json_output_dir, f"{base_name}_imported.json")
+            json_writer = _StreamingPairsJsonWriter(json_path, en_file, zh_file)
         except Exception as e:
-            print(f" 创建索引失败（可能已存在）: {e}")
+            print(f"[WARNING] 创建JSON文件失败: {e}")
     
-    # 批量导入
+    stats = {"total": 0, "duplicates": 0}
     success_count = 0
     failed_count = 0
+    start_time = time.perf_counter()
     
-    # 使用bulk API批量导入
-    actions = []
-    for pair in translation_pairs:
-        # 生成文档ID（基于英文内容和章节索引）
-        import hashlib
-        doc_id_str = f"{pair['en']}_{pair['chapter_index']}_{pair['pair_index']}"
-        doc_id = hashlib.sha1(doc_id_str.encode('utf-8')).hexdigest()
-        
-        action = {
-            "_index": INDEX_NAME,
-            "_id": doc_id,
-            "_source": pair
-        }
-        actions.append(action)
-        
-        # 达到批量大小时执行导入
-        if len(actions) >= batch_size:
-            try:
-                success, failed = bulk(es, actions, raise_on_error=False)
-                success_count += success
-                failed_count += len(failed) if failed else 0
-                actions = []
-                print(f"  已导入 {success_count} 个翻译对...", end='\r')
-            except Exception as e:
-                print(f"\n  [WARNING] 批量导入出错: {e}")
-                failed_count += len(actions)
-                actions = []
-    
-    # 导入剩余的
-    if actions:
+    # 使用 parallel_bulk 流式并行导入
+    with bulk_import_settings(INDEX_NAME):
         try:
-            success, failed = bulk(es, actions, raise_on_error=False)
-            success_count += success
-            failed_count += len(failed) if failed else 0
+            for ok, info in parallel_bulk(
+                es,
+                _generate_actions(pairs, stats, json_writer=json_writer),
+                thread_count=thread_count,
+                chunk_size=batch_size,
+                queue_size=queue_size,
+                raise_on_error=False,
+                raise_on_exception=False
+            ):
+                if ok:
+                    success_count += 1
+                else:
+                    failed_count += 1
+                
+                if (success_count + failed_count) % batch_size == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print(f"  已导入 {success_count} 个翻译对 ({success_count / max(elapsed, 1e-9):.0f} docs/s)...", end='\r')
         except Exception as e:
             print(f"\n  [WARNING] 批量导入出错: {e}")
-            failed_count += len(actions)
+            failed_count += stats["total"] - stats["duplicates"] - success_count - failed_count
     
-    print(f"\n√ 导入完成: 成功 {success_count} 个，失败 {failed_count} 个，总计 {len(translation_pairs)} 个")
+    elapsed = time.perf_counter() - start_time
+    docs_per_second = (success_count + failed_count) / elapsed if elapsed > 0 else 0.0
     
-    # 保存到JSON文件（如果启用）
+    print(f"\n√ 导入完成: 成功 {success_count} 个，失败 {failed_count} 个，"
+          f"去重跳过 {stats['duplicates']} 个，总计 {stats['total']} 个")
+    print(f"   耗时 {elapsed:.2f}s，速度 {docs_per_second:.0f} docs/s")
+    
+    # 完成JSON文件（如果启用）
     json_path = None
-    if save_json and translation_pairs:
+    if json_writer is not None:
         try:
-            # 确保使用绝对路径
-            if not os.path.isabs(json_output_dir):
-                json_output_dir = os.path.join(project_root, json_output_dir)
-            os.makedirs(json_output_dir, exist_ok=True)
-            # 从文件名提取基础名称
-            base_name = os.path.splitext(os.path.basename(en_file))[0].replace('_en', '')
-            json_filename = f"{base_name}_imported.json"
-            json_path = os.path.join(json_output_dir, json_filename)
-            
-            # 保存翻译对
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "source_files": {
-                        "en": en_file,
-                        "zh": zh_file
-                    },
-                    "import_statistics": {
-                        "total": len(translation_pairs),
-                        "success": success_count,
-                        "failed": failed_count
-                    },
-                    "translation_pairs": translation_pairs
-                }, f, ensure_ascii=False, indent=2)
-            
+            json_writer.close({
+                "total": stats["total"],
+                "duplicates": stats["duplicates"],
+                "success": success_count,
+                "failed": failed_count
+            })
+            json_path = json_writer.json_path
             print(f"√ 已保存翻译对到JSON文件: {json_path}")
         except Exception as e:
             print(f"[WARNING] 保存JSON文件失败: {e}")
@@ -294,7 +423,9 @@ def import_translation_pairs_to_es(
     return {
         "success": success_count,
         "failed": failed_count,
-        "total": len(translation_pairs),
+        "total": stats["total"],
+        "duplicates": stats["duplicates"],
+        "docs_per_second": round(docs_per_second, 2),
         "json_path": json_path
     }
 
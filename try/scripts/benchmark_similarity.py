@@ -0,0 +1,116 @@
+"""
+基准脚本：对比评估中的字符串相似度计算耗时
+旧方案：纯 Python O(n·m) 编辑距离 + difflib.SequenceMatcher
+新方案：utils.similarity 内核（rapidfuzz / 位并行），逐条与批量两种调用方式
+使用真实的翻译输出目录与参考译文，并校验新旧分数完全一致
+"""
+import sys
+import os
+import json
+import time
+import argparse
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from eval import collect_all_chunks, load_reference_translations_enhanced
+from utils.similarity import (
+    HAS_RAPIDFUZZ, levenshtein_distance, batch_levenshtein_distance, sequence_ratio
+)
+
+
+def legacy_levenshtein_distance(s1, s2):
+    """原 TranslationEvaluator.evaluate_edit_distance 中的实现"""
+    if len(s1) < len(s2):
+        return legacy_levenshtein_distance(s2, s1)
+    if len(s2) == 0:
+        return len(s1)
+
+    previous_row = range(len(s2) + 1)
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            insertions = previous_row[j + 1] + 1
+            deletions = current_row[j] + 1
+            substitutions = previous_row[j] + (c1 != c2)
+            current_row.append(min(insertions, deletions, substitutions))
+        previous_row = current_row
+
+    return previous_row[-1]
+
+
+def load_pairs(output_dir: str, reference_file: str):
+    """返回 (译文, 参考译文) 与 (原文, 回译文) 两组文本对"""
+    references = load_reference_translations_enhanced(reference_file) if reference_file else {}
+    edit_pairs, back_translation_pairs = [], []
+    for chapter_id, chunk_id, chunk_path in collect_all_chunks(output_dir):
+        with open(chunk_path, 'r', encoding='utf-8') as f:
+            chunk = json.load(f)
+        source_text = chunk.get('source_text', '').strip()
+        translation = chunk.get('translation', '')
+        if not source_text:
+            continue
+
+        reference = references.get(chapter_id, {}).get(chunk_id)
+        if reference:
+            edit_pairs.append((translation, reference))
+
+        history = chunk.get('refinement_history', [])
+        if history and history[-1].get('back_translation'):
+            back_translation_pairs.append((source_text.lower(), history[-1]['back_translation'].lower()))
+    return edit_pairs, back_translation_pairs
+
+
+def timed(fn, repeat: int):
+    # 预热一次，排除首次调用的导入开销
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评估相似度内核基准")
+    parser.add_argument('--output-dir', default=os.path.join(project_root, 'output', 'YOLO'))
+    parser.add_argument('--reference', default=os.path.join(project_root, 'data', 'yolo_ch.json'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    edit_pairs, bt_pairs = load_pairs(args.output_dir, args.reference)
+    n_chars = sum(len(a) + len(b) for a, b in edit_pairs)
+    print(f"编辑距离文本对: {len(edit_pairs)}（共 {n_chars} 字符），回译文本对: {len(bt_pairs)}")
+    print(f"rapidfuzz 可用: {HAS_RAPIDFUZZ}")
+    if not edit_pairs:
+        print("没有可用的参考译文对，请检查 --output-dir 与 --reference")
+        return
+
+    translations = [a for a, _ in edit_pairs]
+    references = [b for _, b in edit_pairs]
+
+    legacy_time, legacy = timed(lambda: [legacy_levenshtein_distance(a, b) for a, b in edit_pairs], args.repeat)
+    kernel_time, kernel = timed(lambda: [levenshtein_distance(a, b) for a, b in edit_pairs], args.repeat)
+    batch_time, batch = timed(lambda: batch_levenshtein_distance(translations, references), args.repeat)
+    assert legacy == kernel == batch, "编辑距离结果不一致"
+
+    print(f"\n编辑距离（{args.repeat} 次平均）:")
+    print(f"  旧实现（纯 Python DP）: {legacy_time * 1000:10.2f} ms")
+    print(f"  新内核（逐条）:         {kernel_time * 1000:10.2f} ms  加速 {legacy_time / kernel_time:8.0f}x")
+    print(f"  新内核（批量）:         {batch_time * 1000:10.2f} ms  加速 {legacy_time / batch_time:8.0f}x")
+
+    if bt_pairs:
+        import difflib
+        _, bt_legacy = timed(
+            lambda: [difflib.SequenceMatcher(None, a, b).ratio() for a, b in bt_pairs], args.repeat)
+        bt_time, bt = timed(lambda: [sequence_ratio(a, b) for a, b in bt_pairs], args.repeat)
+        assert bt_legacy == bt, "回译相似度结果不一致"
+        print(f"\n回译相似度（difflib 算法，保持不变）: {bt_time * 1000:.2f} ms")
+
+    print("\n新旧分数完全一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+基准脚本：对比术语检索延迟
+旧方案：在句子级翻译记忆索引上做 multi_match + fuzziness
+新方案：在术语索引上分级检索（精确 → 前缀 → 模糊），在第一个有命中的级别停止
+每次分级检索发出的 ES 查询数：精确命中 1 次，前缀命中 2 次，模糊命中或未命中 3 次（旧方案固定 1 次），
+脚本会按命中级别分布输出平均查询数
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+from collections import Counter
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from rag.es_retriever import (
+    es, INDEX_NAME, TERM_INDEX_NAME, TERM_TIERS,
+    search_memory_index, search_term_index
+)
+
+
+def load_terms(glossary_path: str) -> list:
+    """以审核后术语表的英文术语作为查询集"""
+    with open(glossary_path, 'r', encoding='utf-8') as f:
+        glossary = json.load(f)
+    return [term for term in glossary if term.strip()]
+
+
+def measure(lookup, terms: list, repeat: int, warmup: int = 1) -> list:
+    """返回每次查询的延迟（毫秒）"""
+    for _ in range(warmup):
+        for term in terms:
+            lookup(term)
+
+    latencies = []
+    for _ in range(repeat):
+        for term in terms:
+            start = time.perf_counter()
+            lookup(term)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(name: str, latencies: list):
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{name:<12} n={len(latencies):<6} "
+          f"mean={statistics.fmean(latencies):7.2f}ms  p50={q[49]:7.2f}ms  p99={q[98]:7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="术语检索延迟基准")
+    parser.add_argument("--glossary", default=os.path.join(project_root, "output", "reviewed_glossary.json"))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for index in (INDEX_NAME, TERM_INDEX_NAME):
+        if not es.indices.exists(index=index):
+            print(f"❌ 索引 {index} 不存在，请先运行 ESBuilderScripts/create_es_index_standalone.py")
+            sys.exit(1)
+
+    terms = load_terms(args.glossary)
+    print(f"查询术语数: {len(terms)}，重复 {args.repeat} 轮，top_k={args.top_k}")
+
+    legacy = measure(lambda t: search_memory_index(t, top_k=args.top_k), terms, args.repeat)
+    tiered = measure(lambda t: search_term_index(t, top_k=args.top_k), terms, args.repeat)
+
+    print("="*60)
+    summarize("multi_match", legacy)
+    summarize("tiered", tiered)
+
+    # 各级命中分布：精确/前缀命中越多，越少查询需要走模糊匹配
+    tiers = Counter(search_term_index(t, top_k=args.top_k)[1] or "miss" for t in terms)
+    print("命中级别分布: " + ", ".join(f"{k}={v}" for k, v in tiers.most_common()))
+    # 在第 i 级停止需要 i 次查询，未命中则查完所有级别
+    n_queries = sum(
+        (TERM_TIERS.index(tier) + 1 if tier in TERM_TIERS else len(TERM_TIERS)) * count
+        for tier, count in tiers.items()
+    )
+    print(f"平均每次检索的 ES 查询数: tiered={n_queries / max(len(terms), 1):.2f}, multi_match=1.00")
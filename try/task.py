@@ -68,22 +68,8 @@ class TranslationTask:
         }
     def assemble_chapter(self, book_id, chapter_id):
         """
-        将所有保存的 chunk json 文件合并为一个 Markdown 或 Text
+        将章节存储中的所有 chunk 合并为一个 Markdown 或 Text（去除相邻 chunk 的重叠部分）
         """
-        import glob
-        import json
-        path = f"output/{book_id}/chapter_{chapter_id}/chunk_*.json"
-        files = sorted(glob.glob(path))
-        
-        full_translation = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as reader:
-                data = json.load(reader)
-                full_translation.append(data['translation'])
-        
-        # 保存最终章节结果
+        from utils.book_assembler import assemble_chapter
         final_path = f"output/{book_id}/chapter_{chapter_id}_final.md"
-        with open(final_path, 'w', encoding='utf-8') as f:
-            f.write("\n\n".join(full_translation))
-        
-        return final_path
\ No newline at end of file
+        return assemble_chapter(book_id, chapter_id, final_path)
\ No newline at end of file
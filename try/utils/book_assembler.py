@@ -0,0 +1,257 @@
+"""
+整书合并
+按章节顺序把章节存储中的译文流式写出为 Markdown 或纯文本：
+- 每章先渲染为 output/{book_id}/assembled/chapter_N.{md,txt}，整书文件由各章文件依次流式拷贝而成
+- assembled/manifest.json 记录每章 chunk 内容的哈希，只有哈希变化的章节才重新渲染
+- 旧的 chunk（原文包含与上一 chunk 重叠的句子）去除重叠在译文中造成的重复；带 context_text 的 chunk 只翻译了新内容，无需去重
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Dict, List, Optional
+
+from .chapter_store import STORE_FILE_NAME, get_chapter_store
+
+
+# 合并逻辑版本，修改渲染或去重方式时递增，使已渲染的章节失效
+ASSEMBLER_VERSION = 1
+MANIFEST_FILE_NAME = "manifest.json"
+
+# 句子结束标点（英文句点需后接空白或位于结尾，避免匹配小数与缩写中的点）
+_SENTENCE_END = re.compile(r'[。！？!?]|\.(?=\s|$)')
+
+
+def source_overlap_length(prev_source: str, source: str, max_overlap: int = 2000) -> int:
+    """
+    当前 chunk 原文开头与上一 chunk 原文结尾重叠的字符数（最长的相同前缀/后缀）
+    """
+    prev_source = prev_source.rstrip()
+    for k in range(min(len(prev_source), len(source), max_overlap), 0, -1):
+        if prev_source.endswith(source[:k]):
+            return k
+    return 0
+
+
+def _bigrams(text: str) -> set:
+    text = re.sub(r'\s+', '', text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _containment(text: str, window: str) -> float:
+    """text 的字符 bigram 出现在 window 中的比例"""
+    grams = _bigrams(text)
+    if not grams:
+        return 0.0
+    return len(grams & _bigrams(window)) / len(grams)
+
+
+def dedupe_overlap(prev_translation: str, translation: str, prev_source: str, source: str,
+                   threshold: float = 0.5) -> str:
+    """
+    去除当前 chunk 译文开头与上一 chunk 译文重复的部分
+
+    重叠部分是上一 chunk 末尾的若干完整句子（旧的按字符切分的 chunk 开头可能是半句话）：
+    1. 若译文开头与上一 chunk 译文结尾完全相同，直接去除
+    2. 否则数出原文重叠部分包含的句子数 n，在译文第 n 个句末标点处截断；截断前缀的字符 bigram
+       需大部分出现在上一 chunk 译文结尾，且长度不超过按原文比例估计的两倍
+    找不到可信的截断点时保留原译文（宁可重复也不丢失内容）
+
+    Args:
+        prev_translation: 上一 chunk 的译文
+        translation: 当前 chunk 的译文
+        prev_source: 上一 chunk 的原文
+        source: 当前 chunk 的原文
+        threshold: 判定为重复的 bigram 包含比例
+    """
+    overlap = source_overlap_length(prev_source, source)
+    if overlap == 0 or not translation or not prev_translation:
+        return translation
+
+    # 译文完全重复的前缀
+    for m in range(min(len(prev_translation), len(translation)), 7, -1):
+        if prev_translation.endswith(translation[:m]):
+            return translation[m:].lstrip()
+
+    n_sentences = len(_SENTENCE_END.findall(source[:overlap].rstrip() + " "))
+    if n_sentences == 0:
+        return translation
+    ends = [m.end() for m in _SENTENCE_END.finditer(translation)]
+    if len(ends) < n_sentences:
+        return translation
+    cut = ends[n_sentences - 1]
+
+    estimate = len(translation) * overlap / max(len(source), 1)
+    window = prev_translation[-int(cut * 1.5) - 10:]
+    if cut >= len(translation) or cut > 2 * estimate + 10 or _containment(translation[:cut], window) < threshold:
+        return translation
+    return translation[cut:].lstrip()
+
+
+def chapter_hash(chunks: List[tuple], fmt: str, title: Optional[str]) -> str:
+    digest = hashlib.sha1(f"{ASSEMBLER_VERSION}\0{fmt}\0{title}".encode('utf-8'))
+    for chunk_id, data in chunks:
+        digest.update(f"\0{chunk_id}\0{data.get('context_text')}\0{data.get('source_text', '')}"
+                      f"\0{data.get('translation', '')}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_chapter(chunks: List[tuple], out, fmt: str = "md", title: Optional[str] = None):
+    """
+    将一个章节的 chunk 逐个写入文件对象（已去除重叠）
+
+    Args:
+        chunks: 按 chunk_id 排序的 (chunk_id, 数据) 列表
+        out: 可写的文本文件对象
+        fmt: "md" 或 "txt"
+        title: 章节标题（可选）
+    """
+    if title:
+        out.write(f"## {title}\n\n" if fmt == "md" else f"{title}\n\n")
+    prev = None
+    first = True
+    for _, data in chunks:
+        source = data.get('source_text', '')
+        translation = (data.get('translation') or '').strip()
+        if not source.strip() or not translation:
+            continue
+        text = translation
+        # 重叠部分以 context_text 单独保存的 chunk 没有重复翻译
+        if prev is not None and 'context_text' not in data:
+            text = dedupe_overlap(prev['translation'], translation, prev['source'], source)
+        prev = {'translation': translation, 'source': source}
+        if not text:
+            continue
+        if not first:
+            out.write("\n\n")
+        out.write(text)
+        first = False
+    out.write("\n")
+
+
+def list_chapters(book_id: str, base_dir: str = "output") -> List[int]:
+    """书籍输出目录下的所有章节ID（升序）"""
+    book_dir = os.path.join(base_dir, str(book_id))
+    chapter_ids = []
+    if not os.path.isdir(book_dir):
+        return chapter_ids
+    for name in os.listdir(book_dir):
+        path = os.path.join(book_dir, name)
+        if not name.startswith("chapter_") or not os.path.isdir(path):
+            continue
+        try:
+            chapter_ids.append(int(name.split("_")[1]))
+        except ValueError:
+            continue
+    return sorted(chapter_ids)
+
+
+def assemble_chapter(book_id: str, chapter_id: int, output_path: str, fmt: str = "md",
+                     title: Optional[str] = None, base_dir: str = "output") -> str:
+    """渲染单个章节到 output_path"""
+    chunks = get_chapter_store(book_id, chapter_id, base_dir).chunks()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        render_chapter(chunks, f, fmt, title)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def assemble_book(book_id: str, fmt: str = "md", base_dir: str = "output",
+                  titles: Optional[Dict[int, str]] = None, output_path: Optional[str] = None,
+                  force: bool = False) -> Dict:
+    """
+    增量合并整本书
+
+    Args:
+        book_id: 书籍ID
+        fmt: "md" 或 "txt"
+        base_dir: 输出根目录
+        titles: {章节ID: 标题}（可选）
+        output_path: 整书输出路径，默认 output/{book_id}/{book_id}.{fmt}
+        force: 忽略清单，重新渲染所有章节
+
+    Returns:
+        {"output": 整书路径, "rebuilt": 重新渲染的章节, "reused": 复用的章节}
+    """
+    if fmt not in ("md", "txt"):
+        raise ValueError(f"不支持的格式: {fmt}")
+    titles = titles or {}
+    book_dir = os.path.join(base_dir, str(book_id))
+    assembled_dir = os.path.join(book_dir, "assembled")
+    manifest_path = os.path.join(assembled_dir, MANIFEST_FILE_NAME)
+    output_path = output_path or os.path.join(book_dir, f"{book_id}.{fmt}")
+
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            manifest = {}
+
+    rebuilt, reused = [], []
+    new_manifest = {}
+    os.makedirs(assembled_dir, exist_ok=True)
+    tmp_output = output_path + ".tmp"
+    with open(tmp_output, 'w', encoding='utf-8') as book_file:
+        if fmt == "md":
+            book_file.write(f"# {book_id}\n\n")
+        for chapter_id in list_chapters(book_id, base_dir):
+            chapter_path = os.path.join(book_dir, f"chapter_{chapter_id}")
+            has_store = os.path.exists(os.path.join(chapter_path, STORE_FILE_NAME))
+            has_legacy = any(n.startswith("chunk_") and n.endswith(".json") for n in os.listdir(chapter_path))
+            if not has_store and not has_legacy:
+                continue
+            chunks = get_chapter_store(book_id, chapter_id, base_dir).chunks()
+            title = titles.get(chapter_id)
+            digest = chapter_hash(chunks, fmt, title)
+            part_path = os.path.join(assembled_dir, f"chapter_{chapter_id}.{fmt}")
+
+            if manifest.get(str(chapter_id)) == digest and os.path.exists(part_path):
+                reused.append(chapter_id)
+            else:
+                tmp_part = part_path + ".tmp"
+                with open(tmp_part, 'w', encoding='utf-8') as part_file:
+                    render_chapter(chunks, part_file, fmt, title)
+                os.replace(tmp_part, part_path)
+                rebuilt.append(chapter_id)
+            new_manifest[str(chapter_id)] = digest
+
+            with open(part_path, 'r', encoding='utf-8') as part_file:
+                shutil.copyfileobj(part_file, book_file)
+            book_file.write("\n")
+    os.replace(tmp_output, output_path)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f, ensure_ascii=False, indent=2)
+    return {"output": output_path, "rebuilt": rebuilt, "reused": reused}
+
+
+def load_chapter_titles(json_path: str) -> Dict[int, str]:
+    """从章节 JSON（split_epub_by_chapter 的输入）读取章节标题"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        chapters = json.load(f)
+    return {i: chap.get("title") for i, chap in enumerate(chapters) if chap.get("title")}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="将书籍的章节译文合并为一个 Markdown/文本文件（增量）")
+    parser.add_argument("book_id", help="书籍ID（output/ 下的目录名）")
+    parser.add_argument("--format", choices=["md", "txt"], default="md", help="输出格式（默认 md）")
+    parser.add_argument("--base-dir", default="output", help="输出根目录（默认 output）")
+    parser.add_argument("--source-json", default=None, help="章节 JSON 文件，用于读取章节标题（可选）")
+    parser.add_argument("--output", default=None, help="整书输出路径（默认 output/{book_id}/{book_id}.{format}）")
+    parser.add_argument("--force", action="store_true", help="重新渲染所有章节")
+    args = parser.parse_args()
+
+    result = assemble_book(
+        args.book_id, fmt=args.format, base_dir=args.base_dir,
+        titles=load_chapter_titles(args.source_json) if args.source_json else None,
+        output_path=args.output, force=args.force
+    )
+    print(f"√ 已生成: {result['output']}（重新渲染 {len(result['rebuilt'])} 章，复用 {len(result['reused'])} 章）")
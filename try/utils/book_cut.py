@@ -1,7 +1,33 @@
 from ebooklib import epub
 from bs4 import BeautifulSoup
+import bisect
 import json
+import re
 from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from core.latex_utils import LATEX_PATTERNS
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # 未安装 tiktoken（或无法加载编码表）时使用字符数估计
+    _ENCODING = None
+
+# 单 chunk 的 token 预算与重叠上下文的 token 数
+DEFAULT_MAX_TOKENS = 800
+DEFAULT_OVERLAP_TOKENS = 80
+
+_CJK_CHAR = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+# 句子边界：中文句末标点、英文句末标点后接空白、换行（句末可带引号/括号）
+_SENTENCE_BREAK = re.compile(r'[。！？…]+[”’"」』）)]*\s*|[.!?]+[”’"）)]*(?:\s+|$)|\n+')
+# 超长句子的次级切分点：逗号、分号、冒号或空白
+_CLAUSE_BREAK = re.compile(r'[，；、：,;:]\s*|\s+')
+# 句点前的单词（含 "e.g" 之类带点的缩写）
+_WORD_BEFORE = re.compile(r'([A-Za-z][A-Za-z.]*)$')
+# 句点后不视为句子结束的常见缩写
+_ABBREVIATIONS = {"e.g", "i.e", "etc", "fig", "figs", "eq", "eqs", "al", "vs", "cf", "no", "sec", "ref", "mr", "dr"}
 
 # def split_epub_by_chapter(epub_path):
 #     """加载EPUB并提取章节结构化的内容"""
@@ -51,28 +77,182 @@ def split_epub_by_chapter(json_path):
     
     return chapters
 
-def split_chapter_into_chunks(
-    chapter_text: str,
-    max_chars: int = 1200,
-    overlap: int = 200
-):
+def count_tokens(text: str) -> int:
+    """
+    估计文本的模型 token 数
+    安装了 tiktoken 时使用 cl100k_base 编码，否则按每个中日韩字符 1 个 token、其余字符每 4 个 1 个 token 估计
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _latex_spans(text: str) -> List[Tuple[int, int]]:
+    """文本中 LaTeX 公式的区间（按起点排序）"""
+    spans = []
+    masked = text
+    # 先匹配块级公式并将其遮盖，避免行内公式的 $...$ 与 $$ 错误配对
+    for pattern in reversed(LATEX_PATTERNS):
+        found = [(m.start(), m.end()) for m in re.finditer(pattern, masked, re.DOTALL)]
+        if not found:
+            continue
+        parts, prev = [], 0
+        for start, end in found:
+            parts.append(masked[prev:start])
+            parts.append("\0" * (end - start))
+            prev = end
+        parts.append(masked[prev:])
+        masked = "".join(parts)
+        spans.extend(found)
+    return sorted(spans)
+
+
+def _inside(spans: List[Tuple[int, int]], starts: List[int], pos: int) -> bool:
+    """pos 是否落在某个公式区间内部（区间端点不算内部）"""
+    i = bisect.bisect_right(starts, pos - 1) - 1
+    return i >= 0 and spans[i][0] < pos < spans[i][1]
+
+
+def _split_at(text: str, pattern, is_boundary: Optional[Callable] = None) -> Iterator[str]:
+    """在 pattern 匹配的结尾处切分文本（不切入公式内部），各段拼接后等于原文"""
+    spans = _latex_spans(text)
+    starts = [start for start, _ in spans]
+    start = 0
+    for m in pattern.finditer(text):
+        end = m.end()
+        if end <= start or _inside(spans, starts, m.start()) or _inside(spans, starts, end):
+            continue
+        if is_boundary is not None and not is_boundary(text, m):
+            continue
+        yield text[start:end]
+        start = end
+    if start < len(text):
+        yield text[start:]
+
+
+def _is_sentence_end(text: str, m) -> bool:
+    # 排除 "e.g. "、"Fig. 3"、"U. S." 之类的缩写与单字母后的句点
+    if not m.group(0).startswith("."):
+        return True
+    # 只检查句点前的一小段，避免每个句点都扫描整段前文
+    word = _WORD_BEFORE.search(text[max(0, m.start() - 32):m.start()])
+    if word is None:
+        return True
+    word = word.group(1)
+    return len(word) > 1 and word.lower() not in _ABBREVIATIONS
+
+
+def split_sentences(text: str) -> Iterator[str]:
     """
-    将章节文本切分为可翻译 chunks
-    - max_chars：单 chunk 最大字符数（粗略 ≈ 400 tokens）
-    - overlap：上下文重叠，防止断义
+    按句子切分文本，不切开 LaTeX 公式；每个句子保留其后的空白与换行，所有句子拼接后等于原文
     """
-    paragraphs = chapter_text.split("\n")
-    chunks = []
+    return _split_at(text, _SENTENCE_BREAK, _is_sentence_end)
 
-    current = ""
-    for p in paragraphs:
-        if len(current) + len(p) <= max_chars:
-            current += p + "\n"
+
+def _split_long_sentence(sentence: str, max_tokens: int, counter: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+    """将超过预算的句子在逗号/空白处切为不超过预算的片段；单个公式超过预算时保持完整"""
+    pieces = []
+    for piece in _split_at(sentence, _CLAUSE_BREAK):
+        n = counter(piece)
+        if n > max_tokens and not _latex_spans(piece):
+            # 没有切分点的长片段（如无标点的中文）按字符数均分
+            parts = -(-n // max_tokens)
+            size = -(-len(piece) // parts)
+            pieces.extend((piece[i:i + size], counter(piece[i:i + size])) for i in range(0, len(piece), size))
         else:
-            chunks.append(current.strip())
-            current = current[-overlap:] + p + "\n"
+            pieces.append((piece, n))
+
+    current, current_tokens = [], 0
+    for piece, n in pieces:
+        if current and current_tokens + n > max_tokens:
+            yield "".join(current), current_tokens
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += n
+    if current:
+        yield "".join(current), current_tokens
 
-    if current.strip():
-        chunks.append(current.strip())
 
-    return chunks
+def _iter_chunk_units(chapter_text: str, max_tokens: int, overlap_tokens: int,
+                      counter: Callable[[str], int]) -> Iterator[Tuple[List[str], List[str]]]:
+    """按 token 预算装箱句子，生成 (重叠上下文句子, 新句子)"""
+    context: List[Tuple[str, int]] = []
+    current: List[Tuple[str, int]] = []
+    context_tokens = current_tokens = 0
+
+    def units():
+        for sentence in split_sentences(chapter_text):
+            n = counter(sentence)
+            if n > max_tokens:
+                yield from _split_long_sentence(sentence, max_tokens, counter)
+            else:
+                yield sentence, n
+
+    for unit, n in units():
+        if current and context_tokens + current_tokens + n > max_tokens:
+            yield [u for u, _ in context], [u for u, _ in current]
+            # 保留末尾的完整句子作为下一个 chunk 的重叠上下文
+            context, context_tokens = [], 0
+            for u, k in reversed(current):
+                if context_tokens + k > overlap_tokens:
+                    break
+                context.insert(0, (u, k))
+                context_tokens += k
+            current, current_tokens = [], 0
+        # 重叠上下文与新句子放不下时，丢弃最前面的重叠句子
+        while context and not current and context_tokens + n > max_tokens:
+            context_tokens -= context.pop(0)[1]
+        if not current and not unit.strip():
+            continue
+        current.append((unit, n))
+        current_tokens += n
+
+    if current:
+        yield [u for u, _ in context], [u for u, _ in current]
+
+
+def iter_context_chunks(
+    chapter_text: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    counter: Optional[Callable[[str], int]] = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    逐个生成章节的可翻译 chunk，重叠部分与新内容分开返回
+    - 以句子为单位装入 chunk，不在句子中间或 LaTeX 公式内部切分；超过预算的单个句子在逗号/空白处再切分
+    - max_tokens：单 chunk 的 token 预算（含重叠上下文）
+    - overlap_tokens：每个 chunk 附带上一 chunk 末尾不超过该 token 数的完整句子作为上下文，防止断义
+    - counter：token 计数函数，默认 count_tokens
+
+    Yields:
+        (上下文, 新内容)：上下文是与上一 chunk 重叠的只读原文（第一个 chunk 为空），各 chunk 的新内容互不重叠
+    """
+    for context, current in _iter_chunk_units(chapter_text, max_tokens, overlap_tokens, counter or count_tokens):
+        yield "".join(context).strip(), "".join(current).strip()
+
+
+def iter_chunks(
+    chapter_text: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    counter: Optional[Callable[[str], int]] = None
+) -> Iterator[str]:
+    """
+    逐个生成章节的可翻译 chunk（重叠上下文与新内容合为一段原文），参数同 iter_context_chunks
+    """
+    for context, current in _iter_chunk_units(chapter_text, max_tokens, overlap_tokens, counter or count_tokens):
+        yield "".join(context + current).strip()
+
+
+def split_chapter_into_chunks(
+    chapter_text: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> List[str]:
+    """
+    将章节文本切分为可翻译 chunks（iter_chunks 的列表形式）
+    - max_tokens：单 chunk 的 token 预算
+    - overlap_tokens：上下文重叠，防止断义
+    """
+    return list(iter_chunks(chapter_text, max_tokens, overlap_tokens))
@@ -0,0 +1,224 @@
+"""
+章节级chunk存储
+每个章节的所有chunk保存在 output/{book_id}/chapter_{N}/chunks.jsonl（每行一条 {"chunk_id", "data"}，只追加写入，
+同一 chunk 以最后一行为准），并在进程内保留写穿缓存：翻译节点写入、术语收集、术语更新、章节审查与合并
+共用同一个 ChapterStore 实例，每个chunk只解析一次；export_legacy 导出旧的 chunk_XXX.json 布局供评估脚本使用
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+STORE_FILE_NAME = "chunks.jsonl"
+
+
+def chapter_dir(book_id: str, chapter_id: int, base_dir: str = "output") -> str:
+    return os.path.join(base_dir, str(book_id), f"chapter_{chapter_id}")
+
+
+def legacy_chunk_path(directory: str, chunk_id: int) -> str:
+    return os.path.join(directory, f"chunk_{int(chunk_id):03d}.json")
+
+
+class ChapterStore:
+    """
+    单个章节的chunk存储（JSONL + 内存写穿缓存）
+    """
+
+    def __init__(self, book_id: str, chapter_id: int, base_dir: str = "output"):
+        """
+        Args:
+            book_id: 书籍ID
+            chapter_id: 章节ID
+            base_dir: 输出根目录
+        """
+        self.book_id = book_id
+        self.chapter_id = chapter_id
+        self.directory = chapter_dir(book_id, chapter_id, base_dir)
+        self.store_file = os.path.join(self.directory, STORE_FILE_NAME)
+        self._chunks: Dict[int, dict] = {}
+        self._n_lines = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.store_file):
+            with open(self.store_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断写入造成的不完整行
+                        continue
+                    self._chunks[int(record["chunk_id"])] = record["data"]
+                    self._n_lines += 1
+        elif os.path.isdir(self.directory):
+            # 读取旧的逐chunk文件布局，首次写入时迁移为 JSONL（只读使用时不写文件）
+            for name in sorted(os.listdir(self.directory)):
+                if not name.startswith("chunk_") or not name.endswith(".json"):
+                    continue
+                try:
+                    chunk_id = int(name[len("chunk_"):-len(".json")])
+                    with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                        self._chunks[chunk_id] = json.load(f)
+                except (ValueError, IOError) as e:
+                    print(f"  [WARNING] 读取 {name} 失败: {e}")
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, chunk_id: int):
+        return int(chunk_id) in self._chunks
+
+    def get(self, chunk_id: int) -> Optional[dict]:
+        """获取chunk数据（返回缓存中的对象，修改后需调用 put 写回）"""
+        return self._chunks.get(int(chunk_id))
+
+    def chunks(self, num_chunks: Optional[int] = None) -> List[Tuple[int, dict]]:
+        """
+        按 chunk_id 排序的 (chunk_id, 数据) 列表
+
+        Args:
+            num_chunks: 只返回 chunk_id < num_chunks 的chunk（可选）
+        """
+        with self._lock:
+            items = sorted(self._chunks.items())
+        if num_chunks is not None:
+            items = [(chunk_id, data) for chunk_id, data in items if chunk_id < num_chunks]
+        return items
+
+    def put(self, chunk_id: int, data: dict):
+        """写入chunk数据：更新缓存并追加一行到 JSONL"""
+        chunk_id = int(chunk_id)
+        line = json.dumps({"chunk_id": chunk_id, "data": data}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._migrate_legacy()
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.store_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._chunks[chunk_id] = data
+            self._n_lines += 1
+            # 重复写入过多时压缩
+            if self._n_lines > 2 * len(self._chunks) + 16:
+                self.compact()
+
+    def put_many(self, items: Iterator[Tuple[int, dict]]):
+        """批量写入（一次打开文件）"""
+        lines = []
+        with self._lock:
+            self._migrate_legacy()
+            for chunk_id, data in items:
+                self._chunks[int(chunk_id)] = data
+                lines.append(json.dumps({"chunk_id": int(chunk_id), "data": data}, ensure_ascii=False) + "\n")
+            if not lines:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.store_file, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            self._n_lines += len(lines)
+
+    def truncate(self, num_chunks: int) -> List[int]:
+        """
+        删除 chunk_id >= num_chunks 的chunk（章节重新切分后 chunk 数变少时，旧运行的尾部chunk不再有效），
+        同时删除这些chunk的旧布局文件
+
+        Returns:
+            删除的 chunk_id 列表
+        """
+        with self._lock:
+            removed = sorted(chunk_id for chunk_id in self._chunks if chunk_id >= num_chunks)
+            if not removed:
+                return removed
+            for chunk_id in removed:
+                del self._chunks[chunk_id]
+                path = legacy_chunk_path(self.directory, chunk_id)
+                if os.path.exists(path):
+                    os.remove(path)
+            self.compact()
+        return removed
+
+    def _migrate_legacy(self):
+        # 从旧布局读入的chunk尚未写入 JSONL
+        if self._chunks and not os.path.exists(self.store_file):
+            self.compact()
+
+    def compact(self):
+        """重写 JSONL，每个chunk只保留一行"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_file = self.store_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for chunk_id, data in sorted(self._chunks.items()):
+                    f.write(json.dumps({"chunk_id": chunk_id, "data": data}, ensure_ascii=False) + "\n")
+            os.replace(tmp_file, self.store_file)
+            self._n_lines = len(self._chunks)
+
+    def export_legacy(self, directory: Optional[str] = None) -> List[str]:
+        """
+        导出为旧的逐chunk文件布局（chapter_N/chunk_XXX.json）
+
+        Args:
+            directory: 导出目录，默认为章节目录
+
+        Returns:
+            写入的文件路径列表
+        """
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for chunk_id, data in self.chunks():
+            path = legacy_chunk_path(directory, chunk_id)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            paths.append(path)
+        return paths
+
+
+_stores: Dict[Tuple[str, str, int], ChapterStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_chapter_store(book_id: str, chapter_id: int, base_dir: str = "output") -> ChapterStore:
+    """
+    获取进程内共享的章节存储（同一章节只加载一次）
+    """
+    key = (os.path.abspath(base_dir), str(book_id), int(chapter_id))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ChapterStore(book_id, chapter_id, base_dir)
+            _stores[key] = store
+        return store
+
+
+def export_book_legacy(book_id: str, base_dir: str = "output") -> int:
+    """
+    将一本书所有章节的存储导出为旧的逐chunk文件布局
+
+    Returns:
+        导出的chunk文件数
+    """
+    book_dir = os.path.join(base_dir, str(book_id))
+    count = 0
+    if not os.path.isdir(book_dir):
+        return count
+    for name in sorted(os.listdir(book_dir)):
+        if not name.startswith("chapter_") or not os.path.exists(os.path.join(book_dir, name, STORE_FILE_NAME)):
+            continue
+        try:
+            chapter_id = int(name.split("_")[1])
+        except ValueError:
+            continue
+        count += len(get_chapter_store(book_id, chapter_id, base_dir).export_legacy())
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="将章节存储导出为旧的 chunk_XXX.json 布局")
+    parser.add_argument("book_id", help="书籍ID（output/ 下的目录名）")
+    parser.add_argument("--base-dir", default="output", help="输出根目录（默认 output）")
+    args = parser.parse_args()
+    print(f"√ 已导出 {export_book_legacy(args.book_id, args.base_dir)} 个chunk文件")
@@ -0,0 +1,313 @@
+"""
+语料级 BLEU / chrF
+每个 chunk 只计算一次 n-gram 充分统计量（截断匹配数、n-gram 总数、长度），语料级分数由统计量求和后得到，
+而不是对逐 chunk 分数取平均；统计量按 (译文, 参考译文) 的哈希缓存到磁盘，对比多次运行时只需重算改动过的 chunk
+分词与 sacrebleu 的 zh 分词一致：中日韩字符逐字切分，其余部分按 13a 规则切分（标点独立，数字与单词保持完整）
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+BLEU_MAX_ORDER = 4
+CHRF_CHAR_ORDER = 6
+CHRF_BETA = 2
+
+# 统计量格式版本，分词或统计方式变化时递增，使旧缓存失效
+STATS_VERSION = 1
+
+_CJK_RANGES = (
+    (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2FA1F),
+    (0x3000, 0x303F), (0xFF00, 0xFFEF), (0x3040, 0x30FF), (0xAC00, 0xD7AF),
+)
+_CJK_PATTERN = re.compile(
+    "([" + "".join(f"{chr(lo)}-{chr(hi)}" for lo, hi in _CJK_RANGES) + "])"
+)
+# 13a 分词规则（与 mteval-v13a 一致）
+_13A_RULES = (
+    (re.compile(r"([\{-\~\[-\` -\&\(-\+\:-\@\/])"), r" \1 "),
+    (re.compile(r"([^0-9])([\.,])"), r"\1 \2 "),
+    (re.compile(r"([\.,])([^0-9])"), r" \1 \2"),
+    (re.compile(r"([0-9])(-)"), r"\1 \2 "),
+)
+
+
+def tokenize_zh(text: str) -> List[str]:
+    """
+    中文分词：中日韩字符（含全角标点）逐字切分，其余按 13a 规则切分
+
+    Args:
+        text: 待分词文本
+
+    Returns:
+        token 列表
+    """
+    text = _CJK_PATTERN.sub(r" \1 ", text.strip())
+    for pattern, repl in _13A_RULES:
+        text = pattern.sub(repl, text)
+    return text.split()
+
+
+def _ngram_counts(tokens: Sequence, n: int) -> Counter:
+    if n == 1:
+        return Counter(tokens)
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def bleu_statistics(translation: str, reference: str, max_order: int = BLEU_MAX_ORDER) -> List[int]:
+    """
+    单个 chunk 的 BLEU 充分统计量
+
+    Returns:
+        [译文长度, 参考长度, 1-gram 截断匹配数, 1-gram 总数, ..., max_order-gram 截断匹配数, 总数]
+    """
+    hyp = tokenize_zh(translation)
+    ref = tokenize_zh(reference)
+    stats = [len(hyp), len(ref)]
+    for n in range(1, max_order + 1):
+        hyp_counts = _ngram_counts(hyp, n)
+        ref_counts = _ngram_counts(ref, n)
+        stats.append(sum((hyp_counts & ref_counts).values()))
+        stats.append(max(len(hyp) - n + 1, 0))
+    return stats
+
+
+def chrf_statistics(translation: str, reference: str, char_order: int = CHRF_CHAR_ORDER) -> List[int]:
+    """
+    单个 chunk 的 chrF 充分统计量（去除空白后的字符 n-gram）
+
+    Returns:
+        [1-gram 译文数, 参考数, 匹配数, ..., char_order-gram 译文数, 参考数, 匹配数]
+    """
+    hyp = "".join(translation.split())
+    ref = "".join(reference.split())
+    stats = []
+    for n in range(1, char_order + 1):
+        hyp_counts = _ngram_counts(hyp, n) if n > 1 else Counter(hyp)
+        ref_counts = _ngram_counts(ref, n) if n > 1 else Counter(ref)
+        stats.append(max(len(hyp) - n + 1, 0))
+        stats.append(max(len(ref) - n + 1, 0))
+        stats.append(sum((hyp_counts & ref_counts).values()))
+    return stats
+
+
+def compute_bleu(stats: Sequence[int], smooth: bool = True, effective_order: bool = False) -> Dict:
+    """
+    由（可能已求和的）BLEU 统计量计算分数
+
+    Args:
+        stats: bleu_statistics 的输出，或多条输出逐项求和的结果
+        smooth: 是否使用指数平滑（sacrebleu 的 exp 平滑），避免某阶无匹配时分数直接为 0
+        effective_order: 译文短于 n 个 token 时跳过该阶（适用于单个 chunk 的句子级 BLEU）
+
+    Returns:
+        包含 bleu（0-100）、各阶 precisions、brevity_penalty 与长度的字典
+    """
+    hyp_len, ref_len = int(stats[0]), int(stats[1])
+    max_order = (len(stats) - 2) // 2
+    matches = [int(x) for x in stats[2::2]]
+    totals = [int(x) for x in stats[3::2]]
+
+    if hyp_len == 0:
+        brevity_penalty = 0.0
+    elif hyp_len < ref_len:
+        brevity_penalty = math.exp(1 - ref_len / hyp_len)
+    else:
+        brevity_penalty = 1.0
+
+    precisions = [0.0] * max_order
+    # 没有任何匹配时直接为 0
+    if not any(matches):
+        return {"bleu": 0.0, "precisions": precisions, "brevity_penalty": brevity_penalty,
+                "hyp_len": hyp_len, "ref_len": ref_len}
+
+    smooth_value = 1.0
+    n_orders = max_order
+    for n in range(max_order):
+        if totals[n] == 0:
+            break
+        if effective_order:
+            n_orders = n + 1
+        if matches[n] == 0:
+            if smooth:
+                smooth_value *= 2
+                precisions[n] = 1.0 / (smooth_value * totals[n])
+        else:
+            precisions[n] = matches[n] / totals[n]
+
+    if any(p == 0 for p in precisions[:n_orders]):
+        bleu = 0.0
+    else:
+        bleu = brevity_penalty * math.exp(sum(math.log(p) for p in precisions[:n_orders]) / n_orders)
+
+    return {
+        "bleu": bleu * 100,
+        "precisions": [p * 100 for p in precisions],
+        "brevity_penalty": brevity_penalty,
+        "hyp_len": hyp_len,
+        "ref_len": ref_len,
+    }
+
+
+def compute_chrf(stats: Sequence[int], beta: float = CHRF_BETA) -> Dict:
+    """
+    由（可能已求和的）chrF 统计量计算分数，先对有效阶数的精确率与召回率取平均再计算 F 值（与 sacrebleu 一致）
+
+    Returns:
+        包含 chrf（0-100）与有效阶数的字典
+    """
+    factor = beta ** 2
+    avg_precision, avg_recall = 0.0, 0.0
+    effective_order = 0
+    for n in range(len(stats) // 3):
+        n_hyp, n_ref, n_match = (int(x) for x in stats[3 * n:3 * n + 3])
+        # 只对译文与参考都有该阶 n-gram 的阶数取平均
+        if n_hyp > 0 and n_ref > 0:
+            avg_precision += n_match / n_hyp
+            avg_recall += n_match / n_ref
+            effective_order += 1
+    chrf = 0.0
+    if effective_order:
+        avg_precision /= effective_order
+        avg_recall /= effective_order
+        if avg_precision + avg_recall:
+            chrf = 100 * (1 + factor) * avg_precision * avg_recall / (factor * avg_precision + avg_recall)
+    return {"chrf": chrf, "effective_order": effective_order, "beta": beta}
+
+
+def sum_statistics(stats_list: Iterable[Sequence[int]]) -> List[int]:
+    """逐项求和多个 chunk 的统计量"""
+    stats_list = list(stats_list)
+    if not stats_list:
+        return []
+    return np.asarray(stats_list, dtype=np.int64).sum(axis=0).tolist()
+
+
+def corpus_bleu(stats_list: Iterable[Sequence[int]]) -> Dict:
+    """语料级 BLEU：先对所有 chunk 的统计量求和再计算"""
+    total = sum_statistics(stats_list)
+    if not total:
+        return compute_bleu([0, 0] + [0, 0] * BLEU_MAX_ORDER)
+    return compute_bleu(total)
+
+
+def corpus_chrf(stats_list: Iterable[Sequence[int]]) -> Dict:
+    """语料级 chrF：先对所有 chunk 的统计量求和再计算"""
+    total = sum_statistics(stats_list)
+    if not total:
+        return compute_chrf([0, 0, 0] * CHRF_CHAR_ORDER)
+    return compute_chrf(total)
+
+
+class NgramStatsCache:
+    """
+    chunk 级 n-gram 统计量的磁盘缓存
+    以 (统计量版本, 译文, 参考译文) 的 sha1 为键，对比多次运行或重复评估时只计算新增或改动过的 chunk
+    """
+
+    def __init__(self, cache_file: Optional[str] = None):
+        """
+        Args:
+            cache_file: 缓存文件路径（JSON），为 None 时只在内存中缓存
+        """
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict[str, List[int]]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == STATS_VERSION:
+                    self._entries = data.get("entries", {})
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"[WARNING] 加载n-gram统计缓存失败: {e}")
+
+    @staticmethod
+    def key(translation: str, reference: str) -> str:
+        digest = hashlib.sha1(f"{STATS_VERSION}\0{translation}\0{reference}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, translation: str, reference: str) -> Dict[str, List[int]]:
+        """
+        获取单个 chunk 的统计量，未命中时计算并缓存
+
+        Returns:
+            {"bleu": BLEU 统计量, "chrf": chrF 统计量}
+        """
+        key = self.key(translation, reference)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+        entry = {
+            "bleu": bleu_statistics(translation, reference),
+            "chrf": chrf_statistics(translation, reference),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self.misses += 1
+            self._dirty = True
+        return entry
+
+    def put(self, translation: str, reference: str, entry: Dict[str, List[int]]):
+        """登记在别处（如评估子进程中）计算的统计量"""
+        key = self.key(translation, reference)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._dirty = True
+
+    def save(self):
+        """写回缓存文件（先写临时文件再替换，避免中断时损坏）"""
+        if not self.cache_file or not self._dirty:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"version": STATS_VERSION, "entries": self._entries}, f)
+            os.replace(tmp_file, self.cache_file)
+            self._dirty = False
+
+
+def summarize_statistics(stats: Sequence[Dict[str, List[int]]]) -> Dict:
+    """
+    由多个 chunk 的统计量（NgramStatsCache.get 的输出）计算语料级 BLEU 与 chrF
+
+    Args:
+        stats: [{"bleu": BLEU 统计量, "chrf": chrF 统计量}, ...]
+    """
+    bleu = corpus_bleu(s["bleu"] for s in stats)
+    chrf = corpus_chrf(s["chrf"] for s in stats)
+    return {
+        "bleu": round(bleu["bleu"], 2),
+        "bleu_precisions": [round(p, 2) for p in bleu["precisions"]],
+        "brevity_penalty": round(bleu["brevity_penalty"], 4),
+        "hyp_len": bleu["hyp_len"],
+        "ref_len": bleu["ref_len"],
+        "chrf": round(chrf["chrf"], 2),
+        "count": len(stats),
+    }
+
+
+def corpus_scores(pairs: Iterable[Tuple[str, str]], cache: Optional[NgramStatsCache] = None) -> Dict:
+    """
+    计算一组 (译文, 参考译文) 的语料级 BLEU 与 chrF
+
+    Args:
+        pairs: (译文, 参考译文) 列表
+        cache: 统计量缓存（可选）
+    """
+    cache = cache or NgramStatsCache()
+    return summarize_statistics([cache.get(translation, reference) for translation, reference in pairs])
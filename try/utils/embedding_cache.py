@@ -0,0 +1,137 @@
+"""
+文本向量磁盘缓存
+以文本的 sha1 为键，向量按行追加到 float16 的内存映射矩阵中（{名称}.f16），行号索引保存在 {名称}.json，
+重复评估时参考译文等未改动的文本不再重新编码；未命中的文本合并为一次大批量 encode 调用
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    按模型区分的文本向量缓存
+    数据文件只追加写入；先写数据再写索引，中断时多出的尾部数据会在下次追加时被覆盖
+    """
+
+    def __init__(self, cache_dir: str, model_name: str = "default"):
+        """
+        Args:
+            cache_dir: 缓存目录
+            model_name: 模型名称或路径，不同模型的向量分开存放
+        """
+        slug = re.sub(r'[^0-9A-Za-z_.-]+', '_', model_name).strip('_.') or "default"
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.data_file = os.path.join(cache_dir, f"{slug}.f16")
+        self.index_file = os.path.join(cache_dir, f"{slug}.json")
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[WARNING] 加载向量缓存索引失败: {e}")
+            return
+        keys = index.get("keys", [])
+        dim = index.get("dim")
+        if not keys or not dim or index.get("model") != self.model_name:
+            return
+        expected_size = len(keys) * dim * 2
+        if not os.path.exists(self.data_file) or os.path.getsize(self.data_file) < expected_size:
+            print(f"[WARNING] 向量缓存数据不完整，已忽略: {self.data_file}")
+            return
+        self.dim = dim
+        self._rows = {key: i for i, key in enumerate(keys)}
+        self._open_matrix()
+
+    def _open_matrix(self):
+        if self._rows:
+            self._matrix = np.memmap(self.data_file, dtype=np.float16, mode='r', shape=(len(self._rows), self.dim))
+        else:
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        n_rows = len(self._rows)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {self.dim}")
+
+        # 释放旧的映射后在有效数据末尾追加
+        self._matrix = None
+        mode = 'r+b' if os.path.exists(self.data_file) else 'wb'
+        with open(self.data_file, mode) as f:
+            f.seek(n_rows * self.dim * 2)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+            f.truncate()
+
+        for key in keys:
+            self._rows[key] = len(self._rows)
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            ordered_keys = sorted(self._rows, key=self._rows.get)
+            json.dump({"model": self.model_name, "dim": self.dim, "keys": ordered_keys}, f)
+        os.replace(tmp_file, self.index_file)
+        self._open_matrix()
+
+    def encode(self, model, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+        """
+        获取文本向量，未缓存的文本去重后一次性批量编码并写入缓存
+
+        Args:
+            model: 具有 encode(texts, batch_size=...) 方法的模型（如 SentenceTransformer）
+            texts: 文本列表
+            batch_size: 编码批大小
+
+        Returns:
+            float32 矩阵，形状为 (len(texts), dim)
+        """
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                vectors = np.asarray(model.encode(list(missing.values()), batch_size=batch_size), dtype=np.float32)
+                self._append(list(missing.keys()), vectors)
+
+            if not keys:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            return np.asarray(self._matrix[rows], dtype=np.float32)
+
+
+def cosine_similarity_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐行余弦相似度，零向量的相似度为 0"""
+    dot = np.einsum('ij,ij->i', a, b)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarity = np.where(norms > 0, dot / norms, 0.0)
+    return np.clip(similarity, -1.0, 1.0)
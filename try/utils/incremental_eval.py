@@ -0,0 +1,169 @@
+"""
+并行与增量评估
+- EvalResultStore: 逐chunk评估结果的增量存储（追加写入的JSONL），键为 chunk 内容、参考译文、指标集合与指标版本的哈希，
+  只有新增或改动过的chunk需要重新评估，报告可直接由缓存结果重新生成
+- init_worker / evaluate_chunk_task: 进程池中的评估函数（定义在模块级，便于在 spawn 模式下序列化）
+- is_cacheable: 语义相似度计算失败的结果不写入缓存
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .translation_evaluator import TranslationEvaluator, METRICS_VERSION
+
+
+def chunk_eval_inputs(chunk_data: Dict) -> Dict:
+    """
+    从chunk文件内容中提取评估所需字段
+
+    Returns:
+        evaluate_comprehensive 的参数字典（source_text、translation、back_translation、glossary、quality_score）
+    """
+    # 获取回译文（从refinement_history中）
+    back_translation = None
+    refinement_history = chunk_data.get('refinement_history', [])
+    if refinement_history:
+        back_translation = refinement_history[-1].get('back_translation')
+    return {
+        "source_text": chunk_data.get('source_text', '').strip(),
+        "translation": chunk_data.get('translation', ''),
+        "back_translation": back_translation,
+        "glossary": chunk_data.get('glossary', []),
+        "quality_score": chunk_data.get('quality_score', 0),
+    }
+
+
+def chunk_cache_key(inputs: Dict, reference: Optional[str], enabled_metrics: List[str], semantic_enabled: bool) -> str:
+    """
+    评估结果的缓存键
+
+    Args:
+        inputs: chunk_eval_inputs 的输出
+        reference: 参考译文（可选）
+        enabled_metrics: 启用的评估指标
+        semantic_enabled: 语义相似度模型是否可用（影响 semantic_similarity 的结果）
+    """
+    payload = json.dumps({
+        "inputs": inputs,
+        "reference": reference,
+        "metrics": sorted(enabled_metrics),
+        "semantic": semantic_enabled,
+        "version": METRICS_VERSION,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(evaluation: Dict, semantic_enabled: bool) -> bool:
+    """
+    评估结果能否写入缓存：缓存键表明启用了语义相似度（见 chunk_cache_key 的 semantic_enabled），
+    结果却没有相似度值（模型未加载或编码失败）时不缓存，否则以后的运行会一直复用降级的分数
+
+    Args:
+        evaluation: 评估结果
+        semantic_enabled: 与缓存键相同的语义相似度启用标志
+    """
+    if not semantic_enabled:
+        return True
+    semantic = evaluation.get("metrics", {}).get("semantic_similarity")
+    return semantic is None or "similarity" in semantic
+
+
+class EvalResultStore:
+    """
+    逐chunk评估结果的增量存储
+    每行一条 {"key": ..., "evaluation": ...}，只追加写入；读取时跳过中断写入造成的不完整行
+    """
+
+    def __init__(self, store_file: Optional[str] = None):
+        """
+        Args:
+            store_file: 存储文件路径（JSONL），为 None 时只在内存中保存
+        """
+        self.store_file = store_file
+        self.hits = 0
+        self._entries: Dict[str, Dict] = {}
+        self._pending: List[Tuple[str, Dict]] = []
+        if store_file and os.path.exists(store_file):
+            with open(store_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(record, dict) and "key" in record:
+                        self._entries[record["key"]] = record.get("evaluation")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict]:
+        result = self._entries.get(key)
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, evaluation: Dict):
+        self._entries[key] = evaluation
+        self._pending.append((key, evaluation))
+
+    def flush(self):
+        """将新增结果追加写入存储文件"""
+        if not self.store_file or not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.store_file) or ".", exist_ok=True)
+        with open(self.store_file, 'a', encoding='utf-8') as f:
+            for key, evaluation in self._pending:
+                f.write(json.dumps({"key": key, "evaluation": evaluation}, ensure_ascii=False) + "\n")
+        self._pending = []
+
+
+_worker_evaluator: Optional[TranslationEvaluator] = None
+
+
+def init_worker(reference_translations: Dict, enabled_metrics: List[str]):
+    """
+    进程池初始化：每个进程创建一个评估器
+    语义相似度由主进程批量计算后随任务传入，因此工作进程不加载向量模型；
+    没有预先算出语义相似度的chunk应留在主进程评估
+    工作进程的 n-gram 统计量只缓存在各自的内存中，不会写入磁盘上的 NgramStatsCache，
+    需要由主进程从返回结果的 ngram_stats 登记（NgramStatsCache.put）
+    """
+    global _worker_evaluator
+    _worker_evaluator = TranslationEvaluator(reference_translations, enabled_metrics=enabled_metrics,
+                                             load_embedding_model=False)
+
+
+def evaluate_chunk(evaluator: TranslationEvaluator, chapter_id: int, chunk_id: int, inputs: Dict,
+                   semantic_result: Optional[Dict] = None) -> Dict:
+    """
+    评估单个chunk
+
+    Args:
+        evaluator: 评估器
+        chapter_id: 章节ID（用于查找参考译文）
+        chunk_id: chunk ID（用于查找参考译文）
+        inputs: chunk_eval_inputs 的输出
+        semantic_result: 预先计算的语义相似度结果（可选）
+    """
+    if semantic_result is not None:
+        reference = evaluator.reference_translations.get(chapter_id, {}).get(chunk_id)
+        evaluator._semantic_results[(inputs["translation"], reference)] = semantic_result
+    return evaluator.evaluate_comprehensive(chapter_id=chapter_id, chunk_id=chunk_id, **inputs)
+
+
+def evaluate_chunk_task(task: Tuple) -> Tuple[int, Optional[Dict], Optional[str]]:
+    """
+    进程池任务
+
+    Args:
+        task: (序号, chapter_id, chunk_id, inputs, semantic_result)
+
+    Returns:
+        (序号, 评估结果, 错误信息)
+    """
+    index, chapter_id, chunk_id, inputs, semantic_result = task
+    try:
+        return index, evaluate_chunk(_worker_evaluator, chapter_id, chunk_id, inputs, semantic_result), None
+    except Exception as e:
+        return index, None, str(e)
@@ -0,0 +1,186 @@
+"""
+翻译运行结果索引与对比
+每次运行只扫描一遍 chunk 文件与评估报告，建立以 (chapter_id, chunk_id) 为索引的表，
+指标差值与改进/退步最多的chunk均用 pandas/NumPy 向量化计算；所有指标分数都是 0-10 分，越高越好
+"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+KEY_COLUMNS = ["chapter_id", "chunk_id"]
+INFO_COLUMNS = ["chunk_file", "human_reviewed", "revision_count", "source_len", "translation_len"]
+
+
+def _scan_chunk_files(output_dir: str) -> pd.DataFrame:
+    rows = []
+    for chapter_entry in os.scandir(output_dir):
+        if not chapter_entry.is_dir() or not chapter_entry.name.startswith("chapter_"):
+            continue
+        try:
+            chapter_id = int(chapter_entry.name.split("_")[1])
+        except ValueError:
+            continue
+        for chunk_entry in os.scandir(chapter_entry.path):
+            name = chunk_entry.name
+            if not name.startswith("chunk_") or not name.endswith(".json"):
+                continue
+            try:
+                chunk_id = int(name[len("chunk_"):-len(".json")])
+                with open(chunk_entry.path, 'r', encoding='utf-8') as f:
+                    chunk = json.load(f)
+            except (ValueError, IOError) as e:
+                print(f"[WARNING] 跳过chunk文件 {chunk_entry.path}: {e}")
+                continue
+            source_text = chunk.get("source_text", "").strip()
+            if not source_text:
+                continue
+            rows.append({
+                "chapter_id": chapter_id,
+                "chunk_id": chunk_id,
+                "chunk_file": chunk_entry.path,
+                "quality_score": chunk.get("quality_score"),
+                "human_reviewed": bool(chunk.get("human_reviewed", False)),
+                "revision_count": chunk.get("revision_count", 0),
+                "source_len": len(source_text),
+                "translation_len": len(chunk.get("translation", "")),
+            })
+    return pd.DataFrame(rows)
+
+
+def _load_report_metrics(report_file: str) -> pd.DataFrame:
+    with open(report_file, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    rows = []
+    for detail in report.get("chunk_details", []):
+        row = {
+            "chapter_id": int(detail["chapter_id"]),
+            "chunk_id": int(detail["chunk_id"]),
+            "chunk_file": detail.get("chunk_file"),
+        }
+        evaluation = detail.get("evaluation", {})
+        for metric_name, metric_data in evaluation.get("metrics", {}).items():
+            if isinstance(metric_data, dict) and "score" in metric_data:
+                row[metric_name] = metric_data["score"]
+        if "overall_score" in evaluation:
+            row["overall_score"] = evaluation["overall_score"]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def build_run_index(output_dir: Optional[str] = None, report_file: Optional[str] = None) -> pd.DataFrame:
+    """
+    建立一次运行的chunk索引
+
+    Args:
+        output_dir: 运行输出目录（包含 chapter_xx/chunk_xxx.json，可选）
+        report_file: eval.py 生成的评估报告（可选，提供逐chunk指标分数）
+
+    Returns:
+        以 (chapter_id, chunk_id) 为索引的 DataFrame，包含文件路径、基本信息与各指标分数列
+    """
+    frames = []
+    if output_dir and os.path.isdir(output_dir):
+        frames.append(_scan_chunk_files(output_dir))
+    if report_file and os.path.exists(report_file):
+        frames.append(_load_report_metrics(report_file))
+    frames = [frame.set_index(KEY_COLUMNS) for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=KEY_COLUMNS))
+
+    # chunk文件中的字段优先，评估报告补充指标分数
+    index = frames[0]
+    for frame in frames[1:]:
+        index = index.combine_first(frame)
+    return index.sort_index()
+
+
+def metric_columns(index: pd.DataFrame) -> List[str]:
+    """索引中的指标分数列"""
+    return [c for c in index.columns if c not in INFO_COLUMNS and pd.api.types.is_numeric_dtype(index[c])]
+
+
+def compare_two_runs(base: pd.DataFrame, other: pd.DataFrame,
+                     metrics: Optional[List[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    对比两次运行（other 相对 base）
+
+    Args:
+        base: 基准运行的索引
+        other: 对比运行的索引
+        metrics: 要对比的指标（默认两者共有的全部指标）
+
+    Returns:
+        (指标汇总表, 合并后的逐chunk表)
+        汇总表每行一个指标：共同chunk数、两者平均分、平均差值、改进与退步的chunk数
+        逐chunk表包含 {指标}_base、{指标}_other、{指标}_delta 列以及两边的文件路径
+    """
+    if metrics is None:
+        metrics = [m for m in metric_columns(base) if m in set(metric_columns(other))]
+    merged = base[metrics + ["chunk_file"]].join(
+        other[metrics + ["chunk_file"]], how="inner", lsuffix="_base", rsuffix="_other")
+
+    base_values = merged[[f"{m}_base" for m in metrics]].to_numpy(dtype=float)
+    other_values = merged[[f"{m}_other" for m in metrics]].to_numpy(dtype=float)
+    deltas = other_values - base_values
+    for i, m in enumerate(metrics):
+        merged[f"{m}_delta"] = deltas[:, i]
+
+    valid = ~np.isnan(deltas)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        summary = pd.DataFrame({
+            "count": count,
+            "base_mean": np.where(valid, base_values, 0).sum(axis=0) / np.maximum(count, 1),
+            "other_mean": np.where(valid, other_values, 0).sum(axis=0) / np.maximum(count, 1),
+            "delta_mean": np.where(valid, deltas, 0).sum(axis=0) / np.maximum(count, 1),
+            "improved": (deltas > 0).sum(axis=0),
+            "regressed": (deltas < 0).sum(axis=0),
+        }, index=pd.Index(metrics, name="metric"))
+    summary.loc[summary["count"] == 0, ["base_mean", "other_mean", "delta_mean"]] = np.nan
+    return summary, merged
+
+
+def top_changes(merged: pd.DataFrame, metric: str, k: int = 5) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    改进与退步最多的 k 个chunk
+
+    Returns:
+        (改进最多, 退步最多)，列为 base、other、delta 与两边的文件路径
+    """
+    column = f"{metric}_delta"
+    if column not in merged.columns:
+        empty = pd.DataFrame(columns=["base", "other", "delta", "base_file", "other_file"])
+        return empty, empty
+    table = merged[[f"{metric}_base", f"{metric}_other", column, "chunk_file_base", "chunk_file_other"]].dropna(
+        subset=[column])
+    table.columns = ["base", "other", "delta", "base_file", "other_file"]
+    improved = table[table["delta"] > 0].nlargest(k, "delta")
+    regressed = table[table["delta"] < 0].nsmallest(k, "delta")
+    return improved, regressed
+
+
+def pairwise_delta_matrix(indexes: Dict[str, pd.DataFrame], metric: str) -> pd.DataFrame:
+    """
+    多次运行两两对比的平均差值矩阵（行减列，只在两者共有的chunk上平均）
+
+    Args:
+        indexes: {运行名称: 索引}
+        metric: 指标名称
+    """
+    names = [name for name, index in indexes.items() if metric in index.columns]
+    if not names:
+        return pd.DataFrame()
+    wide = pd.concat({name: indexes[name][metric] for name in names}, axis=1)
+    values = wide.to_numpy(dtype=float)
+    mask = (~np.isnan(values)).astype(float)
+    filled = np.nan_to_num(values)
+    # sum_c m_ci m_cj (x_ci - x_cj) = (X^T M - (M^T X))_ij
+    sums = filled.T @ mask - mask.T @ filled
+    counts = mask.T @ mask
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix = np.where(counts > 0, sums / counts, np.nan)
+    return pd.DataFrame(matrix, index=names, columns=names)
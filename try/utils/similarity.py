@@ -0,0 +1,116 @@
+"""
+字符串相似度内核
+编辑距离优先使用 rapidfuzz（C++ 实现），不可用时退回纯 Python 的位并行算法（Myers/Hyyrö），
+两者与原先的 O(n·m) 动态规划结果完全一致；回译相似度保持 difflib.SequenceMatcher 的算法，
+保证分数不变，并提供批量接口
+"""
+import difflib
+from typing import List, Sequence, Tuple
+
+try:
+    from rapidfuzz.distance import Levenshtein as _rf_levenshtein
+    from rapidfuzz.process import cpdist as _rf_cpdist
+    HAS_RAPIDFUZZ = True
+except ImportError:
+    HAS_RAPIDFUZZ = False
+
+
+def _bitparallel_levenshtein(s1: str, s2: str) -> int:
+    """
+    位并行 Levenshtein 距离（Hyyrö 2003），用 Python 大整数作为位向量
+    复杂度 O(n·⌈m/w⌉)，较短的字符串作为模式串
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    m = len(s2)
+    if m == 0:
+        return len(s1)
+
+    # 模式串中每个字符出现位置的位掩码
+    peq = {}
+    for i, c in enumerate(s2):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv = mask, 0
+    score = m
+    for c in s1:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def levenshtein_distance(s1: str, s2: str) -> int:
+    """字符级编辑距离（插入、删除、替换代价均为 1）"""
+    if HAS_RAPIDFUZZ:
+        return _rf_levenshtein.distance(s1, s2)
+    return _bitparallel_levenshtein(s1, s2)
+
+
+def edit_similarity(s1: str, s2: str) -> Tuple[int, int, float]:
+    """
+    编辑距离相似度
+
+    Returns:
+        (编辑距离, 较长字符串长度, 1 - 距离/较长长度)，两者都为空时相似度为 1
+    """
+    distance = levenshtein_distance(s1, s2)
+    max_len = max(len(s1), len(s2))
+    similarity = 1.0 if max_len == 0 else 1 - (distance / max_len)
+    return distance, max_len, similarity
+
+
+def sequence_ratio(s1: str, s2: str) -> float:
+    """
+    difflib.SequenceMatcher 的相似度（Ratcliff/Obershelp）
+    rapidfuzz 的 Indel 相似度基于最长公共子序列，分数与之不同，因此这里保留 difflib
+    """
+    return difflib.SequenceMatcher(None, s1, s2).ratio()
+
+
+def batch_levenshtein_distance(s1_list: Sequence[str], s2_list: Sequence[str], workers: int = 1) -> List[int]:
+    """
+    批量计算成对编辑距离
+
+    Args:
+        s1_list: 字符串列表
+        s2_list: 与 s1_list 等长的字符串列表
+        workers: rapidfuzz 使用的线程数，-1 为全部 CPU
+    """
+    if len(s1_list) != len(s2_list):
+        raise ValueError(f"长度不一致: {len(s1_list)} != {len(s2_list)}")
+    if len(s1_list) == 0:
+        return []
+    if HAS_RAPIDFUZZ:
+        return [int(d) for d in _rf_cpdist(s1_list, s2_list, scorer=_rf_levenshtein.distance, workers=workers)]
+    return [_bitparallel_levenshtein(s1, s2) for s1, s2 in zip(s1_list, s2_list)]
+
+
+def batch_edit_similarity(s1_list: Sequence[str], s2_list: Sequence[str],
+                          workers: int = 1) -> List[Tuple[int, int, float]]:
+    """批量版 edit_similarity"""
+    distances = batch_levenshtein_distance(s1_list, s2_list, workers=workers)
+    results = []
+    for distance, s1, s2 in zip(distances, s1_list, s2_list):
+        max_len = max(len(s1), len(s2))
+        results.append((distance, max_len, 1.0 if max_len == 0 else 1 - (distance / max_len)))
+    return results
+
+
+def batch_sequence_ratio(s1_list: Sequence[str], s2_list: Sequence[str]) -> List[float]:
+    """批量版 sequence_ratio"""
+    if len(s1_list) != len(s2_list):
+        raise ValueError(f"长度不一致: {len(s1_list)} != {len(s2_list)}")
+    return [sequence_ratio(s1, s2) for s1, s2 in zip(s1_list, s2_list)]
@@ -7,7 +7,12 @@ import os
 import re
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
-import difflib
+
+import numpy as np
+
+from .similarity import sequence_ratio, edit_similarity, batch_edit_similarity
+from .corpus_metrics import NgramStatsCache
+from .embedding_cache import EmbeddingCache, cosine_similarity_rows
 
 try:
     from sentence_transformers import SentenceTransformer
@@ -16,6 +21,9 @@ except (ImportError, RuntimeError, Exception) as e:
     HAS_EMBEDDING = False
     print(f"[WARNING] sentence-transformers不可用（可能是版本不兼容），语义相似度评估将不可用: {type(e).__name__}")
 
+# 指标实现版本，修改任何指标的计算方式时递增，使缓存的逐chunk评估结果失效
+METRICS_VERSION = 1
+
 
 class TranslationEvaluator:
     """
@@ -23,7 +31,10 @@ class TranslationEvaluator:
     提供多维度的质量评估指标
     """
     
-    def __init__(self, reference_translations: Optional[Dict] = None, enabled_metrics: Optional[List[str]] = None):
+    def __init__(self, reference_translations: Optional[Dict] = None, enabled_metrics: Optional[List[str]] = None,
+                 stats_cache: Optional[NgramStatsCache] = None, embedding_cache_dir: Optional[str] = None,
+                 embedding_batch_size: int = 64, embedding_threads: Optional[int] = None,
+                 load_embedding_model: bool = True):
         """
         初始化评估器
         
@@ -31,15 +42,30 @@ class TranslationEvaluator:
             reference_translations: 参考译文字典，格式为 {chapter_id: {chunk_id: translation}}
             enabled_metrics: 启用的评估指标列表，可选值: ['bleu', 'mqm', 'score']
                             如果为None，则启用所有可用指标
+            stats_cache: 语料级 BLEU/chrF 的 n-gram 统计量缓存（可选，默认仅在内存中缓存）
+            embedding_cache_dir: 语义相似度向量的磁盘缓存目录（可选，为None时不缓存）
+            embedding_batch_size: 向量编码的批大小
+            embedding_threads: 向量编码使用的CPU线程数（可选，默认由torch决定）
+            load_embedding_model: 是否加载语义相似度模型（并行评估的工作进程使用主进程预先计算的结果，无需加载）
         """
         self.reference_translations = reference_translations or {}
+        self.stats_cache = stats_cache or NgramStatsCache()
         self.embedding_model = None
+        self.embedding_cache = None
+        self.embedding_batch_size = embedding_batch_size
         self.enabled_metrics = enabled_metrics or ['bleu', 'mqm', 'score']  # 默认启用所有
+        # 预先批量计算的语义相似度结果，键为 (译文, 参考译文)
+        self._semantic_results: Dict[Tuple[str, str], Dict] = {}
         
         # 如果启用了mqm，尝试加载语义相似度模型
-        if 'mqm' in self.enabled_metrics and HAS_EMBEDDING:
+        if 'mqm' in self.enabled_metrics and HAS_EMBEDDING and load_embedding_model:
             try:
                 self.embedding_model = SentenceTransformer('./eval_model')
+                if embedding_threads:
+                    import torch
+                    torch.set_num_threads(embedding_threads)
+                if embedding_cache_dir:
+                    self.embedding_cache = EmbeddingCache(embedding_cache_dir, model_name='eval_model')
             except Exception as e:
                 print(f"[WARNING] 加载语义相似度模型失败: {e}")
     
@@ -70,7 +96,7 @@ class TranslationEvaluator:
             }
         
         # 使用字符级相似度
-        similarity = difflib.SequenceMatcher(None, source_text.lower(), back_translation.lower()).ratio()
+        similarity = sequence_ratio(source_text.lower(), back_translation.lower())
         
         # 转换为0-10分
         score = similarity * 10
@@ -297,7 +323,7 @@ class TranslationEvaluator:
     ) -> Dict:
         """
         计算BLEU分数（有监督）
-        简化版BLEU，基于n-gram重叠
+        简化版BLEU，基于n-gram重叠；标准的语料级 BLEU/chrF 见 utils.corpus_metrics
         
         Args:
             translation: 译文
@@ -343,7 +369,7 @@ class TranslationEvaluator:
     ) -> Dict:
         """
         评估语义相似度（有监督）
-        使用sentence-transformers计算embedding相似度
+        使用sentence-transformers计算embedding相似度，优先使用 precompute_semantic_similarity 的批量结果
         
         Args:
             translation: 译文
@@ -352,45 +378,82 @@ class TranslationEvaluator:
         Returns:
             包含语义相似度分数的字典
         """
+        result = self._semantic_results.get((translation, reference))
+        if result is not None:
+            return result
+        return self.evaluate_semantic_similarity_batch([translation], [reference])[0]
+    
+    def evaluate_semantic_similarity_batch(
+        self,
+        translations: List[str],
+        references: List[str]
+    ) -> List[Dict]:
+        """
+        批量评估语义相似度：所有文本合并为一次批量编码（命中缓存的文本跳过），余弦相似度一次向量化计算
+        
+        Args:
+            translations: 译文列表
+            references: 与译文一一对应的参考译文列表
+        
+        Returns:
+            与 evaluate_semantic_similarity 相同格式的字典列表
+        """
+        if len(translations) != len(references):
+            raise ValueError(f"译文与参考译文数量不一致: {len(translations)} != {len(references)}")
         if not self.embedding_model:
-            return {
+            return [{
                 "score": 0.0,
                 "method": "semantic_similarity",
                 "details": "语义相似度模型未加载"
-            }
+            } for _ in translations]
+        if not translations:
+            return []
         
         try:
-            # 计算embedding
-            embeddings = self.embedding_model.encode([translation, reference])
-            
-            # 计算余弦相似度
-            try:
-                import numpy as np
-                similarity = np.dot(embeddings[0], embeddings[1]) / (np.linalg.norm(embeddings[0]) * np.linalg.norm(embeddings[1]))
-                # 确保转换为Python原生float类型
-                similarity = float(similarity)
-            except ImportError:
-                # 如果没有numpy，使用简单的点积计算
-                dot_product = sum(a * b for a, b in zip(embeddings[0], embeddings[1]))
-                norm_a = sum(a * a for a in embeddings[0]) ** 0.5
-                norm_b = sum(b * b for b in embeddings[1]) ** 0.5
-                similarity = float(dot_product / (norm_a * norm_b) if norm_a * norm_b > 0 else 0)
-            
+            texts = list(translations) + list(references)
+            if self.embedding_cache is not None:
+                embeddings = self.embedding_cache.encode(self.embedding_model, texts,
+                                                         batch_size=self.embedding_batch_size)
+            else:
+                embeddings = np.asarray(
+                    self.embedding_model.encode(texts, batch_size=self.embedding_batch_size), dtype=np.float32)
+            similarities = cosine_similarity_rows(embeddings[:len(translations)], embeddings[len(translations):])
+        except Exception as e:
+            return [{
+                "score": 0.0,
+                "method": "semantic_similarity",
+                "details": f"计算失败: {e}"
+            } for _ in translations]
+        
+        results = []
+        for similarity in similarities.tolist():
             # 转换为0-10分
             score = (similarity + 1) / 2 * 10  # 从[-1,1]映射到[0,10]
-            
-            return {
+            results.append({
                 "score": round(float(score), 2),
                 "method": "semantic_similarity",
                 "details": f"语义相似度: {similarity:.4f}",
                 "similarity": float(similarity)
-            }
-        except Exception as e:
-            return {
-                "score": 0.0,
-                "method": "semantic_similarity",
-                "details": f"计算失败: {e}"
-            }
+            })
+        return results
+    
+    def precompute_semantic_similarity(self, pairs: List[Tuple[str, str]]):
+        """
+        预先批量计算一组 (译文, 参考译文) 的语义相似度，之后 evaluate_semantic_similarity 直接返回结果
+        
+        Args:
+            pairs: (译文, 参考译文) 列表
+        """
+        if not self.embedding_model:
+            return
+        pending = list(dict.fromkeys(pair for pair in pairs if pair not in self._semantic_results))
+        if not pending:
+            return
+        results = self.evaluate_semantic_similarity_batch([t for t, _ in pending], [r for _, r in pending])
+        for pair, result in zip(pending, results):
+            # 计算失败的结果不缓存，逐条评估时会重试
+            if "similarity" in result:
+                self._semantic_results[pair] = result
     
     def evaluate_edit_distance(
         self,
@@ -407,33 +470,34 @@ class TranslationEvaluator:
         Returns:
             包含编辑距离分数的字典
         """
-        # 使用字符级编辑距离
-        def levenshtein_distance(s1, s2):
-            if len(s1) < len(s2):
-                return levenshtein_distance(s2, s1)
-            if len(s2) == 0:
-                return len(s1)
-            
-            previous_row = range(len(s2) + 1)
-            for i, c1 in enumerate(s1):
-                current_row = [i + 1]
-                for j, c2 in enumerate(s2):
-                    insertions = previous_row[j + 1] + 1
-                    deletions = current_row[j] + 1
-                    substitutions = previous_row[j] + (c1 != c2)
-                    current_row.append(min(insertions, deletions, substitutions))
-                previous_row = current_row
-            
-            return previous_row[-1]
-        
-        distance = levenshtein_distance(translation, reference)
-        max_len = max(len(translation), len(reference))
+        # 使用字符级编辑距离（rapidfuzz 内核，结果与逐格动态规划一致）
+        distance, max_len, similarity = edit_similarity(translation, reference)
+        return self._edit_distance_result(distance, max_len, similarity)
+    
+    def evaluate_edit_distance_batch(
+        self,
+        translations: List[str],
+        references: List[str],
+        workers: int = 1
+    ) -> List[Dict]:
+        """
+        批量评估编辑距离（有监督），结果与逐条调用 evaluate_edit_distance 相同
         
-        if max_len == 0:
-            similarity = 1.0
-        else:
-            similarity = 1 - (distance / max_len)
+        Args:
+            translations: 译文列表
+            references: 与译文一一对应的参考译文列表
+            workers: 并行线程数，-1 为全部 CPU
         
+        Returns:
+            每对译文的编辑距离结果字典列表
+        """
+        return [
+            self._edit_distance_result(distance, max_len, similarity)
+            for distance, max_len, similarity in batch_edit_similarity(translations, references, workers=workers)
+        ]
+    
+    @staticmethod
+    def _edit_distance_result(distance: int, max_len: int, similarity: float) -> Dict:
         # 转换为0-10分
         score = similarity * 10
         
@@ -534,6 +598,8 @@ class TranslationEvaluator:
                 bleu_result = self.evaluate_bleu_score(translation, reference)
                 results["metrics"]["bleu"] = bleu_result
                 supervised_scores.append(bleu_result["score"])
+                # 语料级 BLEU/chrF 的充分统计量，由调用方对所有 chunk 求和
+                results["ngram_stats"] = self.stats_cache.get(translation, reference)
             
             # 2. 语义相似度/MQM（如果启用）
             if 'mqm' in self.enabled_metrics: